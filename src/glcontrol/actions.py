@@ -0,0 +1,396 @@
+import copy
+import heapq
+import itertools
+import json
+import logging
+import os
+import shlex
+import string
+import subprocess
+import threading
+import time
+import urllib.request
+
+from pydantic import BaseModel
+
+from glcontrol.metrics import REGISTRY
+from glcontrol.resultcache import result_confidence, result_label
+
+logger = logging.getLogger(__name__)
+
+ACTION_RUNS = REGISTRY.counter("glcontrol_action_runs_total", "Actions run, by outcome", ("action", "outcome"))
+ACTION_SECONDS = REGISTRY.histogram("glcontrol_action_seconds", "Time taken to run an action", ("action",))
+ACTION_COALESCED = REGISTRY.counter(
+    "glcontrol_action_coalesced_total", "Action events merged into a later run", ("action",)
+)
+
+
+class ActionEvent(BaseModel):
+    """What an action is told when it fires."""
+
+    action: str
+    detector: str
+    processor: str | None = None
+    label: str | None
+    previous_label: str | None = None
+    confidence: float | None = None
+    query_id: str | None = None
+    timestamp: float
+    coalesced: int = 0
+
+
+class ActionRegistry(type):
+    """
+    Metaclass for automatically registering subclasses of Action.
+    """
+
+    registry: dict[str, type["Action"]] = {}
+
+    def __new__(cls, name: str, bases: tuple, attrs: dict):
+        new_class = super().__new__(cls, name, bases, attrs)
+        if bases:
+            try:
+                registry_name = attrs["registry_name"]
+                assert len(registry_name) > 0
+            except (KeyError, AssertionError) as e:
+                raise ValueError("Action classes must have registry_name") from e
+            if registry_name in cls.registry:
+                raise ValueError(f"Duplicate registration for '{registry_name}'")
+            cls.registry[registry_name] = new_class
+        return new_class
+
+
+class Action(metaclass=ActionRegistry):
+    """
+    Base class for the sinks which actions send their events to.
+    """
+
+    registry_name: str = "abstract-base"
+    # Whether it reads the cameras' frame buffers, which only exist in the process running the cameras
+    needs_frame_buffers: bool = False
+
+    def __init__(self, name: str, options: dict):
+        self.name = name
+        self.options = options
+        self.timeout = float(options.get("timeout", 10))
+
+    def __repr__(self):
+        return f"Action<type={self.registry_name}, name='{self.name}'>"
+
+    @staticmethod
+    def from_type(type_name: str, name: str, options: dict) -> "Action":
+        """
+        Factory method to instantiate subclasses based on their registration name.
+        """
+        return Action.type_for(type_name)(name, options)
+
+    @staticmethod
+    def type_for(type_name: str) -> type["Action"]:
+        """
+        The subclass registered under `type_name`.
+        """
+        if type_name not in ActionRegistry.registry:
+            raise ValueError(f"Unknown action type '{type_name}'")
+        return ActionRegistry.registry[type_name]
+
+    def run(self, event: ActionEvent):
+        raise NotImplementedError("Action subclasses must implement run")
+
+    def close(self, timeout: float | None = None) -> bool:
+        """Finish off anything the action is still doing in the background.
+        Returns False if that took longer than `timeout` seconds."""
+        return True
+
+
+class _EventFormatter(string.Formatter):
+    """Fills in event fields, writing ones which aren't known (like the confidence of a
+    human-reviewed answer) as "unknown" instead of failing on their format spec."""
+
+    def format_field(self, value, format_spec: str) -> str:
+        if value is None:
+            return "unknown"
+        return super().format_field(value, format_spec)
+
+
+class WebhookAction(Action):
+    """POSTs the event as JSON to `url`.  If `body` is given, its string values are filled
+    in from the event (e.g. `{text: "Door is {label}"}`) and sent instead.
+    """
+
+    formatter = _EventFormatter()
+
+    registry_name = "webhook"
+
+    def __init__(self, name: str, options: dict):
+        super().__init__(name, options)
+        if "url" not in options:
+            raise ValueError(f"Webhook action {name} needs a url")
+        self.url = options["url"]
+        self.method = options.get("method", "POST")
+        self.headers = {"Content-Type": "application/json", **options.get("headers", {})}
+        self.body: dict | None = options.get("body")
+
+    def payload(self, event: ActionEvent) -> bytes:
+        if self.body is None:
+            return event.model_dump_json().encode()
+        fields = event.model_dump()
+        body = {
+            key: self.formatter.format(value, **fields) if isinstance(value, str) else value
+            for key, value in self.body.items()
+        }
+        return json.dumps(body).encode()
+
+    def run(self, event: ActionEvent):
+        request = urllib.request.Request(self.url, data=self.payload(event), headers=self.headers, method=self.method)
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            response.read()
+
+
+class ShellAction(Action):
+    """Runs `command`, with the event as JSON on stdin and as GLCONTROL_* environment variables."""
+
+    registry_name = "shell"
+
+    def __init__(self, name: str, options: dict):
+        super().__init__(name, options)
+        if "command" not in options:
+            raise ValueError(f"Shell action {name} needs a command")
+        command = options["command"]
+        self.args = shlex.split(command) if isinstance(command, str) else list(command)
+
+    def run(self, event: ActionEvent):
+        env = dict(os.environ)
+        for key, value in event.model_dump().items():
+            env[f"GLCONTROL_{key.upper()}"] = "" if value is None else str(value)
+        subprocess.run(self.args, input=event.model_dump_json().encode(), env=env, timeout=self.timeout, check=True)
+
+
+class FileAction(Action):
+    """Appends the event as a line of JSON to `path`."""
+
+    registry_name = "file"
+
+    def __init__(self, name: str, options: dict):
+        super().__init__(name, options)
+        if "path" not in options:
+            raise ValueError(f"File action {name} needs a path")
+        self.path = os.path.expanduser(options["path"])
+        self._lock = threading.Lock()
+
+    def run(self, event: ActionEvent):
+        line = event.model_dump_json() + "\n"
+        with self._lock, open(self.path, "a") as f:
+            f.write(line)
+
+
+class ActionTrigger:
+    """Decides which of a detector's answers should fire an action.
+
+    An answer only counts once the same label has been seen for `debounce` seconds,
+    so a single flickering answer doesn't fire anything.  Then the action fires when
+    the label changes to `label` (or changes at all, if `label` is None).  With
+    `on_change` off, every counted answer with a matching label fires.
+    """
+
+    def __init__(
+        self,
+        label: str | None = None,
+        on_change: bool = True,
+        debounce: float = 0.0,
+        min_confidence: float | None = None,
+    ):
+        self.label = label
+        self.on_change = on_change
+        self.debounce = debounce
+        self.min_confidence = min_confidence
+        self.state: str | None = None
+        self._candidate: str | None = None
+        self._candidate_since = 0.0
+
+    def observe(self, label: str | None, confidence: float | None, now: float) -> tuple[bool, str | None]:
+        """Returns (fire, previous_label) for a new answer."""
+        if label is None:
+            return False, self.state
+        if self.min_confidence is not None and (confidence is None or confidence < self.min_confidence):
+            return False, self.state
+        if label != self._candidate:
+            self._candidate = label
+            self._candidate_since = now
+        if now - self._candidate_since < self.debounce:
+            return False, self.state
+        previous = self.state
+        changed = label != previous
+        self.state = label
+        if self.label is not None and label != self.label:
+            return False, previous
+        return changed or not self.on_change, previous
+
+
+class ActionRT:
+    """An action hooked up to a detector, which turns its answers into events.
+
+    Answers from each processor (and each camera or region of a processor with several)
+    are tracked separately, so one camera's answer isn't taken as a change from another's.
+    Each gets its own copy of `trigger`, starting from whatever state it had then.
+    """
+
+    def __init__(self, name: str, detector_name: str, action: Action, trigger: ActionTrigger, min_interval: float = 0):
+        self.name = name
+        self.detector_name = detector_name
+        self.action = action
+        self.trigger = trigger
+        self.min_interval = min_interval
+        self.last_run: float | None = None
+        self._triggers: dict[str | None, ActionTrigger] = {}
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return f"ActionRT('{self.name}', {self.action.registry_name}, on={self.detector_name})"
+
+    def observe(self, result, now: float | None = None, processor: str | None = None) -> ActionEvent | None:
+        """Returns an event if this answer, from `processor`, should fire the action."""
+        now = time.time() if now is None else now
+        label = result_label(result)
+        confidence = result_confidence(result)
+        with self._lock:
+            trigger = self._triggers.get(processor)
+            if trigger is None:
+                trigger = self._triggers[processor] = copy.copy(self.trigger)
+            fire, previous = trigger.observe(label, confidence, now)
+        if not fire:
+            return None
+        return ActionEvent(
+            action=self.name,
+            detector=self.detector_name,
+            processor=processor,
+            label=label,
+            previous_label=previous,
+            confidence=confidence,
+            query_id=getattr(result, "id", None),
+            timestamp=now,
+        )
+
+
+class ActionPool:
+    """Runs actions on a pool of worker threads, so a slow sink never holds up a control loop.
+
+    Each action has at most one event waiting and one run in progress.  An event which
+    arrives while another is still waiting replaces it (the newest one wins, with a
+    count of how many it stands for), and runs are spaced at least `min_interval` apart.
+    `submit` never blocks.
+    """
+
+    def __init__(self, workers: int = 4):
+        self.workers = workers
+        self._pending: dict[str, tuple[ActionRT, ActionEvent]] = {}
+        self._running: set[str] = set()
+        self._heap: list[tuple[float, int, str]] = []
+        self._counter = itertools.count()
+        self._cond = threading.Condition()
+        self._threads: list[threading.Thread] = []
+        self._stopping = False
+        self._flushing = False
+        self.runs = 0
+        self.failures = 0
+        self.coalesced = 0
+
+    def __repr__(self):
+        return f"ActionPool(workers={self.workers}, pending={len(self._pending)})"
+
+    def _ensure_started(self):
+        if self._threads:
+            return
+        self._threads = [
+            threading.Thread(target=self._work, name=f"action-worker-{n}", daemon=True) for n in range(self.workers)
+        ]
+        for t in self._threads:
+            t.start()
+
+    def submit(self, action_rt: ActionRT, event: ActionEvent):
+        """Queue the event for the action, merging it with any event already waiting."""
+        with self._cond:
+            if self._stopping:
+                return
+            self._ensure_started()
+            waiting = self._pending.get(action_rt.name)
+            if waiting:
+                event.coalesced = waiting[1].coalesced + 1
+                self.coalesced += 1
+                ACTION_COALESCED.labels(action_rt.name).inc()
+                self._pending[action_rt.name] = (action_rt, event)
+                return
+            self._pending[action_rt.name] = (action_rt, event)
+            if action_rt.name not in self._running:
+                self._schedule(action_rt)
+
+    def _schedule(self, action_rt: ActionRT):
+        """Called with the lock held, when the action has an event waiting and isn't running."""
+        not_before = time.monotonic()
+        if action_rt.last_run is not None and not self._flushing:
+            not_before = max(not_before, action_rt.last_run + action_rt.min_interval)
+        heapq.heappush(self._heap, (not_before, next(self._counter), action_rt.name))
+        self._cond.notify()
+
+    def _next(self) -> tuple[ActionRT, ActionEvent] | None:
+        """Wait for the next event which is due.  Returns None when stopping."""
+        with self._cond:
+            while not self._stopping:
+                if not self._heap:
+                    self._cond.wait()
+                    continue
+                not_before, _, name = self._heap[0]
+                now = time.monotonic()
+                if not_before > now:
+                    self._cond.wait(not_before - now)
+                    continue
+                heapq.heappop(self._heap)
+                if name not in self._pending:
+                    continue
+                action_rt, event = self._pending.pop(name)
+                self._running.add(name)
+                action_rt.last_run = now
+                return action_rt, event
+        return None
+
+    def _work(self):
+        while True:
+            item = self._next()
+            if item is None:
+                return
+            action_rt, event = item
+            self._run(action_rt, event)
+            with self._cond:
+                self._running.discard(action_rt.name)
+                if action_rt.name in self._pending:
+                    self._schedule(action_rt)
+                self._cond.notify_all()
+
+    def _run(self, action_rt: ActionRT, event: ActionEvent):
+        logger.info("Running action %s: %s -> %s", action_rt.name, event.previous_label, event.label)
+        try:
+            with ACTION_SECONDS.labels(action_rt.name).time():
+                action_rt.action.run(event)
+        except Exception:
+            self.failures += 1
+            ACTION_RUNS.labels(action_rt.name, "error").inc()
+            logger.exception(f"Action {action_rt.name} failed")
+        else:
+            self.runs += 1
+            ACTION_RUNS.labels(action_rt.name, "ok").inc()
+
+    def shutdown(self, timeout: float | None = None) -> bool:
+        """Run any events still waiting, without waiting out their min_interval, then stop
+        the workers.  Returns False if that took longer than `timeout` seconds.
+        """
+        with self._cond:
+            self._flushing = True
+            self._heap = [(0.0, next(self._counter), name) for name in self._pending if name not in self._running]
+            heapq.heapify(self._heap)
+            self._cond.notify_all()
+            clean = self._cond.wait_for(lambda: not self._pending and not self._running, timeout)
+            self._stopping = True
+            self._cond.notify_all()
+            left = sorted(self._pending.keys() | self._running)
+        if not clean:
+            logger.warning(f"Gave up waiting for actions to finish: {left}")
+        return clean
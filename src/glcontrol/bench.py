@@ -0,0 +1,359 @@
+import logging
+import math
+import random
+import resource
+import threading
+import time
+from types import SimpleNamespace
+
+import numpy as np
+from pydantic import BaseModel
+
+from glcontrol.cfgtools.base import SpecCache, load_yaml, substitute_variables
+from glcontrol.cfgtools.specs import CameraSpec, GLControlManifest, GLControlSpec
+from glcontrol.lifecycle import LoopCancelledError
+from glcontrol.runner import SpecRunner
+
+logger = logging.getLogger(__name__)
+
+
+class SyntheticFrameGrabber:
+    """Stands in for a framegrab FrameGrabber, generating frames instead of reading a camera.
+    A bright bar sweeps across a noisy background, moving on by one step every 1/fps seconds.
+    Grabbing more often than that returns the same frame again, like a real stream would.
+    """
+
+    def __init__(self, width: int = 1280, height: int = 720, fps: float = 10.0, seed: int = 0):
+        self.width = width
+        self.height = height
+        self.fps = fps
+        rng = np.random.default_rng(seed)
+        self._background = rng.integers(0, 64, size=(height, width, 3), dtype=np.uint8)
+        self._start = time.monotonic()
+        self._index = -1
+        self._frame: np.ndarray | None = None
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return f"SyntheticFrameGrabber({self.width}x{self.height} @ {self.fps} fps)"
+
+    def grab(self) -> np.ndarray:
+        index = int((time.monotonic() - self._start) * self.fps)
+        with self._lock:
+            if index != self._index:
+                frame = self._background.copy()
+                bar = (index * 16) % self.width
+                frame[:, bar : bar + 16] = 255
+                self._frame, self._index = frame, index
+            return self._frame
+
+    def release(self):
+        pass
+
+
+class SyntheticGrabberFactory:
+    """Makes a SyntheticFrameGrabber for any camera spec.  Unlike a lambda, it can be
+    pickled, so it works as the grabber_factory for worker processes."""
+
+    def __init__(self, width: int = 1280, height: int = 720, fps: float = 10.0):
+        self.width = width
+        self.height = height
+        self.fps = fps
+
+    def __call__(self, camera: CameraSpec) -> SyntheticFrameGrabber:
+        return SyntheticFrameGrabber(width=self.width, height=self.height, fps=self.fps)
+
+
+class StubApiError(RuntimeError):
+    """The failure which StubGroundlight injects."""
+
+
+class StubGroundlight:
+    """In-process stand-in for the Groundlight client.
+
+    Each request sleeps for a log-normally distributed latency with median `latency`
+    seconds, then fails with probability `failure_rate`, or answers YES with probability
+    `yes_rate` and NO otherwise.
+    """
+
+    def __init__(
+        self,
+        latency: float = 0.1,
+        latency_sigma: float = 0.3,
+        failure_rate: float = 0.0,
+        yes_rate: float = 0.1,
+        confidence: float = 0.95,
+        seed: int | None = None,
+    ):
+        self.latency = latency
+        self.latency_sigma = latency_sigma
+        self.failure_rate = failure_rate
+        self.yes_rate = yes_rate
+        self.confidence = confidence
+        self.requests = 0
+        self.failures = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return f"StubGroundlight(latency={self.latency}, failure_rate={self.failure_rate})"
+
+    def get_or_create_detector(self, name: str, query: str, confidence_threshold: float | None = None):
+        return SimpleNamespace(id=f"det_{name}", name=name, query=query, confidence_threshold=confidence_threshold)
+
+    def _respond(self, detector, image):
+        with self._lock:
+            self.requests += 1
+            delay = self.latency * math.exp(self._rng.gauss(0, self.latency_sigma)) if self.latency else 0.0
+            fail = self._rng.random() < self.failure_rate
+            label = "YES" if self._rng.random() < self.yes_rate else "NO"
+            if fail:
+                self.failures += 1
+            query_id = f"iq_{self.requests}"
+        time.sleep(delay)
+        detector_id = getattr(detector, "id", detector)
+        if fail:
+            raise StubApiError(f"Injected failure for {detector_id}")
+        return SimpleNamespace(
+            id=query_id,
+            detector_id=detector_id,
+            result=SimpleNamespace(label=label, confidence=self.confidence),
+        )
+
+    def ask_ml(self, detector, image):
+        return self._respond(detector, image)
+
+    def ask_confident(self, detector, image, confidence_threshold: float | None = None, wait: float | None = None):
+        return self._respond(detector, image)
+
+
+def bench_spec(
+    processors: int,
+    cameras: int | None = None,
+    period: float = 1.0,
+    scheduler_workers: int = 64,
+    dispatcher_workers: int = 32,
+) -> GLControlSpec:
+    """A config with `processors` simple camera detectors, spread over `cameras` cameras."""
+    cameras = cameras or processors
+    return GLControlSpec(
+        cameras=[
+            {"name": f"bench-cam-{n}", "input_type": "generic_usb", "id": {"serial_number": str(n)}}
+            for n in range(cameras)
+        ],
+        detectors=[{"name": f"bench-det-{n}", "query": f"Bench question {n}?"} for n in range(processors)],
+        processors=[
+            {
+                "name": f"bench-proc-{n}",
+                "type": "simple-camera-detector",
+                "inputs": [{"camera": f"bench-cam-{n % cameras}"}],
+                "options": {"detector": f"bench-det-{n}", "poll": {"every": period}},
+            }
+            for n in range(processors)
+        ],
+        runtime={
+            "scheduler": {"workers": scheduler_workers},
+            "dispatcher": {"workers": dispatcher_workers, "queue_size": max(100, processors * 2)},
+        },
+    )
+
+
+class BenchResult(BaseModel):
+    processors: int
+    duration: float
+    polls: int
+    frames_sent: int
+    errors: int
+    polls_per_sec: float
+    frames_per_sec: float
+    cpu_pct: float
+    rss_mb: float
+    p50_ms: float
+    p99_ms: float
+
+
+def percentile(samples: list[float], pct: float) -> float:
+    """The pct'th percentile of the samples, by nearest rank."""
+    if not samples:
+        return float("nan")
+    ordered = sorted(samples)
+    rank = max(0, math.ceil(pct / 100 * len(ordered)) - 1)
+    return ordered[rank]
+
+
+def rss_mb() -> float:
+    """Current resident set size of this process, in MB."""
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return pages * resource.getpagesize() / 1e6
+    except OSError:
+        # Peak rather than current, but the best we can do portably.  KB on Linux, bytes on macOS.
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1e3
+
+
+def run_scenario(
+    processors: int,
+    duration: float = 10.0,
+    period: float = 1.0,
+    cameras: int | None = None,
+    sdk: StubGroundlight | None = None,
+    width: int = 1280,
+    height: int = 720,
+    fps: float = 10.0,
+    scheduler_workers: int = 64,
+    dispatcher_workers: int = 32,
+) -> BenchResult:
+    """Run `processors` control loops against synthetic cameras and a stub backend for
+    `duration` seconds, and measure how the runner keeps up."""
+    sdk = sdk or StubGroundlight()
+    spec = bench_spec(processors, cameras, period, scheduler_workers, dispatcher_workers)
+    runner = SpecRunner(spec, sdk=sdk, grabber_factory=SyntheticGrabberFactory(width=width, height=height, fps=fps))
+    latencies: list[float] = []
+    errors = [0]
+
+    def timed(run_once):
+        def wrapper():
+            start = time.perf_counter()
+            try:
+                run_once()
+            except LoopCancelledError:
+                raise
+            except Exception:
+                errors[0] += 1
+                raise
+            latencies.append(time.perf_counter() - start)
+
+        return wrapper
+
+    for loop in runner.control_loops:
+        loop.run_once = timed(loop.run_once)
+
+    requests_before = sdk.requests
+    cpu_start, wall_start = time.process_time(), time.monotonic()
+    runner.run_all()
+    time.sleep(duration)
+    runner.stop_all()
+    cpu_used, wall = time.process_time() - cpu_start, time.monotonic() - wall_start
+    frames_sent = sdk.requests - requests_before
+    return BenchResult(
+        processors=processors,
+        duration=wall,
+        polls=len(latencies) + errors[0],
+        frames_sent=frames_sent,
+        errors=errors[0],
+        polls_per_sec=(len(latencies) + errors[0]) / wall,
+        frames_per_sec=frames_sent / wall,
+        cpu_pct=100 * cpu_used / wall,
+        rss_mb=rss_mb(),
+        p50_ms=1000 * percentile(latencies, 50),
+        p99_ms=1000 * percentile(latencies, 99),
+    )
+
+
+def format_results(results: list[BenchResult]) -> str:
+    """Render benchmark results as a plain-text table."""
+    header = (
+        f"{'procs':>6} {'polls/s':>9} {'frames/s':>9} {'errors':>7} {'cpu%':>7} "
+        f"{'rss MB':>8} {'p50 ms':>8} {'p99 ms':>8}"
+    )
+    lines = [header, "-" * len(header)]
+    for r in results:
+        lines.append(
+            f"{r.processors:>6} {r.polls_per_sec:>9.1f} {r.frames_per_sec:>9.1f} {r.errors:>7} "
+            f"{r.cpu_pct:>7.1f} {r.rss_mb:>8.1f} {r.p50_ms:>8.1f} {r.p99_ms:>8.1f}"
+        )
+    return "\n".join(lines)
+
+
+def manifest_yaml(entries: int) -> str:
+    """YAML for a generated manifest with `entries` cameras, and a detector and processor for each,
+    using a variable (with a default) in every camera, like a generated fleet config would."""
+    lines = ["version: '0.0'", "glcontrol:", "  cameras:"]
+    for n in range(entries):
+        lines += [
+            f"    - name: cam-{n}",
+            "      input_type: rtsp",
+            "      id:",
+            (
+                "        rtsp_url:"
+                f" rtsp://admin:{{{{RTSP_PASSWORD:-secret}}}}@10.{n // 65536}.{n // 256 % 256}.{n % 256}/s0"
+            ),
+        ]
+    lines.append("  detectors:")
+    for n in range(entries):
+        lines += [f"    - name: det-{n}", f"      query: Is door {n} open?", "      confidence_threshold: 0.9"]
+    lines.append("  processors:")
+    for n in range(entries):
+        lines += [
+            f"    - name: proc-{n}",
+            "      type: simple-camera-detector",
+            "      inputs:",
+            f"        - camera: cam-{n}",
+            "      options:",
+            f"        detector: det-{n}",
+            "        poll: {every: 30 sec}",
+        ]
+    return "\n".join(lines) + "\n"
+
+
+class ConfigBenchResult(BaseModel):
+    entries: int
+    size_mb: float
+    substitute_ms: float
+    yaml_ms: float
+    validate_ms: float
+    cold_ms: float
+    disk_cache_ms: float
+    memory_cache_ms: float
+
+
+def run_config_bench(
+    entries: int = 10000, cache_dir: str | None = None, cache: SpecCache | None = None
+) -> ConfigBenchResult:
+    """Time each stage of loading a generated manifest with `entries` of each kind, then a
+    full load cold, from the on-disk spec cache in `cache_dir` (if given) and from memory.
+    The loads go through `cache`, which should start empty; by default, a new one in `cache_dir`."""
+    cache = SpecCache(path=cache_dir) if cache is None else cache
+    text = manifest_yaml(entries)
+
+    def timed(func):
+        start = time.perf_counter()
+        result = func()
+        return result, 1000 * (time.perf_counter() - start)
+
+    substituted, substitute_ms = timed(lambda: substitute_variables(text, "bench"))
+    raw, yaml_ms = timed(lambda: load_yaml(substituted))
+    _, validate_ms = timed(lambda: GLControlManifest(**raw))
+
+    _, cold_ms = timed(lambda: GLControlManifest.from_yaml(text, "bench", cache=cache))
+    disk_cache_ms = float("nan")
+    if cache_dir:
+        cache.clear()
+        _, disk_cache_ms = timed(lambda: GLControlManifest.from_yaml(text, "bench", cache=cache))
+    _, memory_cache_ms = timed(lambda: GLControlManifest.from_yaml(text, "bench", cache=cache))
+    return ConfigBenchResult(
+        entries=entries,
+        size_mb=len(text) / 1e6,
+        substitute_ms=substitute_ms,
+        yaml_ms=yaml_ms,
+        validate_ms=validate_ms,
+        cold_ms=cold_ms,
+        disk_cache_ms=disk_cache_ms,
+        memory_cache_ms=memory_cache_ms,
+    )
+
+
+def format_config_results(results: list[ConfigBenchResult]) -> str:
+    """Render config loading benchmark results as a plain-text table."""
+    header = (
+        f"{'entries':>8} {'MB':>6} {'subst ms':>9} {'yaml ms':>9} {'valid ms':>9} "
+        f"{'cold ms':>9} {'disk ms':>9} {'mem ms':>8}"
+    )
+    lines = [header, "-" * len(header)]
+    for r in results:
+        lines.append(
+            f"{r.entries:>8} {r.size_mb:>6.1f} {r.substitute_ms:>9.1f} {r.yaml_ms:>9.1f} {r.validate_ms:>9.1f} "
+            f"{r.cold_ms:>9.1f} {r.disk_cache_ms:>9.1f} {r.memory_cache_ms:>8.3f}"
+        )
+    return "\n".join(lines)
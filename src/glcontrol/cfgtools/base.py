@@ -1,10 +1,25 @@
+import hashlib
 import json
+import logging
 import os
 import re
+import threading
+from collections import OrderedDict
 
 import yaml
 from pydantic_core import ValidationError
 
+logger = logging.getLogger(__name__)
+
+# libyaml's loader is many times faster than the pure-Python one, when PyYAML was built with it
+YamlLoader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+# Beyond this many, validation errors are summarised rather than listed
+MAX_REPORTED_ERRORS = 50
+
+# Matches {{VARNAME}} and {{VARNAME:-default}}
+_VARIABLE = re.compile(r"\{\{(\w+)(?::-(.*?))?\}\}")
+
 
 class ParsingError(ValueError):
     """Raised when the config file is invalid."""
@@ -12,9 +27,8 @@ class ParsingError(ValueError):
 
 def pydantic_err_to_friendly(err: ValidationError) -> list[str]:
     """Converts a pydantic ValidationError into a user-friendly message."""
-    err_data = json.loads(err.json())
     msgs = []
-    for err_datum in err_data:
+    for err_datum in err.errors(include_url=False, include_input=False):
         dotloc = ".".join([str(item) for item in err_datum["loc"]])
         if err_datum["type"] == "extra_forbidden":
             msg = f"Unexpected field `{err_datum['loc'][-1]}` at {dotloc}"
@@ -24,44 +38,182 @@ def pydantic_err_to_friendly(err: ValidationError) -> list[str]:
     return msgs
 
 
+def summarize_errors(msgs: list[str], limit: int = MAX_REPORTED_ERRORS) -> str:
+    """All the error messages, one per line, or the first `limit` of them and a count of the rest."""
+    if len(msgs) <= 1:
+        return "".join(msgs)
+    shown = msgs[:limit]
+    if len(msgs) > limit:
+        shown.append(f"... and {len(msgs) - limit} more")
+    return f"{len(msgs)} errors\n" + "\n".join(shown)
+
+
 def substitute_variables(raw_str: str, filename: str = "(unknown)") -> str:
-    """Substitutes environment variables in the raw string.
+    """Substitutes environment variables in the raw string, in a single pass.
     Looks for patterns like {{VARNAME}} and replaces it with the value of the environment variable VARNAME.
+    {{VARNAME:-default}} falls back to `default` when VARNAME isn't set.
+    Every missing variable is reported at once, rather than just the first.
     """
-    pattern = re.compile(r"\{\{(\w+)\}\}")  # Matches {{VARNAME}}
-    result = raw_str
-    matches = pattern.findall(raw_str)
-    for match in matches:
-        var_name = match
-        if var_name in os.environ:
-            print(f"Found environment variable: {var_name}, replacing it.")
-            env_value = os.environ[var_name]
-            result = result.replace("{{" + var_name + "}}", env_value)
-        else:
-            raise ValueError(f"Missing environment variable {var_name} which is referenced in {filename}")
+    if "{{" not in raw_str:
+        return raw_str
+    missing = []
+
+    def replace(match: re.Match) -> str:
+        var_name, default = match.group(1), match.group(2)
+        value = os.environ.get(var_name, default)
+        if value is None:
+            missing.append(var_name)
+            return match.group(0)
+        return value
+
+    result, count = _VARIABLE.subn(replace, raw_str)
+    if missing:
+        names = ", ".join(dict.fromkeys(missing))
+        raise ParsingError(f"No environment variable found for: {names}, which is referenced in {filename}")
+    logger.debug(f"Substituted {count} variables in {filename}")
     return result
 
 
+def load_yaml(raw_str: str):
+    """Parses YAML text.  Generated configs are often JSON (which is also YAML), and
+    those go through the JSON parser, which is far faster than any YAML one."""
+    if raw_str.lstrip().startswith("{"):
+        try:
+            return json.loads(raw_str)
+        except ValueError:
+            pass  # YAML flow style, rather than JSON
+    return yaml.load(raw_str, Loader=YamlLoader)
+
+
+class SpecCache:
+    """Validated specs, keyed by a hash of their source after variable substitution, so
+    loading an unchanged config again skips parsing and validation.
+
+    The last `max_entries` specs are kept in memory.  If `path` (or the GLCONTROL_SPEC_CACHE
+    environment variable) names a directory, specs are also kept there as JSON, to speed
+    up the next start.  Those are validated again on loading, which is still much faster
+    than parsing the YAML, and anything which no longer validates is just a miss.
+    Cached specs are shared, so treat them as read-only.  `hits`, `disk_hits` and `misses`
+    count how each lookup went.
+    """
+
+    def __init__(self, max_entries: int = 8, path: str | None = None):
+        self.max_entries = max_entries
+        self.path = path
+        self._entries: OrderedDict[str, object] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def __repr__(self):
+        return f"SpecCache({len(self._entries)}/{self.max_entries}, path={self._dir()!r})"
+
+    @staticmethod
+    def key(cls: type, text: str) -> str:
+        return hashlib.sha256(f"{cls.__module__}.{cls.__qualname__}\0{text}".encode()).hexdigest()
+
+    def _dir(self) -> str | None:
+        path = self.path or os.environ.get("GLCONTROL_SPEC_CACHE")
+        return os.path.expanduser(path) if path else None
+
+    def get(self, cls: type, key: str):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+        spec = self._load(cls, key)
+        with self._lock:
+            if spec is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+        self._remember(key, spec)
+        return spec
+
+    def _load(self, cls: type, key: str):
+        cache_dir = self._dir()
+        if not cache_dir:
+            return None
+        try:
+            with open(os.path.join(cache_dir, f"{key}.json"), "rb") as f:
+                return cls.model_validate_json(f.read())
+        except (OSError, ValueError):
+            return None
+
+    def put(self, key: str, spec):
+        self._remember(key, spec)
+        cache_dir = self._dir()
+        if not cache_dir:
+            return
+        data = spec.model_dump_json(warnings=False)
+        # Only keep it if it comes back the same, which YAML-only types (like dates) wouldn't
+        if type(spec).model_validate_json(data) != spec:
+            return
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            tmp_path = os.path.join(cache_dir, f"{key}.json.tmp{os.getpid()}")
+            with open(tmp_path, "w") as f:
+                f.write(data)
+            os.replace(tmp_path, os.path.join(cache_dir, f"{key}.json"))
+        except OSError as e:
+            logger.warning(f"Couldn't write to the spec cache in {cache_dir}: {e}")
+
+    def _remember(self, key: str, spec):
+        with self._lock:
+            self._entries[key] = spec
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+SPEC_CACHE = SpecCache()
+
+
 class Parseable:
     """A mixin for pydantic BaseModel that adds a parse method from a file."""
 
     @classmethod
-    def from_file(cls, config_path: str) -> "Parseable":
+    def from_file(cls, config_path: str, cache: SpecCache | None = None) -> "Parseable":
         """Loads the config file which is YAML and returns the parsed config."""
         with open(config_path, "r") as f:
             # first load it as a string
             raw_str = f.read()
+        return cls.from_yaml(raw_str, config_path, cache=cache)
 
+    @classmethod
+    def from_yaml(cls, raw_str: str, source: str = "(unknown)", cache: SpecCache | None = None) -> "Parseable":
+        """Parses YAML text into the config, reusing the result from last time if the text hasn't changed.
+        Results are kept in `cache`, or the shared SPEC_CACHE if that isn't given."""
+        cache = SPEC_CACHE if cache is None else cache
         # Now call variable substitution
-        raw_str = substitute_variables(raw_str, config_path)
+        raw_str = substitute_variables(raw_str, source)
+
+        key = SpecCache.key(cls, raw_str)
+        cached = cache.get(cls, key)
+        if cached is not None:
+            logger.debug(f"Using cached spec for {source}")
+            return cached
 
         # Now parse it into a dict
-        raw = yaml.safe_load(raw_str)
+        try:
+            raw = load_yaml(raw_str)
+        except yaml.YAMLError as e:
+            raise ParsingError(f"Failed to parse {source}: {e}") from e
+        if not isinstance(raw, dict):
+            raise ParsingError(f"Failed to parse {source}: expected a mapping, not {type(raw).__name__}")
 
         try:
-            return cls(**raw)
+            spec = cls(**raw)
         except ValidationError as e:
-            msg = "\n".join(pydantic_err_to_friendly(e))
-            raise ParsingError(f"Failed to parse {config_path}: {msg}") from e
+            msg = summarize_errors(pydantic_err_to_friendly(e))
+            raise ParsingError(f"Failed to parse {source}: {msg}") from e
         except Exception as e:
-            raise ParsingError(f"Failed to parse {config_path}: {e}") from e
+            raise ParsingError(f"Failed to parse {source}: {e}") from e
+        cache.put(key, spec)
+        return spec
@@ -1,15 +1,62 @@
+from collections import Counter
 from enum import Enum
 
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, model_validator
 
 from glcontrol.cfgtools.base import Parseable
 
 
+class FrameCacheSpec(BaseModel):
+    """Options for sharing frames between processors, set under `frame_cache` in a camera.
+    Frames younger than `max_age` are handed out again instead of being re-grabbed.
+    A `max_age` of 0 disables the cache.
+    """
+
+    max_age: str | float = 0
+    background: bool = False
+    interval: str | float | None = None
+
+    model_config = {"extra": "forbid"}
+
+
+class CameraWatchdogSpec(BaseModel):
+    """Options for noticing that a camera has stopped working, set under `watchdog` in a camera.
+    A grab which takes longer than `grab_timeout`, or `max_failures` bad frames in a row, make
+    the camera reconnect, retrying with backoff from `backoff` up to `max_backoff`.  Frames whose
+    pixels vary by less than `blank_std` (out of 255), or which haven't changed at all for
+    `stale_after`, count as bad.  Those two checks are off unless set.
+    """
+
+    grab_timeout: str | float | None = "10 sec"
+    max_failures: int = Field(3, ge=1)
+    backoff: str | float = "1 sec"
+    max_backoff: str | float = "5 min"
+    blank_std: float | None = None
+    stale_after: str | float | None = None
+
+    model_config = {"extra": "forbid"}
+
+
+class FrameBufferSpec(BaseModel):
+    """Options for keeping a camera's recent frames in memory, set under `buffer` in a camera,
+    so that `clip` actions can save what happened around an event.  The buffer holds as many
+    frames as fit in `memory_mb`, and is off at 0.  Frames are buffered as they're grabbed,
+    so for smooth clips, use a background frame cache with a short interval.
+    """
+
+    memory_mb: float = Field(0, ge=0)
+
+    model_config = {"extra": "forbid"}
+
+
 class CameraSpec(BaseModel, Parseable):
     name: str
     input_type: str
     id: dict
     options: dict = Field(default_factory=dict)
+    frame_cache: FrameCacheSpec = Field(default_factory=FrameCacheSpec)
+    watchdog: CameraWatchdogSpec = Field(default_factory=CameraWatchdogSpec)
+    buffer: FrameBufferSpec = Field(default_factory=FrameBufferSpec)
 
     model_config = {"extra": "forbid"}
 
@@ -22,11 +69,160 @@ class DetectorModality(str, Enum):
     binary = "binary"
 
 
+class ResultCacheSpec(BaseModel):
+    """Options for reusing answers on near-identical frames, set under `result_cache` in a detector."""
+
+    max_entries: int = 128
+    ttl: str | float = "5 min"
+    max_distance: int = 4
+    min_confidence: float = 0.9
+
+    model_config = {"extra": "forbid"}
+
+
+class RoutingPolicy(str, Enum):
+    """Where a detector's frames are sent for an answer."""
+
+    cloud_only = "cloud-only"
+    local_only = "local-only"
+    local_first = "local-first"
+    local_escalate = "local-escalate"
+
+
+class RoutingSpec(BaseModel):
+    """Where a detector's frames go, set under `routing` in a detector.  The local policies
+    need `runtime.edge.endpoint`.  With `local-escalate`, answers less confident than
+    `escalate_below` (by default the detector's confidence_threshold, or 0.9) go on to the cloud.
+    """
+
+    policy: RoutingPolicy = RoutingPolicy.cloud_only
+    escalate_below: float | None = Field(None, ge=0, le=1)
+
+    model_config = {"extra": "forbid"}
+
+
 class DetectorSpec(BaseModel, Parseable):
     name: str
     modality: DetectorModality = DetectorModality.binary
     query: str
     confidence_threshold: float | None = None
+    max_concurrency: int | None = None
+    result_cache: ResultCacheSpec | None = None
+    routing: RoutingSpec = Field(default_factory=RoutingSpec)
+
+    model_config = {"extra": "forbid"}
+
+
+class MotionDetectionSpec(BaseModel):
+    """Options for motion gating, set under `motion-detection` in a processor's options."""
+
+    enabled: bool = False
+    val_threshold: float = 25
+    pct_threshold: float = 1.0
+    max_skip: str | float = "10 min"
+    max_dim: int = 160
+
+    model_config = {"extra": "forbid"}
+
+
+class RoiSpec(BaseModel):
+    """A region of interest within a frame, as fractions of its width and height."""
+
+    left: float = Field(0, ge=0, le=1)
+    top: float = Field(0, ge=0, le=1)
+    right: float = Field(1, ge=0, le=1)
+    bottom: float = Field(1, ge=0, le=1)
+
+    model_config = {"extra": "forbid"}
+
+    @model_validator(mode="after")
+    def check_nonempty(self) -> "RoiSpec":
+        if self.left >= self.right or self.top >= self.bottom:
+            raise ValueError(f"Empty region of interest: {self.as_tuple()}")
+        return self
+
+    def as_tuple(self) -> tuple[float, float, float, float]:
+        return (self.left, self.top, self.right, self.bottom)
+
+
+class RegionSpec(BaseModel):
+    """A named part of a camera's frame, with its own detector, for a `roi-detector` processor."""
+
+    name: str
+    detector: str
+    roi: RoiSpec
+
+    model_config = {"extra": "forbid"}
+
+
+class RuleSpec(BaseModel):
+    """A boolean rule over detectors' answers about one frame, for a `composite-detector` processor.
+    Exactly one of `detector`, `all`, `any` or `not` is set.  A `detector` term is true when
+    that detector answers `label`, and `cost` optionally fixes its seconds per answer rather
+    than measuring it.
+    """
+
+    detector: str | None = None
+    label: str = "YES"
+    cost: float | None = Field(None, gt=0)
+    all: list["RuleSpec"] | None = Field(None, min_length=1)
+    any: list["RuleSpec"] | None = Field(None, min_length=1)
+    not_: "RuleSpec | None" = Field(None, alias="not")
+
+    model_config = {"extra": "forbid", "populate_by_name": True}
+
+    @model_validator(mode="after")
+    def check_one_kind(self) -> "RuleSpec":
+        terms = {"detector": self.detector, "all": self.all, "any": self.any, "not": self.not_}
+        kinds = [kind for kind, term in terms.items() if term is not None]
+        if len(kinds) != 1:
+            raise ValueError(f"A rule needs exactly one of detector, all, any or not, not {kinds or 'none'}")
+        if self.detector is None and ("label" in self.model_fields_set or self.cost is not None):
+            raise ValueError("Only a detector term can have a label or cost")
+        return self
+
+
+class PreprocessSpec(BaseModel):
+    """Options for shrinking images before upload, set under `preprocess` in a processor's options."""
+
+    roi: RoiSpec | None = None
+    max_dim: int | None = Field(None, gt=0)
+    jpeg_quality: int = Field(90, ge=1, le=100)
+
+    model_config = {"extra": "forbid"}
+
+
+class OverrunPolicy(str, Enum):
+    """What to do when a processor is still busy at its next scheduled poll."""
+
+    skip = "skip"
+    catch_up = "catch-up"
+
+
+class AdaptivePollSpec(BaseModel):
+    """Options for polling faster when things are changing, and slower when they aren't.
+    The processor polls every `fastest` after a change or an answer below `min_confidence`,
+    then backs off by a factor of `backoff` each time the answer stays the same, up to `slowest`.
+    """
+
+    fastest: str | float = "5 sec"
+    slowest: str | float = "5 min"
+    backoff: float = 2.0
+    min_confidence: float = 0.9
+
+    model_config = {"extra": "forbid"}
+
+
+class PollSpec(BaseModel):
+    """Options for how often a processor runs, set under `poll` in a processor's options.
+    Time values can be numbers of seconds or strings like "30 sec".
+    """
+
+    every: str | float = 60
+    jitter: str | float = 0
+    offset: str | float | None = None
+    overrun: OverrunPolicy = OverrunPolicy.skip
+    adaptive: AdaptivePollSpec | None = None
 
     model_config = {"extra": "forbid"}
 
@@ -40,15 +236,225 @@ class ControlLoopSpec(BaseModel, Parseable):
     options: dict = Field(default_factory=dict)
 
 
+class TriggerSpec(BaseModel):
+    """When an action fires, based on its detector's answers.
+    With `label` set, the action fires when the answer changes to that label; otherwise on any change.
+    The new answer has to hold for `debounce` before it counts, and answers below
+    `min_confidence` are ignored.  If `on_change` is off, every matching answer fires.
+    """
+
+    label: str | None = None
+    on_change: bool = True
+    debounce: str | float = 0
+    min_confidence: float | None = None
+
+    model_config = {"extra": "forbid"}
+
+
+class ActionSpec(BaseModel, Parseable):
+    """Something to do when a detector's answer changes, like calling a webhook.
+    The action fires at most once per `min_interval`; anything in between is coalesced
+    into the next run.
+    """
+
+    name: str
+    type: str
+    detector: str
+    trigger: TriggerSpec = Field(default_factory=TriggerSpec)
+    min_interval: str | float = 0
+    options: dict = Field(default_factory=dict)
+
+    model_config = {"extra": "forbid"}
+
+
+class OverflowPolicy(str, Enum):
+    """What the dispatcher does when its queue is full."""
+
+    block = "block"
+    drop_oldest = "drop-oldest"
+
+
+class DispatcherSpec(BaseModel):
+    """Options for the shared inference dispatcher which sends images to Groundlight."""
+
+    workers: int = 8
+    queue_size: int = 100
+    detector_limit: int = 4
+    wait: float | None = None
+    max_queue_time: str | float | None = None
+    overflow: OverflowPolicy = OverflowPolicy.drop_oldest
+
+    model_config = {"extra": "forbid"}
+
+
+class SchedulerSpec(BaseModel):
+    """Options for the shared scheduler which runs all the processors."""
+
+    workers: int = 16
+    stagger: bool = True
+    shutdown_timeout: str | float = "10 sec"
+
+    model_config = {"extra": "forbid"}
+
+
+class ActionPoolSpec(BaseModel):
+    """Options for the worker pool which runs the actions."""
+
+    workers: int = 4
+    shutdown_timeout: str | float = "5 sec"
+
+    model_config = {"extra": "forbid"}
+
+
+class HistorySpec(BaseModel):
+    """Options for keeping a local history of every detector result.
+    History is off unless `path` is set.  Results older than `retention` are deleted every
+    `prune_interval`, and the file is compacted to give the space back at most every
+    `compact_interval` (never, if it's None).
+    """
+
+    path: str | None = None
+    flush_interval: str | float = "1 sec"
+    batch_size: int = 1000
+    retention: str | float | None = "30 days"
+    prune_interval: str | float = "1 hour"
+    compact_interval: str | float | None = "1 day"
+
+    model_config = {"extra": "forbid"}
+
+
+class BuffersSpec(BaseModel):
+    """Limits on the camera frame buffers.  If the cameras' `buffer.memory_mb` add up to more
+    than `max_memory_mb`, each buffer is shrunk in proportion."""
+
+    max_memory_mb: float = Field(1024, gt=0)
+
+    model_config = {"extra": "forbid"}
+
+
+class MultiprocessSpec(BaseModel):
+    """Options for spreading the processors over several worker processes.
+    With `processes` at 0 or 1, everything runs in one process.
+    """
+
+    processes: int = 0
+    max_frame_bytes: int = 3840 * 2160 * 3
+    health_interval: str | float = "1 sec"
+    restart_delay: str | float = "5 sec"
+
+    model_config = {"extra": "forbid"}
+
+
+class CircuitBreakerSpec(BaseModel):
+    """When to stop calling Groundlight for a while.  A breaker opens after that many
+    failures in a row, either overall (`failures`) or for one detector (`detector_failures`),
+    and lets a trial call through after `reset_after`.
+    """
+
+    failures: int = 10
+    detector_failures: int = 5
+    reset_after: str | float = "30 sec"
+
+    model_config = {"extra": "forbid"}
+
+
+class SpoolSpec(BaseModel):
+    """Options for keeping frames which couldn't be sent, and sending them once Groundlight is back.
+    The spool is off unless `max_frames` is set.  With a `path`, frames are kept on disk.
+    """
+
+    max_frames: int = 0
+    path: str | None = None
+    replay_interval: str | float = "5 sec"
+
+    model_config = {"extra": "forbid"}
+
+
+class ClientSpec(BaseModel):
+    """Options for the connection to Groundlight.
+    Transient failures are retried up to `retries` times, backing off from `backoff` up to
+    `max_backoff`.  With `rate_limit` set, requests are paced to that many per second, in
+    bursts of up to `burst`.  `pool_size` is how many connections to keep open, which
+    defaults to enough for the dispatcher's workers.
+    """
+
+    retries: int = 3
+    backoff: str | float = 0.5
+    max_backoff: str | float = "10 sec"
+    rate_limit: float | None = Field(None, gt=0)
+    burst: int = Field(10, ge=1)
+    pool_size: int | None = None
+    breaker: CircuitBreakerSpec = Field(default_factory=CircuitBreakerSpec)
+    spool: SpoolSpec = Field(default_factory=SpoolSpec)
+
+    model_config = {"extra": "forbid"}
+
+
+class EdgeSpec(BaseModel):
+    """The local Groundlight Edge Endpoint which detectors can send frames to instead of the cloud.
+    Failed requests aren't retried, since the cloud is the fallback, but after `failures` in
+    a row the edge endpoint is skipped for `reset_after`.
+    """
+
+    endpoint: str | None = None
+    failures: int = 3
+    reset_after: str | float = "30 sec"
+
+    model_config = {"extra": "forbid"}
+
+
+class StartupSpec(BaseModel):
+    """Options for opening the cameras and resolving the detectors at startup.
+    `detector_cache` is the path of a file to remember detector IDs in between runs.
+    """
+
+    max_parallel: int = 8
+    camera_timeout: str | float = "30 sec"
+    detector_timeout: str | float = "30 sec"
+    detector_cache: str | None = None
+
+    model_config = {"extra": "forbid"}
+
+
+class RuntimeSpec(BaseModel):
+    """Settings for the runtime itself, rather than any one camera, detector or processor."""
+
+    dispatcher: DispatcherSpec = Field(default_factory=DispatcherSpec)
+    scheduler: SchedulerSpec = Field(default_factory=SchedulerSpec)
+    startup: StartupSpec = Field(default_factory=StartupSpec)
+    actions: ActionPoolSpec = Field(default_factory=ActionPoolSpec)
+    history: HistorySpec = Field(default_factory=HistorySpec)
+    multiprocess: MultiprocessSpec = Field(default_factory=MultiprocessSpec)
+    client: ClientSpec = Field(default_factory=ClientSpec)
+    edge: EdgeSpec = Field(default_factory=EdgeSpec)
+    buffers: BuffersSpec = Field(default_factory=BuffersSpec)
+
+    model_config = {"extra": "forbid"}
+
+
 class GLControlSpec(BaseModel, Parseable):
     """Pydantic model for the main config files."""
 
     cameras: list[CameraSpec] = []
     detectors: list[DetectorSpec] = []
     processors: list[ControlLoopSpec] = []
+    actions: list[ActionSpec] = []
+    runtime: RuntimeSpec = Field(default_factory=RuntimeSpec)
 
     model_config = {"extra": "forbid"}
 
+    @model_validator(mode="after")
+    def check_unique_names(self) -> "GLControlSpec":
+        problems = []
+        for kind in ("cameras", "detectors", "processors", "actions"):
+            counts = Counter(item.name for item in getattr(self, kind))
+            duplicates = [name for name, count in counts.items() if count > 1]
+            if duplicates:
+                problems.append(f"Duplicate {kind} names: {', '.join(duplicates)}")
+        if problems:
+            raise ValueError("; ".join(problems))
+        return self
+
 
 class GLControlManifest(BaseModel, Parseable):
     version: str = "0.0"
@@ -1,20 +1,41 @@
 #!/usr/bin/env -S poetry run python
 import logging
 import os
+import signal
+import tempfile
 import time
 
 import typer
 from framegrab.cli.clitools import preview_image
 
+from glcontrol.bench import StubGroundlight, format_config_results, format_results, run_config_bench, run_scenario
+from glcontrol.cfgtools.base import ParsingError
 from glcontrol.cfgtools.specs import GLControlManifest
-from glcontrol.runner import SpecRunner
+from glcontrol.logs import setup_logging
+from glcontrol.metrics import MetricsServer
+from glcontrol.multiproc import MultiprocessRunner
+from glcontrol.replay import format_replay_result, run_replay
+from glcontrol.runner import SpecRunner, parse_time_str, sdk_connect
 
 logger = logging.getLogger(__name__)
-logging.basicConfig(level=logging.DEBUG)  # TODO: make this configurable
 
 app = typer.Typer(context_settings={"help_option_names": ["-h", "--help"]})
 
 
+@app.callback()
+def configure_logging(
+    log_level: str = typer.Option("INFO", envvar="GLCONTROL_LOG_LEVEL", help="DEBUG, INFO, WARNING or ERROR."),
+    log_format: str = typer.Option(
+        "text", envvar="GLCONTROL_LOG_FORMAT", help="`text`, or `json` for one object per line."
+    ),
+    log_rate_limit: int = typer.Option(
+        10, help="Most messages about any one thing from a line of code per minute.  0 means no limit."
+    ),
+):
+    """Control loops for Groundlight."""
+    setup_logging(level=log_level, format=log_format, rate_limit=log_rate_limit)
+
+
 def set_default_config_path(config_path: str) -> str:
     """If the config file is not specified, look for a default.
     If no default available, raise an error."""
@@ -44,6 +65,36 @@ def display_config_if_updated(config_path: str, last_updated: float) -> float:
     return os.path.getmtime(config_path)
 
 
+def reload_config_if_updated(runner: SpecRunner | MultiprocessRunner, config_path: str, last_updated: float) -> float:
+    """If the config file has changed, applies the new config to the running SpecRunner.
+    An invalid config is logged and ignored, leaving the old one running, and so is
+    anything else which goes wrong applying it.  A file which can't be read (say because
+    an editor is part way through saving it) is tried again next time."""
+    try:
+        mtime = os.path.getmtime(config_path)
+    except OSError:
+        return last_updated
+    if mtime == last_updated:
+        return last_updated
+    logger.info(f"Config file {config_path} changed, reloading")
+    try:
+        manifest = GLControlManifest.from_file(config_path)
+    except OSError as e:
+        logger.warning(f"Couldn't read {config_path}, will try again: {e}")
+        return last_updated
+    except ParsingError as e:
+        logger.error(f"Not applying invalid config: {e}")
+        return mtime
+    try:
+        changes = runner.apply(manifest.glcontrol)
+    except Exception:
+        # Keep running whatever did get applied, rather than taking everything down
+        logger.exception(f"Failed to apply the changes to {config_path}")
+        return mtime
+    logger.info(f"Applied config changes: {changes}")
+    return mtime
+
+
 @app.command()
 def watch_config(config: str = "", poll_delay: float = 1.0):
     """Watches the runtime config file and prints it to the console when it changes.
@@ -57,16 +108,35 @@ def watch_config(config: str = "", poll_delay: float = 1.0):
 
 
 @app.command()
-def run(config: str = typer.Argument(...)):
+def run(
+    config: str = typer.Argument(...),
+    metrics_port: int = typer.Option(0, help="Serve Prometheus metrics and /health on this port.  0 means don't."),
+    metrics_host: str = typer.Option("127.0.0.1", help="Address to serve metrics on."),
+    watch: bool = typer.Option(True, help="Apply changes to the config file without restarting."),
+    watch_interval: float = typer.Option(2.0, help="Seconds between checks for config changes."),
+    processes: int = typer.Option(0, help="Worker processes to spread the processors over.  0 means use the config."),
+):
     """Starts the Groundlight runtime.
     Parses the config YAML and launches all the control loops."""
     config_path = set_default_config_path(config)
     logger.debug(f"Loading config manifest from {config_path}")
+    # Before loading, so that changes made while everything starts up are applied afterwards
+    last_updated = os.path.getmtime(config_path)
     manifest = GLControlManifest.from_file(config_path)
     logger.debug(f"Loaded manifest: {manifest}")
-    runner = SpecRunner(manifest.glcontrol)
+    processes = processes or manifest.glcontrol.runtime.multiprocess.processes
+    runner = MultiprocessRunner(manifest.glcontrol, processes) if processes > 1 else SpecRunner(manifest.glcontrol)
+    if metrics_port:
+        MetricsServer(metrics_port, host=metrics_host, health_fn=runner.health).start()
     logger.debug(f"Launching SpecRunner: {runner}")
+    # Treat SIGTERM (from docker, systemd, etc) like Ctrl-C, so we shut down cleanly
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
     runner.run_all()
+    try:
+        while not runner.wait(timeout=watch_interval if watch else None):
+            last_updated = reload_config_if_updated(runner, config_path, last_updated)
+    except KeyboardInterrupt:
+        runner.stop_all()
 
 
 @app.command()
@@ -94,6 +164,89 @@ def preview_cameras(config_path: str = typer.Argument(...)):
         preview_image(frame, title=f"camera {n}", output_type="imgcat")
 
 
+@app.command()
+def bench(
+    processors: str = typer.Option("1,10,100,500", help="Comma-separated numbers of processors to try."),
+    duration: float = typer.Option(10.0, help="Seconds to run each scenario for."),
+    period: float = typer.Option(1.0, help="Seconds between polls for each processor."),
+    cameras: int = typer.Option(0, help="Number of cameras to share between processors.  0 means one each."),
+    latency: float = typer.Option(0.1, help="Median latency of the stub Groundlight backend, in seconds."),
+    latency_sigma: float = typer.Option(0.3, help="Spread of the log-normal backend latency."),
+    failure_rate: float = typer.Option(0.0, help="Fraction of backend requests which fail."),
+    resolution: str = typer.Option("1280x720", help="Size of the synthetic camera frames."),
+    fps: float = typer.Option(10.0, help="Frame rate of the synthetic cameras."),
+    workers: int = typer.Option(64, help="Scheduler worker threads."),
+):
+    """Benchmarks the runtime against synthetic cameras and a stub Groundlight backend."""
+    width, height = (int(n) for n in resolution.lower().split("x"))
+    results = []
+    for count in (int(n) for n in processors.split(",")):
+        logger.info(f"Benchmarking {count} processors for {duration} seconds")
+        sdk = StubGroundlight(latency=latency, latency_sigma=latency_sigma, failure_rate=failure_rate)
+        results.append(
+            run_scenario(
+                count,
+                duration=duration,
+                period=period,
+                cameras=cameras or None,
+                sdk=sdk,
+                width=width,
+                height=height,
+                fps=fps,
+                scheduler_workers=workers,
+            )
+        )
+    print(format_results(results))
+
+
+@app.command()
+def bench_config(
+    entries: str = typer.Option("1000,10000", help="Comma-separated numbers of cameras, detectors and processors."),
+):
+    """Benchmarks loading and validating large generated config files."""
+    with tempfile.TemporaryDirectory() as cache_dir:
+        results = [run_config_bench(int(n), cache_dir=cache_dir) for n in entries.split(",")]
+    print(format_config_results(results))
+
+
+@app.command()
+def replay(
+    config: str = typer.Argument(...),
+    source: list[str] = typer.Option(
+        ...,
+        help=(
+            "Recording to use for a camera, as NAME=PATH, or just PATH for every camera.  "
+            "A video file, or a directory of images."
+        ),
+    ),
+    fps: float = typer.Option(1.0, help="Frame rate of directories of images."),
+    duration: str = typer.Option("", help="How much footage to replay, e.g. `2 hours`.  Defaults to all of it."),
+    output: str = typer.Option("replay-results.jsonl", help="File to log the results to, as JSON lines."),
+    live: bool = typer.Option(False, help="Ask the real Groundlight service, instead of a stub which costs nothing."),
+):
+    """Runs the config against recorded footage instead of cameras, in virtual time,
+    so hours of footage replay in minutes."""
+    manifest = GLControlManifest.from_file(config)
+    sources = {}
+    for entry in source:
+        name, sep, path = entry.partition("=")
+        if sep:
+            sources[name] = path
+        else:
+            sources[None] = entry
+    with open(output, "w") as f:
+        result = run_replay(
+            manifest.glcontrol,
+            sources,
+            sdk=sdk_connect() if live else None,
+            fps=fps,
+            duration=parse_time_str(duration) if duration else None,
+            output=f,
+        )
+    print(format_replay_result(result))
+    print(f"Results are in {output}")
+
+
 @app.command()
 def restart():
     """Restarts the Groundlight runtime.
@@ -0,0 +1,493 @@
+import importlib.metadata
+import logging
+import os
+import random
+import threading
+import time
+import types
+from collections import deque
+from collections.abc import Callable
+from enum import Enum
+from http import HTTPStatus
+
+import numpy as np
+from groundlight import Groundlight
+
+from glcontrol.metrics import REGISTRY
+from glcontrol.preprocess import FramePreprocessor
+
+logger = logging.getLogger(__name__)
+
+CLIENT_RETRIES = REGISTRY.counter(
+    "glcontrol_client_retries_total", "Groundlight API calls retried after a transient failure", ("method",)
+)
+CLIENT_REJECTED = REGISTRY.counter(
+    "glcontrol_client_rejected_total", "Groundlight API calls refused because a circuit breaker was open", ("scope",)
+)
+BREAKER_TRIPS = REGISTRY.counter("glcontrol_breaker_trips_total", "Times a circuit breaker opened", ("scope",))
+RATE_LIMIT_SECONDS = REGISTRY.histogram(
+    "glcontrol_rate_limit_seconds", "Time API calls waited for the rate limiter", buckets=(0, 0.01, 0.1, 1, 10)
+)
+SPOOLED_FRAMES = REGISTRY.counter("glcontrol_spooled_frames_total", "Frames spooled while Groundlight was unreachable")
+SPOOL_DROPPED = REGISTRY.counter("glcontrol_spool_dropped_total", "Spooled frames dropped to make room for newer ones")
+REPLAYED_FRAMES = REGISTRY.counter("glcontrol_replayed_frames_total", "Spooled frames sent once Groundlight was back")
+
+# tune_sdk swaps out internals of the generated SDK client, which it has only been checked against in these versions
+TUNABLE_SDK_VERSIONS = ((0, 17),)
+
+# HTTP statuses which mean "try again later", rather than "this request is wrong"
+TRANSIENT_STATUSES = frozenset({408, 425, 429, 500, 502, 503, 504})
+
+
+class ClientError(RuntimeError):
+    """Raised by the ResilientClient instead of calling Groundlight."""
+
+
+class CircuitOpenError(ClientError):
+    """Raised when a circuit breaker is open, so the call wasn't even attempted."""
+
+
+def is_transient(exc: BaseException) -> bool:
+    """Whether a failed API call is worth retrying: timeouts, dropped connections,
+    throttling and server errors are; anything else (like a bad request) isn't."""
+    status = getattr(exc, "status", None)
+    if isinstance(status, int):
+        return status in TRANSIENT_STATUSES
+    if exc.__cause__ is not None:
+        # Like the SDK's own "Maximum retries reached", which wraps the last HTTP error
+        return is_transient(exc.__cause__)
+    if isinstance(exc, ConnectionError | TimeoutError):
+        return True
+    # urllib3's errors (and urllib's URLError) are all about the connection, not the request
+    module = type(exc).__module__
+    return module.startswith("urllib3") or isinstance(exc, OSError)
+
+
+def is_not_found(exc: BaseException) -> bool:
+    """Whether a failed API call was a 404, say for a detector which has since been deleted."""
+    if getattr(exc, "status", None) == HTTPStatus.NOT_FOUND:
+        return True
+    return exc.__cause__ is not None and is_not_found(exc.__cause__)
+
+
+def retry_after(exc: BaseException) -> float | None:
+    """The delay a 429 or 503 response asked for in its Retry-After header, if any."""
+    headers = getattr(exc, "headers", None)
+    if not headers:
+        return None
+    value = dict(headers).get("Retry-After") or dict(headers).get("retry-after")
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class BreakerState(str, Enum):
+    closed = "closed"
+    open = "open"
+    half_open = "half-open"
+
+
+class CircuitBreaker:
+    """Stops calling a service which keeps failing, so callers fail fast instead of
+    piling up timeouts.
+
+    After `failures` transient failures in a row the breaker opens, and `allow` refuses
+    everything for `reset_after` seconds.  Then it lets one probe call through
+    (half-open): if that works the breaker closes again, and if not it stays open for
+    another `reset_after`.
+    """
+
+    def __init__(
+        self, name: str, failures: int = 5, reset_after: float = 30.0, clock: Callable[[], float] = time.monotonic
+    ):
+        self.name = name
+        self.failures = failures
+        self.reset_after = reset_after
+        self._clock = clock
+        self._state = BreakerState.closed
+        self._consecutive = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return f"CircuitBreaker('{self.name}', {self.state.value})"
+
+    @property
+    def state(self) -> BreakerState:
+        with self._lock:
+            if self._state == BreakerState.open and self._clock() - self._opened_at >= self.reset_after:
+                return BreakerState.half_open
+            return self._state
+
+    def allow(self) -> bool:
+        """Whether a call may go ahead.  A True from a half-open breaker claims the probe,
+        so the caller has to report back with `record_success` or `record_failure`."""
+        with self._lock:
+            if self._state == BreakerState.closed:
+                return True
+            if self._state == BreakerState.open:
+                if self._clock() - self._opened_at < self.reset_after:
+                    return False
+                self._state = BreakerState.half_open
+                self._probing = False
+            if self._probing:
+                return False
+            self._probing = True
+            return True
+
+    def release(self):
+        """Give back a probe claimed with `allow` without having made the call."""
+        with self._lock:
+            self._probing = False
+
+    def record_success(self):
+        with self._lock:
+            if self._state != BreakerState.closed:
+                logger.info(f"Circuit breaker {self.name} closed again")
+            self._state = BreakerState.closed
+            self._consecutive = 0
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self._consecutive += 1
+            self._probing = False
+            if self._state == BreakerState.half_open or (
+                self._state == BreakerState.closed and self._consecutive >= self.failures
+            ):
+                if self._state == BreakerState.closed:
+                    logger.warning(f"Circuit breaker {self.name} opened after {self._consecutive} failures")
+                    BREAKER_TRIPS.labels(self.name).inc()
+                self._state = BreakerState.open
+                self._opened_at = self._clock()
+
+
+class TokenBucket:
+    """Paces calls to an average of `rate` per second, allowing bursts of up to `burst`."""
+
+    def __init__(self, rate: float, burst: int = 1, clock: Callable[[], float] = time.monotonic):
+        self.rate = rate
+        self.burst = burst
+        self._clock = clock
+        self._tokens = float(burst)
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return f"TokenBucket(rate={self.rate}, burst={self.burst})"
+
+    def reserve(self) -> float:
+        """Take a token, and return how many seconds to wait before using it."""
+        with self._lock:
+            now = self._clock()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            # Callers queue up by going into debt, so each one knows its own wait straight away
+            return max(0.0, -self._tokens / self.rate)
+
+    def acquire(self):
+        """Block until a call is allowed."""
+        delay = self.reserve()
+        RATE_LIMIT_SECONDS.labels().observe(delay)
+        if delay:
+            time.sleep(delay)
+
+
+class SpooledFrame:
+    __slots__ = ("detector", "image", "ts", "path")
+
+    def __init__(self, detector: str, image: bytes, ts: float, path: str | None = None):
+        self.detector = detector
+        self.image = image
+        self.ts = ts
+        self.path = path
+
+
+class FrameSpool:
+    """Holds on to frames which couldn't be sent, oldest first, up to `max_frames`.
+    With a `path`, they're kept as JPEG files in that directory, so they survive a restart.
+    When it's full, the oldest frame is dropped to make room.
+    """
+
+    def __init__(self, max_frames: int = 100, path: str | None = None):
+        self.max_frames = max_frames
+        self.path = os.path.expanduser(path) if path else None
+        self._frames: deque[SpooledFrame] = deque()
+        self._lock = threading.Lock()
+        self._encoder = FramePreprocessor()
+        self._last_ns = 0
+        if self.path:
+            os.makedirs(self.path, exist_ok=True)
+            self._load()
+
+    def __repr__(self):
+        return f"FrameSpool({len(self)}/{self.max_frames}, path={self.path!r})"
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._frames)
+
+    def _load(self):
+        for filename in sorted(os.listdir(self.path)):
+            stem, ext = os.path.splitext(filename)
+            ts, _, detector = stem.partition("_")
+            if ext != ".jpg" or not detector or not ts.isdigit():
+                continue
+            with open(os.path.join(self.path, filename), "rb") as f:
+                image = f.read()
+            self._frames.append(SpooledFrame(detector, image, int(ts) / 1e9, os.path.join(self.path, filename)))
+        if self._frames:
+            logger.info(f"Found {len(self._frames)} spooled frames in {self.path}")
+        while len(self._frames) > self.max_frames:
+            self._discard(self._frames.popleft())
+
+    def put(self, detector: str, image) -> bool:
+        """Spool a frame (JPEG bytes or an image array) for the detector.
+        Returns False for an image it doesn't know how to keep."""
+        if isinstance(image, np.ndarray):
+            image = self._encoder.encode(image)
+        elif not isinstance(image, bytes):
+            return False
+        ts = time.time()
+        with self._lock:
+            path = None
+            if self.path:
+                # Named by time, kept unique so that sorting the names gives the spooling order
+                self._last_ns = max(time.time_ns(), self._last_ns + 1)
+                path = os.path.join(self.path, f"{self._last_ns:020d}_{detector}.jpg")
+                with open(path, "wb") as f:
+                    f.write(image)
+            self._frames.append(SpooledFrame(detector, image, ts, path))
+            SPOOLED_FRAMES.labels().inc()
+            while len(self._frames) > self.max_frames:
+                self._discard(self._frames.popleft())
+                SPOOL_DROPPED.labels().inc()
+        return True
+
+    def peek(self) -> SpooledFrame | None:
+        """The oldest spooled frame, left in place until it's `remove`d."""
+        with self._lock:
+            return self._frames[0] if self._frames else None
+
+    def remove(self, frame: SpooledFrame):
+        with self._lock:
+            try:
+                self._frames.remove(frame)
+            except ValueError:
+                return  # already dropped to make room
+            self._discard(frame)
+
+    @staticmethod
+    def _discard(frame: SpooledFrame):
+        if frame.path:
+            try:
+                os.remove(frame.path)
+            except FileNotFoundError:
+                pass
+
+
+class ResilientClient:
+    """Wraps the Groundlight client to cope with an unreliable network or service.
+
+    Calls which fail with a transient error (see `is_transient`) are retried up to
+    `retries` times, with exponential backoff and full jitter, so a fleet of processors
+    doesn't retry in lockstep.  A global circuit breaker, and one per detector, stop
+    calls for a while when failures keep coming, so a dead service costs a fast
+    CircuitOpenError instead of a timeout per frame.  With a `rate_limit`, calls are paced to
+    that many per second to stay under the account's quota.
+
+    With a `spool`, frames which couldn't be sent are kept, and a background thread
+    replays them with `ask_async` once the service is back, so they still show up in
+    Groundlight for review.  Their answers come too late to act on, so they aren't used.
+
+    Anything else is passed straight through to the wrapped client.
+    """
+
+    def __init__(
+        self,
+        sdk: Groundlight,
+        retries: int = 3,
+        backoff: float = 0.5,
+        max_backoff: float = 10.0,
+        rate_limit: float | None = None,
+        burst: int = 10,
+        failures: int = 10,
+        detector_failures: int = 5,
+        reset_after: float = 30.0,
+        spool: FrameSpool | None = None,
+        replay_interval: float = 5.0,
+    ):
+        self.sdk = sdk
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.rate_limiter = TokenBucket(rate_limit, burst) if rate_limit else None
+        self.breaker = CircuitBreaker("global", failures=failures, reset_after=reset_after)
+        self.detector_failures = detector_failures
+        self.reset_after = reset_after
+        self.spool = spool
+        self.replay_interval = replay_interval
+        self._breakers: dict[str, CircuitBreaker] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._replayer = None
+        if spool is not None:
+            self._replayer = threading.Thread(target=self._replay_loop, name="spool-replay", daemon=True)
+            self._replayer.start()
+
+    def __repr__(self):
+        return f"ResilientClient({self.sdk!r})"
+
+    def __getattr__(self, name: str):
+        # Only called for attributes we don't have, like `endpoint` or the other SDK methods
+        return getattr(self.sdk, name)
+
+    def detector_breaker(self, detector_id: str) -> CircuitBreaker:
+        with self._lock:
+            if detector_id not in self._breakers:
+                self._breakers[detector_id] = CircuitBreaker(
+                    detector_id, failures=self.detector_failures, reset_after=self.reset_after
+                )
+            return self._breakers[detector_id]
+
+    def call(self, func: Callable, *args, detector_id: str | None = None, retries: int | None = None, **kwargs):
+        """Call `func` with retries, circuit breaking and rate limiting."""
+        breakers = [self.breaker] if detector_id is None else [self.breaker, self.detector_breaker(detector_id)]
+        retries = self.retries if retries is None else retries
+        method = getattr(func, "__name__", "call")
+        attempt = 0
+        while True:
+            self._claim(breakers)
+            if self.rate_limiter:
+                self.rate_limiter.acquire()
+            try:
+                result = func(*args, **kwargs)
+            except Exception as e:
+                if not is_transient(e):
+                    # The service answered, even if the answer was no
+                    for breaker in breakers:
+                        breaker.record_success()
+                    raise
+                for breaker in breakers:
+                    breaker.record_failure()
+                if attempt >= retries:
+                    raise
+                delay = random.uniform(0, min(self.max_backoff, self.backoff * 2**attempt))
+                delay = max(delay, min(self.max_backoff, retry_after(e) or 0))
+                attempt += 1
+                CLIENT_RETRIES.labels(method).inc()
+                logger.debug("Retrying %s in %.2fs (attempt %d/%d) after %r", method, delay, attempt, retries, e)
+                time.sleep(delay)
+                continue
+            for breaker in breakers:
+                breaker.record_success()
+            return result
+
+    @staticmethod
+    def _claim(breakers: list[CircuitBreaker]):
+        claimed = []
+        for breaker in breakers:
+            if not breaker.allow():
+                # Hand back any probe we took, so the other breaker isn't left waiting on it
+                for other in claimed:
+                    other.release()
+                CLIENT_REJECTED.labels(breaker.name if breaker.name == "global" else "detector").inc()
+                raise CircuitOpenError(f"Circuit breaker {breaker.name} is open")
+            claimed.append(breaker)
+
+    def _ask(self, func: Callable, detector, image, **kwargs):
+        detector_id = getattr(detector, "id", detector)
+        try:
+            return self.call(func, detector, image, detector_id=detector_id, **kwargs)
+        except Exception as e:
+            if self.spool is not None and (isinstance(e, CircuitOpenError) or is_transient(e)):
+                self.spool.put(detector_id, image)
+            raise
+
+    def ask_ml(self, detector, image, **kwargs):
+        return self._ask(self.sdk.ask_ml, detector, image, **kwargs)
+
+    def ask_confident(self, detector, image, **kwargs):
+        return self._ask(self.sdk.ask_confident, detector, image, **kwargs)
+
+    def get_or_create_detector(self, *args, **kwargs):
+        return self.call(self.sdk.get_or_create_detector, *args, **kwargs)
+
+    def _replay_loop(self):
+        while not self._stop.wait(self.replay_interval):
+            self.replay()
+
+    def replay(self) -> int:
+        """Send spooled frames, oldest first, until the spool is empty or a call fails.
+        Returns how many were sent."""
+        if self.spool is None:
+            return 0
+        send = getattr(self.sdk, "ask_async", None) or self.sdk.ask_ml
+        sent = 0
+        while not self._stop.is_set():
+            frame = self.spool.peek()
+            if frame is None:
+                break
+            try:
+                self.call(send, frame.detector, frame.image, detector_id=frame.detector, retries=0)
+            except Exception as e:
+                if isinstance(e, CircuitOpenError) or is_transient(e):
+                    break  # still down; try again next time
+                logger.warning(f"Dropping a spooled frame for {frame.detector}, which Groundlight refused: {e!r}")
+            else:
+                sent += 1
+                REPLAYED_FRAMES.labels().inc()
+            self.spool.remove(frame)
+        if sent:
+            logger.info(f"Replayed {sent} spooled frames")
+        return sent
+
+    def close(self, timeout: float | None = None):
+        """Stop replaying the spool.  Frames still in it stay there, on disk if it has a path."""
+        self._stop.set()
+        if self._replayer is not None:
+            self._replayer.join(timeout)
+
+
+def tune_sdk(sdk: Groundlight, pool_size: int) -> bool:
+    """Rebuild the SDK's urllib3 pool to keep up to `pool_size` connections alive, so
+    concurrent requests reuse connections instead of opening (and TLS-handshaking) new ones.
+
+    Also turns off the retries which urllib3 and the SDK do by themselves, since the
+    ResilientClient does its own: otherwise each of its attempts would be several, and a
+    breaker would take far longer to notice an outage.  Returns False for a client
+    without an HTTP pool to tune, like a stub.
+
+    The Groundlight client builds its pool when it's made, with no way to configure it
+    first, so this replaces private parts of the SDK.  With an SDK version it hasn't been
+    checked against, it leaves the client alone and returns False.
+    """
+    api_client = getattr(sdk, "api_client", None)
+    configuration = getattr(sdk, "configuration", None)
+    if api_client is None or configuration is None:
+        return False
+    version = _sdk_version()
+    call_api = getattr(type(api_client).call_api, "__wrapped__", None)
+    if version not in TUNABLE_SDK_VERSIONS or call_api is None or not hasattr(api_client, "rest_client"):
+        logger.warning(
+            f"Not tuning the connection pool of groundlight {'.'.join(map(str, version)) or '(unknown version)'}, "
+            "so it will use the SDK's own pool size and retries"
+        )
+        return False
+    from groundlight_openapi_client import rest
+
+    configuration.connection_pool_maxsize = pool_size
+    configuration.retries = 0
+    api_client.rest_client = rest.RESTClientObject(configuration)
+    api_client.call_api = types.MethodType(call_api, api_client)
+    return True
+
+
+def _sdk_version() -> tuple[int, ...]:
+    try:
+        return tuple(int(part) for part in importlib.metadata.version("groundlight").split(".")[:2])
+    except (importlib.metadata.PackageNotFoundError, ValueError):
+        return ()
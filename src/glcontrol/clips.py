@@ -0,0 +1,331 @@
+import heapq
+import itertools
+import logging
+import os
+import threading
+import time
+from collections.abc import Callable, Iterator
+from datetime import datetime
+
+import cv2
+import numpy as np
+
+from glcontrol.actions import Action, ActionEvent
+from glcontrol.cfgtools.specs import GLControlSpec
+from glcontrol.metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+CLIPS_SAVED = REGISTRY.counter(
+    "glcontrol_clips_total", "Clips saved from the frame buffers, by outcome", ("camera", "outcome")
+)
+
+MB = 1024 * 1024
+
+
+class FrameBuffer:
+    """A camera's most recent frames, kept in memory so that clips from around an event can be saved.
+    This class also stores a registry of all the buffers by camera name.
+
+    Frames are copied into a ring of slots, preallocated when the first frame arrives to
+    fill `max_bytes`, so the buffer never grows however long it runs.  Appending is a
+    single copy under the lock.  Readers copy frames out one at a time, so however long
+    an export takes, it only ever holds up the grab path for one frame's copy.  A frame
+    of a different size starts the ring again.
+    """
+
+    registry: dict[str, "FrameBuffer"] = {}
+
+    def __init__(self, name: str, max_bytes: int, clock: Callable[[], float] = time.time):
+        self.name = name
+        self.max_bytes = max_bytes
+        self.clock = clock
+        self._slots: np.ndarray | None = None
+        self._times: np.ndarray | None = None
+        self._first = 0  # sequence number of the first frame in the current ring
+        self._next = 0  # sequence number the next frame will get
+        self._lock = threading.Lock()
+        self._warned = False
+        self.registry[name] = self
+
+    def __repr__(self):
+        return f"FrameBuffer('{self.name}', {len(self)}/{self.capacity} frames, {self.max_bytes / MB:.0f} MB)"
+
+    def __len__(self):
+        return min(self._next - self._first, self.capacity)
+
+    @property
+    def capacity(self) -> int:
+        return 0 if self._slots is None else len(self._slots)
+
+    def append(self, frame: np.ndarray, ts: float | None = None):
+        """Copy the frame into the buffer, overwriting the oldest one if it's full."""
+        ts = self.clock() if ts is None else ts
+        with self._lock:
+            if self._slots is None or self._slots.shape[1:] != frame.shape or self._slots.dtype != frame.dtype:
+                if not self._allocate(frame):
+                    return
+            index = self._next % len(self._slots)
+            np.copyto(self._slots[index], frame)
+            self._times[index] = ts
+            self._next += 1
+
+    def _allocate(self, frame: np.ndarray) -> bool:
+        """Make a ring for frames like this one.  Caller must hold the lock."""
+        count = self.max_bytes // max(frame.nbytes, 1)
+        if count < 1:
+            if not self._warned:
+                logger.warning(f"Frame buffer for {self.name} is too small for even one {frame.shape} frame")
+                self._warned = True
+            return False
+        self._slots = np.empty((count, *frame.shape), dtype=frame.dtype)
+        self._times = np.full(count, -np.inf)
+        self._first = self._next
+        return True
+
+    def _oldest(self) -> int:
+        """Sequence number of the oldest frame still held.  Caller must hold the lock."""
+        return max(self._first, self._next - self.capacity)
+
+    def timestamps(self, start: float = -np.inf, end: float = np.inf) -> list[tuple[int, float]]:
+        """The (sequence number, timestamp) of each buffered frame from `start` to `end`, oldest first."""
+        with self._lock:
+            if self._slots is None:
+                return []
+            seqs = range(self._oldest(), self._next)
+            times = [float(self._times[seq % len(self._slots)]) for seq in seqs]
+        return [(seq, ts) for seq, ts in zip(seqs, times) if start <= ts <= end]
+
+    def get(self, seq: int) -> np.ndarray | None:
+        """A copy of the frame with that sequence number, or None if it's been overwritten."""
+        with self._lock:
+            if self._slots is None or not self._oldest() <= seq < self._next:
+                return None
+            return self._slots[seq % len(self._slots)].copy()
+
+    def frames(self, start: float = -np.inf, end: float = np.inf) -> Iterator[tuple[float, np.ndarray]]:
+        """The (timestamp, frame) of each buffered frame from `start` to `end`, oldest first.
+        Frames are copied out as they're iterated over, skipping any overwritten in the meantime."""
+        for seq, ts in self.timestamps(start, end):
+            frame = self.get(seq)
+            if frame is not None:
+                yield ts, frame
+
+    def frame_at(self, ts: float) -> tuple[float, np.ndarray] | None:
+        """The (timestamp, frame) of the last frame grabbed at or before `ts`, if it's still buffered."""
+        for seq, frame_ts in reversed(self.timestamps(end=ts)):
+            frame = self.get(seq)
+            if frame is not None:
+                return frame_ts, frame
+        return None
+
+    def close(self):
+        """Free the frames, and take the buffer out of the registry."""
+        with self._lock:
+            self._slots = self._times = None
+            self._first = self._next
+        if self.registry.get(self.name) is self:
+            del self.registry[self.name]
+
+
+def buffer_budgets(spec: GLControlSpec) -> dict[str, int]:
+    """Bytes for each camera's frame buffer.  If the cameras ask for more than
+    `runtime.buffers.max_memory_mb` between them, each one gets shrunk in proportion."""
+    wanted = {camera.name: camera.buffer.memory_mb for camera in spec.cameras if camera.buffer.memory_mb}
+    total, limit = sum(wanted.values()), spec.runtime.buffers.max_memory_mb
+    scale = 1.0
+    if total > limit:
+        logger.warning(
+            f"Camera frame buffers want {total:.0f} MB, more than the {limit:.0f} MB limit, so shrinking them"
+        )
+        scale = limit / total
+    return {name: int(memory_mb * scale * MB) for name, memory_mb in wanted.items()}
+
+
+class _ClipRequest:
+    __slots__ = ("buffer", "start", "end", "directory")
+
+    def __init__(self, buffer: FrameBuffer, start: float, end: float, directory: str):
+        self.buffer = buffer
+        self.start = start
+        self.end = end
+        self.directory = directory
+
+
+class ClipExporter:
+    """Saves clips from frame buffers to disk, on its own thread.
+
+    A clip isn't saved until the clock passes its end, so that it includes the frames
+    from after the event.  At most `max_pending` clips wait at once; beyond that, new
+    ones are dropped rather than letting memory or the backlog grow.  A clip is either a
+    directory of JPEGs, numbered and stamped with the milliseconds from the start of the
+    clip (which `glcontrol replay` can read back), or an mp4 file.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        format: str = "jpeg",
+        jpeg_quality: int = 90,
+        max_pending: int = 16,
+        clock: Callable[[], float] = time.time,
+    ):
+        if format not in ("jpeg", "mp4"):
+            raise ValueError(f"Unknown clip format '{format}', expected jpeg or mp4")
+        self.path = os.path.expanduser(path)
+        self.format = format
+        self.jpeg_quality = jpeg_quality
+        self.max_pending = max_pending
+        self.clock = clock
+        self.saved = 0
+        self.dropped = 0
+        self._heap: list[tuple[float, int, _ClipRequest]] = []
+        self._counter = itertools.count()
+        self._cond = threading.Condition()
+        self._thread: threading.Thread | None = None
+        self._busy = False
+        self._closing = False
+
+    def __repr__(self):
+        return f"ClipExporter('{self.path}', {self.format}, pending={len(self._heap)})"
+
+    def request(self, buffer: FrameBuffer, start: float, end: float, name: str) -> bool:
+        """Ask for a clip of the frames from `start` to `end`, saved under `name`.
+        Never blocks.  Returns False if the clip was dropped."""
+        directory = os.path.join(self.path, buffer.name, name)
+        with self._cond:
+            if self._closing or len(self._heap) >= self.max_pending:
+                self.dropped += 1
+                CLIPS_SAVED.labels(buffer.name, "dropped").inc()
+                logger.warning(f"Dropping clip {directory}: too many clips waiting to be saved")
+                return False
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="clip-exporter", daemon=True)
+                self._thread.start()
+            heapq.heappush(self._heap, (end, next(self._counter), _ClipRequest(buffer, start, end, directory)))
+            self._cond.notify()
+        return True
+
+    def _next(self) -> _ClipRequest | None:
+        with self._cond:
+            while True:
+                if not self._heap:
+                    if self._closing:
+                        return None
+                    self._cond.wait()
+                    continue
+                end = self._heap[0][0]
+                # When closing, save what there is now rather than waiting for the rest
+                wait = 0 if self._closing else end - self.clock()
+                if wait > 0:
+                    self._cond.wait(wait)
+                    continue
+                self._busy = True
+                return heapq.heappop(self._heap)[2]
+
+    def _run(self):
+        while True:
+            request = self._next()
+            if request is None:
+                return
+            try:
+                count = self.save(request.buffer, request.start, request.end, request.directory)
+                outcome = "ok" if count else "empty"
+                if count:
+                    self.saved += 1
+                    logger.info(f"Saved clip of {count} frames to {request.directory}")
+            except Exception:
+                outcome = "error"
+                logger.exception(f"Failed to save clip {request.directory}")
+            CLIPS_SAVED.labels(request.buffer.name, outcome).inc()
+            with self._cond:
+                self._busy = False
+                self._cond.notify_all()
+
+    def save(self, buffer: FrameBuffer, start: float, end: float, directory: str) -> int:
+        """Write the buffer's frames from `start` to `end`, copying them out one at a time.
+        Returns how many were written."""
+        stamps = buffer.timestamps(start, end)
+        if self.format == "mp4":
+            return self._save_mp4(buffer, stamps, directory + ".mp4")
+        count = 0
+        for seq, ts in stamps:
+            frame = buffer.get(seq)
+            if frame is None:
+                continue  # overwritten since
+            if not count:
+                os.makedirs(directory, exist_ok=True)
+            cv2.imwrite(
+                os.path.join(directory, f"{count:06d}_{round((ts - start) * 1000):08d}.jpg"),
+                frame,
+                [cv2.IMWRITE_JPEG_QUALITY, self.jpeg_quality],
+            )
+            count += 1
+        return count
+
+    def _save_mp4(self, buffer: FrameBuffer, stamps: list[tuple[int, float]], filename: str) -> int:
+        span = stamps[-1][1] - stamps[0][1] if stamps else 0
+        fps = (len(stamps) - 1) / span if span > 0 else 1.0
+        writer, count = None, 0
+        for seq, _ in stamps:
+            frame = buffer.get(seq)
+            if frame is None:
+                continue
+            if writer is None:
+                os.makedirs(os.path.dirname(filename), exist_ok=True)
+                height, width = frame.shape[:2]
+                writer = cv2.VideoWriter(filename, cv2.VideoWriter_fourcc(*"mp4v"), fps, (width, height))
+            writer.write(frame)
+            count += 1
+        if writer is not None:
+            writer.release()
+        return count
+
+    def close(self, timeout: float | None = None) -> bool:
+        """Stop taking requests, and save the clips which are waiting straight away.
+        Returns False if that took longer than `timeout` seconds."""
+        with self._cond:
+            self._closing = True
+            self._cond.notify_all()
+            done = self._cond.wait_for(lambda: not self._heap and not self._busy, timeout)
+        if not done:
+            logger.warning(f"Gave up waiting for {len(self._heap)} clips to be saved")
+        return done
+
+
+class ClipAction(Action):
+    """Saves a clip from `camera`'s frame buffer, from `before` the event until `after` it,
+    under `path`.  The camera needs a buffer (`buffer.memory_mb`), in this process, so
+    clips can't be used with several processes."""
+
+    registry_name = "clip"
+    needs_frame_buffers = True
+
+    def __init__(self, name: str, options: dict):
+        # runner imports this module for FrameBuffer, so it can't be imported at the top
+        from glcontrol.runner import parse_time_str
+
+        super().__init__(name, options)
+        if "camera" not in options:
+            raise ValueError(f"Clip action {name} needs a camera")
+        self.camera = options["camera"]
+        self.before = parse_time_str(str(options.get("before", "")), default=10)
+        self.after = parse_time_str(str(options.get("after", "")), default=5)
+        self.exporter = ClipExporter(
+            options.get("path", "clips"),
+            format=options.get("format", "jpeg"),
+            jpeg_quality=int(options.get("jpeg_quality", 90)),
+            max_pending=int(options.get("max_pending", 16)),
+        )
+
+    def run(self, event: ActionEvent):
+        buffer = FrameBuffer.registry.get(self.camera)
+        if buffer is None:
+            raise ValueError(f"Camera {self.camera} has no frame buffer in this process")
+        stamp = datetime.fromtimestamp(event.timestamp).strftime("%Y%m%d-%H%M%S")
+        self.exporter.request(
+            buffer, event.timestamp - self.before, event.timestamp + self.after, f"{stamp}-{event.label}"
+        )
+
+    def close(self, timeout: float | None = None) -> bool:
+        return self.exporter.close(timeout)
@@ -0,0 +1,162 @@
+import time
+from collections.abc import Callable
+
+from glcontrol.cfgtools.specs import RuleSpec
+
+# Weight of each new observation in the running estimates
+SMOOTHING = 0.1
+# Floor on a term's cost, so that a run of cached answers doesn't make it look free forever
+MIN_COST = 0.001
+# Floor on the chance of a term deciding its parent, so the orderings stay finite
+MIN_CHANCE = 0.01
+
+
+class Rule:
+    """A node of a composite rule, evaluated against one frame.
+
+    Each node keeps a running estimate of how often it comes out true, and what it
+    costs to evaluate in seconds.  `all` and `any` use their children's estimates to
+    evaluate the one most likely to decide the answer soonest first, and stop as soon as
+    the answer is known.  Estimates only change when a node is evaluated, so until
+    there's something to go on, terms are evaluated in the order they're written.
+    """
+
+    def __init__(self):
+        self.p_true = 0.5
+        self.evaluations = 0
+
+    @staticmethod
+    def from_spec(spec: RuleSpec) -> "Rule":
+        if spec.detector is not None:
+            return DetectorTerm(spec.detector, label=spec.label, cost=spec.cost)
+        if spec.all is not None:
+            return AllRule([Rule.from_spec(child) for child in spec.all])
+        if spec.any is not None:
+            return AnyRule([Rule.from_spec(child) for child in spec.any])
+        return NotRule(Rule.from_spec(spec.not_))
+
+    @property
+    def cost(self) -> float:
+        """Expected seconds to evaluate this node."""
+        raise NotImplementedError
+
+    def detectors(self) -> list[str]:
+        """Names of the detectors in this node, in the order they're written."""
+        raise NotImplementedError
+
+    def evaluate(self, ask: Callable[[str], str | None]) -> bool:
+        """Work out the answer, calling `ask` with a detector's name to get its label for the frame."""
+        value = self._evaluate(ask)
+        self.evaluations += 1
+        self.p_true += SMOOTHING * (float(value) - self.p_true)
+        return value
+
+    def _evaluate(self, ask: Callable[[str], str | None]) -> bool:
+        raise NotImplementedError
+
+
+class DetectorTerm(Rule):
+    """True when the detector's answer is `label`.  Any other answer, including none, is false."""
+
+    def __init__(self, detector: str, label: str = "YES", cost: float | None = None):
+        super().__init__()
+        self.detector = detector
+        self.label = label
+        self.fixed_cost = cost
+        self._cost = 1.0
+
+    def __repr__(self):
+        return f"{self.detector}={self.label}"
+
+    @property
+    def cost(self) -> float:
+        return self.fixed_cost if self.fixed_cost is not None else self._cost
+
+    def detectors(self) -> list[str]:
+        return [self.detector]
+
+    def _evaluate(self, ask: Callable[[str], str | None]) -> bool:
+        start = time.monotonic()
+        label = ask(self.detector)
+        elapsed = max(time.monotonic() - start, MIN_COST)
+        self._cost = elapsed if not self.evaluations else self._cost + SMOOTHING * (elapsed - self._cost)
+        return label == self.label
+
+
+class AllRule(Rule):
+    """True when all of its terms are.  The terms most likely to be false for what
+    they cost are evaluated first, stopping at the first false one."""
+
+    def __init__(self, terms: list[Rule]):
+        super().__init__()
+        self.terms = terms
+
+    def __repr__(self):
+        return f"all({', '.join(map(repr, self.terms))})"
+
+    def detectors(self) -> list[str]:
+        return [name for term in self.terms for name in term.detectors()]
+
+    def order(self) -> list[Rule]:
+        return sorted(self.terms, key=lambda term: term.cost / max(1 - term.p_true, MIN_CHANCE))
+
+    @property
+    def cost(self) -> float:
+        cost, reached = 0.0, 1.0
+        for term in self.order():
+            cost += reached * term.cost
+            reached *= term.p_true
+        return cost
+
+    def _evaluate(self, ask: Callable[[str], str | None]) -> bool:
+        return all(term.evaluate(ask) for term in self.order())
+
+
+class AnyRule(Rule):
+    """True when any of its terms is.  The terms most likely to be true for what
+    they cost are evaluated first, stopping at the first true one."""
+
+    def __init__(self, terms: list[Rule]):
+        super().__init__()
+        self.terms = terms
+
+    def __repr__(self):
+        return f"any({', '.join(map(repr, self.terms))})"
+
+    def detectors(self) -> list[str]:
+        return [name for term in self.terms for name in term.detectors()]
+
+    def order(self) -> list[Rule]:
+        return sorted(self.terms, key=lambda term: term.cost / max(term.p_true, MIN_CHANCE))
+
+    @property
+    def cost(self) -> float:
+        cost, reached = 0.0, 1.0
+        for term in self.order():
+            cost += reached * term.cost
+            reached *= 1 - term.p_true
+        return cost
+
+    def _evaluate(self, ask: Callable[[str], str | None]) -> bool:
+        return any(term.evaluate(ask) for term in self.order())
+
+
+class NotRule(Rule):
+    """True when its term is false."""
+
+    def __init__(self, term: Rule):
+        super().__init__()
+        self.term = term
+
+    def __repr__(self):
+        return f"not({self.term!r})"
+
+    @property
+    def cost(self) -> float:
+        return self.term.cost
+
+    def detectors(self) -> list[str]:
+        return self.term.detectors()
+
+    def _evaluate(self, ask: Callable[[str], str | None]) -> bool:
+        return not self.term.evaluate(ask)
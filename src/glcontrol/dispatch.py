@@ -0,0 +1,239 @@
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from groundlight import Groundlight
+
+from glcontrol.cfgtools.specs import OverflowPolicy
+from glcontrol.lifecycle import CancellationToken
+from glcontrol.metrics import DEPTH_BUCKETS, REGISTRY
+
+logger = logging.getLogger(__name__)
+
+QUEUE_DEPTH = REGISTRY.histogram(
+    "glcontrol_dispatch_queue_depth", "Requests already waiting when a new one is submitted", buckets=DEPTH_BUCKETS
+)
+DISPATCH_ERRORS = REGISTRY.counter("glcontrol_dispatch_errors_total", "Inference requests which failed", ("reason",))
+
+# How often a submit which is waiting for room checks whether its loop has been cancelled
+CANCEL_CHECK_INTERVAL = 0.1
+
+
+class DispatchError(RuntimeError):
+    """Raised when an inference request can't be dispatched."""
+
+
+class DispatcherFullError(DispatchError):
+    """Raised when the dispatcher can't accept any more requests."""
+
+
+class RequestDroppedError(DispatchError):
+    """Raised for a queued request which was dropped to make room for a newer one."""
+
+
+class _Request:
+    __slots__ = ("future", "detector", "image", "wait", "enqueued")
+
+    def __init__(self, future: Future, detector, image, wait: float | None):
+        self.future = future
+        self.detector = detector
+        self.image = image
+        self.wait = wait
+        self.enqueued = time.monotonic()
+
+
+class InferenceDispatcher:
+    """Sends images to Groundlight from a fixed pool of worker threads.
+
+    Control loops submit frames here instead of calling the SDK themselves, and get back a
+    `Future` for the result.  The queue is bounded, and each detector has a limit on how
+    many requests it can have outstanding, so a slow endpoint applies backpressure to the
+    loops rather than piling up work.  If `wait` is set, requests wait up to that many
+    seconds for a confident answer with `ask_confident`, otherwise they use `ask_ml`.
+
+    When the queue is full, the `drop-oldest` overflow policy fails the oldest queued
+    request with RequestDroppedError to make room, since a fresher frame is worth more than a
+    stale one.  The `block` policy makes the submitter wait instead.
+    """
+
+    def __init__(
+        self,
+        sdk: Groundlight,
+        workers: int = 8,
+        queue_size: int = 100,
+        detector_limit: int = 4,
+        wait: float | None = None,
+        max_queue_time: float | None = None,
+        overflow: OverflowPolicy = OverflowPolicy.drop_oldest,
+    ):
+        self.sdk = sdk
+        self.workers = workers
+        self.detector_limit = detector_limit
+        self.wait = wait
+        self.max_queue_time = max_queue_time
+        self.overflow = overflow
+        self._queue: queue.Queue[_Request | None] = queue.Queue(maxsize=queue_size)
+        self._limits: dict[str, threading.BoundedSemaphore] = {}
+        self._threads: list[threading.Thread] = []
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return f"InferenceDispatcher(workers={self.workers}, queue={self.queue_depth}/{self._queue.maxsize})"
+
+    @property
+    def queue_depth(self) -> int:
+        """Number of requests waiting for a worker."""
+        return self._queue.qsize()
+
+    def set_limit(self, detector_id: str, limit: int):
+        """Set how many requests a single detector can have outstanding."""
+        with self._lock:
+            self._limits[detector_id] = threading.BoundedSemaphore(limit)
+
+    def _limit_for(self, detector_id: str) -> threading.BoundedSemaphore:
+        with self._lock:
+            if detector_id not in self._limits:
+                self._limits[detector_id] = threading.BoundedSemaphore(self.detector_limit)
+            return self._limits[detector_id]
+
+    def _ensure_started(self):
+        with self._lock:
+            if self._threads:
+                return
+            for n in range(self.workers):
+                t = threading.Thread(target=self._work, name=f"dispatcher-{n}", daemon=True)
+                t.start()
+                self._threads.append(t)
+
+    def submit(
+        self,
+        detector,
+        image,
+        wait: float | None = None,
+        timeout: float | None = None,
+        cancel_token: CancellationToken | None = None,
+    ) -> Future:
+        """Queue an image for the detector (a Detector or its ID), and return a Future for the result.
+        Blocks for up to `timeout` seconds if the detector or the queue is at its limit,
+        then raises DispatcherFullError.  If `cancel_token` is cancelled while it's blocked,
+        it gives up and raises LoopCancelledError.
+        """
+        self._ensure_started()
+        QUEUE_DEPTH.labels().observe(self._queue.qsize())
+        detector_id = getattr(detector, "id", detector)
+        limit = self._limit_for(detector_id)
+        if not self._wait_for(lambda t: limit.acquire(timeout=t), timeout, cancel_token):
+            DISPATCH_ERRORS.labels("detector-limit").inc()
+            raise DispatcherFullError(f"Too many outstanding requests for detector {detector_id}")
+        future = Future()
+        future.add_done_callback(lambda _: limit.release())
+        request = _Request(future, detector, image, wait)
+        try:
+            if self.overflow == OverflowPolicy.drop_oldest:
+                self._put_dropping_oldest(request)
+            elif not self._wait_for(lambda t: self._put(request, t), timeout, cancel_token):
+                raise queue.Full
+        except queue.Full:
+            future.cancel()
+            DISPATCH_ERRORS.labels("queue-full").inc()
+            raise DispatcherFullError(f"Dispatch queue is full ({self._queue.maxsize} requests)") from None
+        except BaseException:
+            future.cancel()
+            raise
+        return future
+
+    @staticmethod
+    def _wait_for(attempt, timeout: float | None, cancel_token: CancellationToken | None) -> bool:
+        """Call `attempt(seconds)` until it returns True or `timeout` runs out (None for never).  With a token,
+        each attempt only blocks briefly, so a cancelled loop isn't stuck here."""
+        if cancel_token is None:
+            return attempt(timeout)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            cancel_token.raise_if_cancelled()
+            remaining = CANCEL_CHECK_INTERVAL if deadline is None else deadline - time.monotonic()
+            if attempt(max(0.0, min(remaining, CANCEL_CHECK_INTERVAL))):
+                return True
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+
+    def _put(self, request: _Request, timeout: float | None) -> bool:
+        try:
+            self._queue.put(request, timeout=timeout)
+        except queue.Full:
+            return False
+        return True
+
+    def _put_dropping_oldest(self, request: _Request):
+        while True:
+            try:
+                self._queue.put_nowait(request)
+                return
+            except queue.Full:
+                pass
+            try:
+                oldest = self._queue.get_nowait()
+            except queue.Empty:
+                continue
+            if oldest is None:
+                # Shutting down: leave the sentinel for the workers
+                self._queue.put(oldest)
+                raise queue.Full
+            if oldest.future.set_running_or_notify_cancel():
+                DISPATCH_ERRORS.labels("dropped").inc()
+                oldest.future.set_exception(RequestDroppedError("Dropped to make room for a newer request"))
+
+    def ask(self, detector, image, wait: float | None = None, timeout: float | None = None):
+        """Submit an image and block until the result comes back."""
+        return self.submit(detector, image, wait=wait, timeout=timeout).result()
+
+    def _work(self):
+        while True:
+            request = self._queue.get()
+            if request is None:
+                break
+            if not request.future.set_running_or_notify_cancel():
+                continue
+            queued_for = time.monotonic() - request.enqueued
+            if self.max_queue_time is not None and queued_for > self.max_queue_time:
+                DISPATCH_ERRORS.labels("expired").inc()
+                request.future.set_exception(DispatchError(f"Request expired after {queued_for:.1f}s in queue"))
+                continue
+            try:
+                request.future.set_result(self._call(request))
+            except Exception as e:
+                DISPATCH_ERRORS.labels("api-error").inc()
+                request.future.set_exception(e)
+
+    def _call(self, request: _Request):
+        wait = self.wait if request.wait is None else request.wait
+        if wait:
+            return self.sdk.ask_confident(request.detector, request.image, wait=wait)
+        return self.sdk.ask_ml(request.detector, request.image)
+
+    def shutdown(self, timeout: float | None = None, cancel_pending: bool = True) -> bool:
+        """Stop the workers, waiting up to `timeout` seconds for requests in flight.
+        Unless `cancel_pending` is False, requests still in the queue are cancelled rather
+        than sent.  Returns False if some workers were still busy when the timeout ran out.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._lock:
+            threads, self._threads = self._threads, []
+        if cancel_pending:
+            while True:
+                try:
+                    request = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if request is not None:
+                    request.future.cancel()
+        for _ in threads:
+            self._queue.put(None)
+        for t in threads:
+            t.join(timeout=None if deadline is None else max(0.0, deadline - time.monotonic()))
+        busy = [t.name for t in threads if t.is_alive()]
+        if busy:
+            logger.warning(f"Gave up waiting for {len(busy)} inference requests in flight")
+        return not busy
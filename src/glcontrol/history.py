@@ -0,0 +1,259 @@
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+from pydantic import BaseModel
+
+from glcontrol.metrics import REGISTRY
+from glcontrol.resultcache import result_confidence, result_label
+
+logger = logging.getLogger(__name__)
+
+HISTORY_BATCH_SIZE = REGISTRY.histogram(
+    "glcontrol_history_batch_size",
+    "Results written to the history store per transaction",
+    (),
+    (1, 10, 100, 1000, 10000),
+)
+HISTORY_DROPPED = REGISTRY.counter("glcontrol_history_dropped_total", "Results which couldn't be written to history")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    ts REAL NOT NULL,
+    detector TEXT NOT NULL,
+    processor TEXT,
+    label TEXT,
+    confidence REAL,
+    query_id TEXT
+);
+CREATE INDEX IF NOT EXISTS results_by_detector ON results (detector, ts);
+CREATE INDEX IF NOT EXISTS results_by_processor ON results (processor, ts);
+CREATE INDEX IF NOT EXISTS results_by_time ON results (ts);
+"""
+
+
+class HistoryRecord(BaseModel):
+    """One detector result, as kept in the history store."""
+
+    ts: float
+    detector: str
+    processor: str | None = None
+    label: str | None = None
+    confidence: float | None = None
+    query_id: str | None = None
+
+
+class ResultHistory:
+    """Keeps every detector result in a local SQLite database, in WAL mode.
+
+    `record` only puts the result on a queue, so it costs the control loop next to nothing.
+    A background thread writes whatever has queued up every `flush_interval` seconds (or
+    as soon as `batch_size` results are waiting) in a single transaction.  The database
+    isn't fsynced on every commit, so a power cut can lose the last batch or so, but it
+    can't be corrupted.  Results older than `retention` are deleted every `prune_interval`,
+    and if that deleted anything, the file is compacted at most every `compact_interval`.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        flush_interval: float = 1.0,
+        batch_size: int = 1000,
+        retention: float | None = None,
+        prune_interval: float = 3600,
+        compact_interval: float | None = 86400,
+    ):
+        self.path = os.path.expanduser(path)
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.retention = retention
+        self.prune_interval = prune_interval
+        self.compact_interval = compact_interval
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self._queue: queue.Queue[tuple | threading.Event | None] = queue.Queue()
+        self._conn = self._connect()
+        self._conn.executescript(_SCHEMA)
+        self._conn_lock = threading.Lock()
+        self._last_prune = 0.0
+        self._last_compact = 0.0
+        self._pruned_since_compact = 0
+        self._thread = threading.Thread(target=self._write_loop, name="history-writer", daemon=True)
+        self._thread.start()
+
+    def __repr__(self):
+        return f"ResultHistory('{self.path}')"
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def record(self, detector: str, result, processor: str | None = None, ts: float | None = None):
+        """Queue a result to be written.  Never blocks."""
+        ts = time.time() if ts is None else ts
+        row = (ts, detector, processor, result_label(result), result_confidence(result), getattr(result, "id", None))
+        self._queue.put(row)
+
+    def flush(self, timeout: float | None = None) -> bool:
+        """Wait until everything recorded so far has been written."""
+        if not self._thread.is_alive():
+            return True
+        done = threading.Event()
+        self._queue.put(done)
+        return done.wait(timeout)
+
+    def _write_loop(self):
+        while True:
+            try:
+                item = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                self._maybe_prune()
+                continue
+            batch, waiters, closing = [], [], False
+            # Let a burst build up into one transaction, instead of committing each result
+            deadline = time.monotonic() + self.flush_interval
+            while True:
+                if item is None:
+                    closing = True
+                elif isinstance(item, threading.Event):
+                    waiters.append(item)
+                else:
+                    batch.append(item)
+                if closing or waiters or len(batch) >= self.batch_size:
+                    break
+                try:
+                    item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+            self._write(batch)
+            self._maybe_prune()
+            for waiter in waiters:
+                waiter.set()
+            if closing:
+                return
+
+    def _write(self, batch: list[tuple]):
+        if not batch:
+            return
+        try:
+            with self._conn_lock, self._conn:
+                self._conn.execute("BEGIN")
+                self._conn.executemany(
+                    (
+                        "INSERT INTO results (ts, detector, processor, label, confidence, query_id)"
+                        " VALUES (?, ?, ?, ?, ?, ?)"
+                    ),
+                    batch,
+                )
+            HISTORY_BATCH_SIZE.labels().observe(len(batch))
+        except sqlite3.Error:
+            HISTORY_DROPPED.labels().inc(len(batch))
+            logger.exception(f"Failed to write {len(batch)} results to {self}")
+
+    def _maybe_prune(self):
+        if self.retention is None or time.monotonic() - self._last_prune < self.prune_interval:
+            return
+        self._last_prune = time.monotonic()
+        try:
+            self._pruned_since_compact += self.prune(time.time() - self.retention)
+        except sqlite3.Error:
+            logger.exception(f"Failed to prune {self}")
+        self._maybe_compact()
+
+    def _maybe_compact(self):
+        if self.compact_interval is None or not self._pruned_since_compact:
+            return
+        if time.monotonic() - self._last_compact < self.compact_interval:
+            return
+        self._last_compact = time.monotonic()
+        self._pruned_since_compact = 0
+        try:
+            self._vacuum()
+        except sqlite3.Error:
+            logger.exception(f"Failed to compact {self}")
+
+    def prune(self, before: float) -> int:
+        """Delete results from before the given time, and return how many went."""
+        with self._conn_lock:
+            deleted = self._conn.execute("DELETE FROM results WHERE ts < ?", (before,)).rowcount
+            if deleted:
+                # Keep the WAL from growing with all the deletions
+                self._conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        if deleted:
+            logger.info(f"Pruned {deleted} old results from {self}")
+        return deleted
+
+    def compact(self):
+        """Rebuild the database file to reclaim the space left by pruning."""
+        self.flush()
+        self._vacuum()
+
+    def _vacuum(self):
+        with self._conn_lock:
+            self._conn.execute("VACUUM")
+            self._conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    def query(
+        self,
+        detector: str | None = None,
+        processor: str | None = None,
+        since: float | None = None,
+        until: float | None = None,
+        limit: int | None = None,
+    ) -> list[HistoryRecord]:
+        """Results in time order, optionally filtered by detector, processor and time range.
+        Only sees results which have been written, so call `flush` first to include the latest ones.
+        """
+        clauses, params = [], []
+        for column, op, value in (
+            ("detector", "=", detector),
+            ("processor", "=", processor),
+            ("ts", ">=", since),
+            ("ts", "<", until),
+        ):
+            if value is not None:
+                clauses.append(f"{column} {op} ?")
+                params.append(value)
+        sql = "SELECT ts, detector, processor, label, confidence, query_id FROM results"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        sql += " ORDER BY ts"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+        return [HistoryRecord(**dict(zip(HistoryRecord.model_fields, row))) for row in self._read(sql, params)]
+
+    def latest(self, detector: str) -> HistoryRecord | None:
+        """The most recent result written for the detector."""
+        rows = self._read(
+            (
+                "SELECT ts, detector, processor, label, confidence, query_id FROM results"
+                " WHERE detector = ? ORDER BY ts DESC LIMIT 1"
+            ),
+            [detector],
+        )
+        return HistoryRecord(**dict(zip(HistoryRecord.model_fields, rows[0]))) if rows else None
+
+    def _read(self, sql: str, params: list) -> list[tuple]:
+        # Readers get their own connection, so they don't wait on the writer
+        conn = sqlite3.connect(self.path)
+        try:
+            return conn.execute(sql, params).fetchall()
+        finally:
+            conn.close()
+
+    def close(self, timeout: float | None = 5.0) -> bool:
+        """Write out anything still queued and close the database.
+        Returns False if the writer didn't finish within `timeout` seconds.
+        """
+        self._queue.put(None)
+        self._thread.join(timeout)
+        if self._thread.is_alive():
+            logger.warning(f"Gave up waiting for {self} to finish writing")
+            return False
+        self._conn.close()
+        return True
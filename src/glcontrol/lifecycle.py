@@ -0,0 +1,146 @@
+import threading
+import time
+from concurrent.futures import Future
+from enum import Enum
+
+
+class LoopCancelledError(Exception):
+    """Raised inside a control loop when it's been asked to stop."""
+
+
+class CancellationToken:
+    """Tells a control loop (and anything it's waiting on) to stop.
+
+    Once cancelled, `wait` returns immediately, and `result` stops waiting on its future
+    and raises LoopCancelledError, so a loop blocked on a slow API call can still shut down.
+    """
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._waiters: set[threading.Event] = set()
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return f"CancellationToken(cancelled={self.cancelled})"
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def cancel(self):
+        with self._lock:
+            self._event.set()
+            for waiter in self._waiters:
+                waiter.set()
+
+    def wait(self, timeout: float | None = None) -> bool:
+        """Sleep for up to `timeout` seconds.  Returns True if cancelled."""
+        return self._event.wait(timeout)
+
+    def raise_if_cancelled(self):
+        if self.cancelled:
+            raise LoopCancelledError()
+
+    def result(self, future: Future, timeout: float | None = None):
+        """Wait for the future's result, unless the token is cancelled first.
+        Raises LoopCancelledError if cancelled, or TimeoutError after `timeout` seconds.
+        """
+        done = threading.Event()
+        with self._lock:
+            if self._event.is_set():
+                done.set()
+            self._waiters.add(done)
+        future.add_done_callback(lambda _: done.set())
+        try:
+            done.wait(timeout)
+        finally:
+            with self._lock:
+                self._waiters.discard(done)
+        if future.done():
+            return future.result()
+        future.cancel()
+        if self.cancelled:
+            raise LoopCancelledError()
+        raise TimeoutError(f"No result after {timeout} seconds")
+
+
+class LoopState(str, Enum):
+    idle = "idle"
+    running = "running"
+    stopped = "stopped"
+
+
+class LoopHealth:
+    """Tracks how a control loop is doing, so the runner can report on it.
+
+    A loop is `stalled` if a single poll has been running for more than `stall_periods`
+    poll periods (and at least `min_stall_time` seconds), and unhealthy if it's stalled,
+    stopped, or its last `max_consecutive_errors` polls all failed.
+    """
+
+    stall_periods = 3
+    min_stall_time = 30.0
+    max_consecutive_errors = 3
+
+    def __init__(self, period: float):
+        self.period = period
+        self.state = LoopState.idle
+        self.runs = 0
+        self.errors = 0
+        self.consecutive_errors = 0
+        self.last_error: str | None = None
+        self.last_success: float | None = None
+        self.poll_started: float | None = None
+        self._lock = threading.Lock()
+
+    def started(self):
+        with self._lock:
+            self.state = LoopState.running
+            self.poll_started = time.monotonic()
+
+    def succeeded(self):
+        with self._lock:
+            self.state = LoopState.idle
+            self.runs += 1
+            self.consecutive_errors = 0
+            self.last_success = time.time()
+
+    def failed(self, error: Exception):
+        with self._lock:
+            self.state = LoopState.idle
+            self.runs += 1
+            self.errors += 1
+            self.consecutive_errors += 1
+            self.last_error = f"{type(error).__name__}: {error}"
+
+    def stopped(self):
+        with self._lock:
+            self.state = LoopState.stopped
+
+    @property
+    def stalled(self) -> bool:
+        if self.state != LoopState.running or self.poll_started is None:
+            return False
+        stall_time = max(self.stall_periods * self.period, self.min_stall_time)
+        return time.monotonic() - self.poll_started > stall_time
+
+    @property
+    def healthy(self) -> bool:
+        return (
+            self.state != LoopState.stopped
+            and not self.stalled
+            and self.consecutive_errors < self.max_consecutive_errors
+        )
+
+    def as_dict(self) -> dict:
+        with self._lock:
+            return {
+                "state": self.state.value,
+                "healthy": self.healthy,
+                "stalled": self.stalled,
+                "runs": self.runs,
+                "errors": self.errors,
+                "consecutive_errors": self.consecutive_errors,
+                "last_error": self.last_error,
+                "last_success": self.last_success,
+            }
@@ -0,0 +1,212 @@
+import atexit
+import copy
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from types import SimpleNamespace
+from typing import TextIO
+
+from glcontrol.metrics import REGISTRY
+
+LOG_MESSAGES_DROPPED = REGISTRY.counter(
+    "glcontrol_log_messages_dropped_total", "Log messages which weren't written", ("reason",)
+)
+
+TEXT_FORMAT = "%(asctime)s %(levelname)s %(name)s: %(message)s"
+
+# Beyond this many rate limit windows, the expired ones are cleared out
+MAX_RATE_WINDOWS = 10000
+
+# Attributes every LogRecord has, so anything else was passed in with `extra=`
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+
+# The QueueListener and handler setup_logging installed, so they can be taken down again
+_active = SimpleNamespace(listener=None, handler=None)
+_settings: dict = {}
+_lock = threading.Lock()
+
+
+class JsonFormatter(logging.Formatter):
+    """Formats each record as one line of JSON, with any `extra=` fields alongside the message."""
+
+    def __init__(self, tag: str | None = None):
+        super().__init__()
+        self.tag = tag
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "thread": record.threadName,
+        }
+        if self.tag:
+            entry["tag"] = self.tag
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class RateLimitFilter(logging.Filter):
+    """Lets at most `burst` messages from each line of code through every `period` seconds,
+    so that something failing on every poll of hundreds of loops can't flood the log.
+    The next message let through from that line says how many were dropped.
+
+    Messages are told apart by their first argument too, which is usually what they're
+    about (`"Scheduled job %s failed", name`), so one processor failing over and over
+    doesn't hide the failures of another which happen to be logged from the same line.
+    """
+
+    def __init__(self, burst: int = 10, period: float = 60.0, clock=time.monotonic):
+        super().__init__()
+        self.burst = burst
+        self.period = period
+        self.clock = clock
+        self._windows: dict[tuple[str, int, str], list] = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if self.burst <= 0:
+            return True
+        key = (record.pathname, record.lineno, self._subject(record))
+        now = self.clock()
+        with self._lock:
+            if len(self._windows) > MAX_RATE_WINDOWS:
+                self._prune(now)
+            window = self._windows.get(key)
+            if window is None or now - window[0] >= self.period:
+                suppressed = window[2] if window else 0
+                window = self._windows[key] = [now, 0, 0]
+            else:
+                suppressed = 0
+            if window[1] >= self.burst:
+                window[2] += 1
+                LOG_MESSAGES_DROPPED.labels("rate-limit").inc()
+                return False
+            window[1] += 1
+        if suppressed:
+            record.suppressed = suppressed
+        return True
+
+    @staticmethod
+    def _subject(record: logging.LogRecord) -> str:
+        args = record.args
+        if isinstance(args, tuple) and args:
+            return str(args[0])
+        if isinstance(args, dict):
+            return ""
+        # Formatted up front, like an f-string, so the details are in the message itself
+        return str(record.msg)
+
+    def _prune(self, now: float):
+        self._windows = {key: window for key, window in self._windows.items() if now - window[0] < self.period}
+
+
+class _SuppressedNote(logging.Filter):
+    """Adds the count of rate-limited messages to the end of a text message."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        # The record is the queue's own copy, so it's ours to change
+        suppressed = getattr(record, "suppressed", 0)
+        if suppressed:
+            record.msg = f"{record.getMessage()} ({suppressed} similar messages suppressed)"
+            record.args = None
+        return True
+
+
+class AsyncQueueHandler(logging.handlers.QueueHandler):
+    """Hands records to a QueueListener thread, so the caller never waits on the output.
+    If the queue is full, the record is dropped and counted rather than blocking."""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Merge the arguments in now, in case they change before the listener gets to them,
+        # but leave the timestamps, JSON and tracebacks to the listener's thread
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+            LOG_MESSAGES_DROPPED.labels("queue-full").inc()
+
+
+class _QueueListener(logging.handlers.QueueListener):
+    def enqueue_sentinel(self):
+        # Wait for room, rather than failing to stop when the queue's full; the listener is emptying it
+        self.queue.put(self._sentinel)
+
+
+def setup_logging(
+    level: str | int = "INFO",
+    format: str = "text",
+    rate_limit: int = 10,
+    rate_period: float = 60.0,
+    queue_size: int = 10000,
+    tag: str | None = None,
+    stream: TextIO | None = None,
+):
+    """Send all logging to `stream` (stderr by default) through a queue and a background thread.
+
+    `format` is `text` or `json`, `rate_limit` messages from each line of code are let
+    through per `rate_period` seconds (0 for no limit), and `tag` marks every line, e.g.
+    with a worker's name.  Calling it again replaces the previous setup.
+    """
+    if format not in ("text", "json"):
+        raise ValueError(f"Unknown log format '{format}', expected text or json")
+    output = logging.StreamHandler(stream or sys.stderr)
+    if format == "json":
+        output.setFormatter(JsonFormatter(tag=tag))
+    else:
+        output.setFormatter(logging.Formatter(f"[{tag}] {TEXT_FORMAT}" if tag else TEXT_FORMAT))
+        output.addFilter(_SuppressedNote())
+    handler = AsyncQueueHandler(queue.Queue(queue_size))
+    handler.addFilter(RateLimitFilter(burst=rate_limit, period=rate_period))
+    listener = _QueueListener(handler.queue, output, respect_handler_level=True)
+    root = logging.getLogger()
+    with _lock:
+        _stop()
+        root.setLevel(level.upper() if isinstance(level, str) else level)
+        root.addHandler(handler)
+        listener.start()
+        _active.listener, _active.handler = listener, handler
+        _settings.update(
+            level=root.level, format=format, rate_limit=rate_limit, rate_period=rate_period, queue_size=queue_size
+        )
+
+
+def logging_settings() -> dict:
+    """The arguments setup_logging was last called with (apart from tag and stream), for passing to workers."""
+    with _lock:
+        return dict(_settings)
+
+
+def _stop():
+    """Write out anything still queued, and take the handler off.  Caller must hold the lock."""
+    if _active.handler is not None:
+        logging.getLogger().removeHandler(_active.handler)
+    if _active.listener is not None:
+        _active.listener.stop()
+    _active.listener = _active.handler = None
+
+
+@atexit.register
+def shutdown_logging():
+    with _lock:
+        _stop()
@@ -0,0 +1,66 @@
+import logging
+import time
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class MotionGate:
+    """Decides whether a frame has changed enough to be worth sending to a detector.
+
+    Each frame is downscaled by strided slicing (a view, no copy) and reduced to grayscale,
+    then compared against the last frame that was let through.  If too few pixels have
+    changed, the frame is skipped.  A frame is always let through after `max_skip` seconds
+    so that slow changes (lighting, etc) eventually get looked at.
+    """
+
+    def __init__(
+        self,
+        val_threshold: float = 25,
+        pct_threshold: float = 1.0,
+        max_skip: float = 600.0,
+        max_dim: int = 160,
+    ):
+        self.val_threshold = val_threshold
+        self.pct_threshold = pct_threshold
+        self.max_skip = max_skip
+        self.max_dim = max_dim
+        self.skipped = 0
+        self._reference: np.ndarray | None = None
+        self._last_pass = 0.0
+
+    def __repr__(self):
+        return f"MotionGate(val={self.val_threshold}, pct={self.pct_threshold}, max_skip={self.max_skip})"
+
+    def thumbnail(self, frame: np.ndarray) -> np.ndarray:
+        """Cheap downscaled grayscale version of the frame, used for comparisons."""
+        height, width = frame.shape[:2]
+        step = max(1, -(-max(height, width) // self.max_dim))  # ceiling division
+        # atleast_3d gives a grayscale frame a single channel, so color and grayscale average the same way
+        return np.atleast_3d(frame[::step, ::step]).mean(axis=2, dtype=np.float32)
+
+    def changed_pct(self, thumb: np.ndarray) -> float:
+        """Percent of pixels in the thumbnail which differ from the reference."""
+        changed = np.count_nonzero(np.abs(thumb - self._reference) > self.val_threshold)
+        return changed * 100.0 / thumb.size
+
+    def should_submit(self, frame: np.ndarray, now: float | None = None) -> bool:
+        """Returns True if the frame should be sent on, and updates the reference if so."""
+        if frame is None:
+            return False
+        now = time.monotonic() if now is None else now
+        thumb = self.thumbnail(frame)
+        if self._reference is None or thumb.shape != self._reference.shape:
+            submit = True
+        elif now - self._last_pass >= self.max_skip:
+            logger.debug("No motion for %.0f seconds, submitting anyway", now - self._last_pass)
+            submit = True
+        else:
+            submit = self.changed_pct(thumb) > self.pct_threshold
+        if submit:
+            self._reference = thumb
+            self._last_pass = now
+        else:
+            self.skipped += 1
+        return submit
@@ -0,0 +1,578 @@
+import logging
+import math
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from collections.abc import Callable
+from multiprocessing import shared_memory
+from types import SimpleNamespace
+
+import numpy as np
+from groundlight import Groundlight
+from pydantic import BaseModel
+
+from glcontrol.cfgtools.specs import CameraSpec, ClientSpec, ControlLoopSpec, GLControlSpec
+from glcontrol.logs import logging_settings, setup_logging
+from glcontrol.runner import ResultRouter, SpecRunner, changed_names, create_grabber, parse_time_str, sdk_connect
+
+logger = logging.getLogger(__name__)
+
+# Workers are started fresh rather than forked, since the supervisor is full of threads
+MP_CONTEXT = multiprocessing.get_context("spawn")
+
+
+class SharedFrameSlot:
+    """The latest frame from a camera, in shared memory, so other processes can read it
+    without it being pickled.
+
+    There's one writer (the process which owns the camera) and any number of readers.
+    A sequence number in the header is odd while a frame is being written, so readers
+    can tell when they've caught a half-written frame and try again.
+    """
+
+    HEADER_BYTES = 64
+
+    def __init__(self, shm: shared_memory.SharedMemory):
+        self._shm = shm
+        # seq, height, width, channels (0 for a 2D frame)
+        self._header = np.ndarray((4,), dtype=np.uint64, buffer=shm.buf)
+        self._data = np.ndarray(
+            (shm.size - self.HEADER_BYTES,), dtype=np.uint8, buffer=shm.buf, offset=self.HEADER_BYTES
+        )
+
+    def __repr__(self):
+        return f"SharedFrameSlot('{self.name}', seq={int(self._header[0])})"
+
+    @property
+    def name(self) -> str:
+        return self._shm.name
+
+    @property
+    def seq(self) -> int:
+        return int(self._header[0])
+
+    @classmethod
+    def create(cls, max_bytes: int) -> "SharedFrameSlot":
+        slot = cls(shared_memory.SharedMemory(create=True, size=cls.HEADER_BYTES + max_bytes))
+        slot._header[:] = 0
+        return slot
+
+    @classmethod
+    def attach(cls, name: str) -> "SharedFrameSlot":
+        try:
+            shm = shared_memory.SharedMemory(name=name, track=False)
+        except TypeError:
+            # Before Python 3.13 there's no track=False, but the workers share the supervisor's
+            # resource tracker, so attaching doesn't stop the supervisor from owning the block
+            shm = shared_memory.SharedMemory(name=name)
+        return cls(shm)
+
+    def write(self, frame: np.ndarray):
+        frame = np.ascontiguousarray(frame, dtype=np.uint8)
+        if frame.nbytes > self._data.size:
+            raise ValueError(f"Frame of {frame.nbytes} bytes doesn't fit in {self} ({self._data.size} bytes)")
+        header = self._header
+        header[0] += 1
+        header[1:4] = (*frame.shape, 0)[:3]  # a 2D frame has 0 channels
+        self._data[: frame.nbytes] = frame.reshape(-1)
+        header[0] += 1
+
+    def read(self) -> np.ndarray | None:
+        """A copy of the latest frame, or None if nothing has been written yet."""
+        header = self._header
+        while True:
+            seq = int(header[0])
+            if seq == 0:
+                return None
+            if seq % 2:
+                time.sleep(0)
+                continue
+            height, width, channels = (int(n) for n in header[1:4])
+            shape = (height, width, channels) if channels else (height, width)
+            size = math.prod(shape)
+            if int(header[0]) != seq or size > self._data.size:
+                continue  # the writer started on the next frame while we read the header
+            frame = self._data[:size].copy()
+            if int(header[0]) == seq:
+                return frame.reshape(shape)
+
+    def close(self):
+        del self._header, self._data
+        self._shm.close()
+
+    def unlink(self):
+        self._shm.unlink()
+
+
+class PublishingGrabber:
+    """Wraps a camera's grabber, and copies every frame it grabs into a shared slot."""
+
+    def __init__(self, grabber, slot: SharedFrameSlot):
+        self.grabber = grabber
+        self.slot = slot
+
+    def grab(self) -> np.ndarray:
+        frame = self.grabber.grab()
+        if frame is not None:
+            self.slot.write(frame)
+        return frame
+
+    def release(self):
+        self.grabber.release()
+        self.slot.close()
+
+
+class SharedFrameGrabber:
+    """A grabber which reads a camera owned by another process, from its shared slot.
+    If no new frame has been written for `first_frame_timeout` seconds, the process which
+    owns the camera has stopped publishing, so grabs fail rather than handing out the
+    same old frame, and the camera's watchdog can see that something is wrong.
+    """
+
+    def __init__(self, slot: SharedFrameSlot, first_frame_timeout: float = 30.0):
+        self.slot = slot
+        self.first_frame_timeout = first_frame_timeout
+        self._seq = slot.seq
+        self._advanced = time.monotonic()
+
+    def grab(self) -> np.ndarray:
+        deadline = time.monotonic() + self.first_frame_timeout
+        frame = self.slot.read()
+        while frame is None:
+            if time.monotonic() > deadline:
+                raise RuntimeError(f"No frames from {self.slot} after {self.first_frame_timeout} seconds")
+            time.sleep(0.05)
+            frame = self.slot.read()
+        seq, now = self.slot.seq, time.monotonic()
+        if seq != self._seq:
+            self._seq, self._advanced = seq, now
+        elif now - self._advanced > self.first_frame_timeout:
+            raise RuntimeError(f"No new frames from {self.slot} for {now - self._advanced:.0f} seconds")
+        return frame
+
+    def release(self):
+        self.slot.close()
+
+
+class ShardPlan(BaseModel):
+    """What one worker process runs.  Cameras in `publish` are shared with other workers,
+    and those in `subscribe` are read from the workers which own them."""
+
+    spec: GLControlSpec
+    publish: list[str] = []
+    subscribe: list[str] = []
+
+
+def _named_in(value, names: set[str]) -> set[str]:
+    """All the strings anywhere in `value` which are in `names`."""
+    if isinstance(value, str):
+        return {value} & names
+    if isinstance(value, dict):
+        value = list(value.values())
+    if isinstance(value, list | tuple):
+        found = set()
+        for item in value:
+            found |= _named_in(item, names)
+        return found
+    return set()
+
+
+def _camera_names(processor: ControlLoopSpec) -> list[str]:
+    return [entry["camera"] for entry in processor.inputs if isinstance(entry, dict) and "camera" in entry]
+
+
+def plan_shards(spec: GLControlSpec, processes: int) -> list[ShardPlan]:
+    """Split the processors between `processes` workers, about evenly.
+
+    Processors which share a camera go to the same worker where that keeps things even.
+    When a camera has too many processors for one worker, they're split up, and the
+    camera's frames are shared from the first worker to the others.
+    """
+    processors = spec.processors
+    if not processors:
+        return []
+    target = math.ceil(len(processors) / processes)
+
+    # Group the processors which are connected by a camera
+    groups: list[tuple[set[str], list[ControlLoopSpec]]] = []
+    for processor in processors:
+        cameras = set(_camera_names(processor))
+        joined = [group for group in groups if group[0] & cameras]
+        merged = (cameras, [processor])
+        for group in joined:
+            groups.remove(group)
+            merged = (merged[0] | group[0], group[1] + merged[1])
+        groups.append(merged)
+
+    pieces = [members[i : i + target] for _, members in groups for i in range(0, len(members), target)]
+    pieces.sort(key=len, reverse=True)
+    loads: list[list[ControlLoopSpec]] = [[] for _ in range(processes)]
+    for piece in pieces:
+        min(loads, key=len).extend(piece)
+    loads = [load for load in loads if load]
+
+    camera_names = {camera.name for camera in spec.cameras}
+    detector_names = {detector.name for detector in spec.detectors}
+    owner: dict[str, int] = {}
+    users: dict[str, set[int]] = {}
+    for index, load in enumerate(loads):
+        for processor in load:
+            for name in _camera_names(processor):
+                owner.setdefault(name, index)
+                users.setdefault(name, set()).add(index)
+    shared = {name for name, indexes in users.items() if len(indexes) > 1}
+
+    runtime = spec.runtime.model_copy(
+        update={
+            "history": spec.runtime.history.model_copy(update={"path": None}),
+            "multiprocess": spec.runtime.multiprocess.model_copy(update={"processes": 0}),
+        }
+    )
+    plans = []
+    for index, load in enumerate(loads):
+        shard_runtime = runtime.model_copy(update={"client": _shard_client(spec.runtime.client, index, len(loads))})
+        used_cameras = set().union(*(_camera_names(p) for p in load)) & camera_names
+        used_detectors = _named_in([p.options for p in load], detector_names)
+        cameras = []
+        for camera in spec.cameras:
+            if camera.name not in used_cameras:
+                continue
+            if camera.name in shared and owner[camera.name] == index:
+                cameras.append(_keep_grabbing(camera))
+            else:
+                cameras.append(camera)
+        plans.append(
+            ShardPlan(
+                spec=GLControlSpec(
+                    cameras=cameras,
+                    detectors=[d for d in spec.detectors if d.name in used_detectors],
+                    processors=load,
+                    runtime=shard_runtime,
+                ),
+                publish=sorted(name for name in used_cameras & shared if owner[name] == index),
+                subscribe=sorted(name for name in used_cameras & shared if owner[name] != index),
+            )
+        )
+    return plans
+
+
+def _shard_client(client: ClientSpec, index: int, shards: int) -> ClientSpec:
+    """Each worker gets its share of the rate limit, and its own spool directory."""
+    update = {}
+    if client.rate_limit:
+        update["rate_limit"] = client.rate_limit / shards
+    if client.spool.path:
+        update["spool"] = client.spool.model_copy(update={"path": os.path.join(client.spool.path, f"worker-{index}")})
+    return client.model_copy(update=update)
+
+
+def _keep_grabbing(camera: CameraSpec) -> CameraSpec:
+    """A camera which other workers read from has to keep grabbing, even when its own processors don't."""
+    frame_cache = camera.frame_cache
+    interval = frame_cache.interval or (frame_cache.max_age if frame_cache.max_age else "1 sec")
+    return camera.model_copy(
+        update={"frame_cache": frame_cache.model_copy(update={"background": True, "interval": interval})}
+    )
+
+
+def _worker_main(
+    index: int,
+    plan: ShardPlan,
+    slot_names: dict[str, str],
+    results: multiprocessing.Queue,
+    stop: multiprocessing.Event,
+    sdk_factory: Callable[[], Groundlight],
+    grabber_factory: Callable[[CameraSpec], object] | None,
+    health_interval: float,
+    log_settings: dict,
+):
+    """Runs one shard of the processors, passing results and health back to the supervisor."""
+    setup_logging(**log_settings, tag=f"worker {index}")
+    open_camera = grabber_factory or create_grabber
+
+    def grabber_for(camera: CameraSpec):
+        if camera.name in plan.subscribe:
+            return SharedFrameGrabber(SharedFrameSlot.attach(slot_names[camera.name]))
+        grabber = open_camera(camera)
+        if camera.name in plan.publish:
+            return PublishingGrabber(grabber, SharedFrameSlot.attach(slot_names[camera.name]))
+        return grabber
+
+    def forward(detector: str, result, processor: str | None):
+        inner = getattr(result, "result", None)
+        label = getattr(inner, "label", None)
+        results.put(
+            (
+                "result",
+                index,
+                detector,
+                processor,
+                getattr(label, "value", label),
+                getattr(inner, "confidence", None),
+                getattr(result, "id", None),
+            )
+        )
+
+    runner = SpecRunner(plan.spec, sdk=sdk_factory(), grabber_factory=grabber_for, result_handler=forward)
+    runner.run_all()
+    while not stop.wait(health_interval):
+        results.put(("health", index, runner.health()))
+    runner.stop_all()
+    results.put(("health", index, runner.health()))
+
+
+class _Worker:
+    def __init__(self, index: int, plan: ShardPlan):
+        self.index = index
+        self.plan = plan
+        self.stop = MP_CONTEXT.Event()
+        self.process: multiprocessing.Process | None = None
+        self.restart_at: float | None = None
+        self.health: dict[str, dict] = {}
+
+    @property
+    def processor_names(self) -> list[str]:
+        return [processor.name for processor in self.plan.spec.processors]
+
+
+class MultiprocessRunner:
+    """Runs a GLControlSpec over several worker processes, so that decoding and
+    preprocessing aren't all held up by the GIL.
+
+    The processors are split between the workers with `plan_shards`, and each worker
+    runs its share with its own SpecRunner.  Frames from cameras which are used by more
+    than one worker go through shared memory.  The supervisor (this object) restarts
+    workers which die, collects their health, and runs the result history and actions
+    for all of them.  It has the same run_all / apply / health / stop_all interface as
+    SpecRunner.
+    """
+
+    def __init__(
+        self,
+        spec: GLControlSpec,
+        processes: int | None = None,
+        sdk_factory: Callable[[], Groundlight] = sdk_connect,
+        grabber_factory: Callable[[CameraSpec], object] | None = None,
+    ):
+        """`sdk_factory` and `grabber_factory` are called in the workers, so they have to be picklable."""
+        self.spec = spec
+        self.processes = processes or spec.runtime.multiprocess.processes
+        self.sdk_factory = sdk_factory
+        self.grabber_factory = grabber_factory
+        self.results = ResultRouter(spec, remote_cameras=True)
+        self.failed: dict[str, str] = dict(self.results.failed)
+        self._queue = MP_CONTEXT.Queue()
+        self._slots: dict[str, SharedFrameSlot] = {}
+        self._workers: list[_Worker] = []
+        self._lock = threading.Lock()
+        self._collector: threading.Thread | None = None
+        self._running = False
+        # Set while apply is restarting the workers, so the collector doesn't take them for crashed
+        self._reconfiguring = False
+        self._stopped = threading.Event()
+
+    def __repr__(self):
+        return f"MultiprocessRunner(processes={self.processes}, workers={len(self._workers)})"
+
+    def _settings(self) -> tuple[float, float]:
+        multiprocess = self.spec.runtime.multiprocess
+        return (
+            parse_time_str(str(multiprocess.health_interval), default=1),
+            parse_time_str(str(multiprocess.restart_delay), default=5),
+        )
+
+    def run_all(self) -> None:
+        """Start the worker processes and return."""
+        self._running = True
+        self._start_workers(plan_shards(self.spec, self.processes))
+        self._collector = threading.Thread(target=self._collect, name="multiprocess-supervisor", daemon=True)
+        self._collector.start()
+
+    def _start_workers(self, plans: list[ShardPlan]):
+        self._create_slots(plans)
+        with self._lock:
+            self._workers = [_Worker(index, plan) for index, plan in enumerate(plans)]
+            for worker in self._workers:
+                self._start_worker(worker)
+        logger.info(f"Started {len(plans)} worker processes")
+
+    def _create_slots(self, plans: list[ShardPlan]):
+        """Shared slots for the cameras in `plans` which are published, unless they already have one."""
+        max_bytes = self.spec.runtime.multiprocess.max_frame_bytes
+        for plan in plans:
+            for name in plan.publish:
+                if name not in self._slots:
+                    self._slots[name] = SharedFrameSlot.create(max_bytes)
+
+    def _close_slots(self, names: list[str]):
+        for name in names:
+            slot = self._slots.pop(name)
+            slot.close()
+            slot.unlink()
+
+    def _start_worker(self, worker: _Worker):
+        health_interval, _ = self._settings()
+        worker.stop = MP_CONTEXT.Event()
+        worker.restart_at = None
+        worker.process = MP_CONTEXT.Process(
+            target=_worker_main,
+            args=(
+                worker.index,
+                worker.plan,
+                {name: slot.name for name, slot in self._slots.items()},
+                self._queue,
+                worker.stop,
+                self.sdk_factory,
+                self.grabber_factory,
+                health_interval,
+                {**logging_settings(), "level": logging.getLogger().getEffectiveLevel()},
+            ),
+            name=f"glcontrol-worker-{worker.index}",
+            daemon=True,
+        )
+        worker.process.start()
+
+    def _collect(self):
+        """Runs on a thread in the supervisor, taking messages from the workers and restarting any which die."""
+        while self._running:
+            try:
+                message = self._queue.get(timeout=0.5)
+            except queue.Empty:
+                message = None
+            if message:
+                self._handle(message)
+            self._check_workers()
+
+    def _handle(self, message: tuple):
+        kind, index = message[:2]
+        if kind == "health":
+            with self._lock:
+                if index < len(self._workers):
+                    self._workers[index].health = message[2]
+        elif kind == "result":
+            detector, processor, label, confidence, query_id = message[2:]
+            result = SimpleNamespace(id=query_id, result=SimpleNamespace(label=label, confidence=confidence))
+            self.results.handle(detector, result, processor)
+
+    def _check_workers(self):
+        _, restart_delay = self._settings()
+        with self._lock:
+            if self._reconfiguring:
+                return
+            for worker in self._workers:
+                if not self._running or worker.process is None or worker.process.is_alive():
+                    continue
+                if worker.restart_at is None:
+                    logger.error(f"Worker {worker.index} exited with code {worker.process.exitcode}, restarting")
+                    worker.restart_at = time.monotonic() + restart_delay
+                    exited = f"worker process exited with code {worker.process.exitcode}"
+                    worker.health = {
+                        name: {"state": "failed", "healthy": False, "last_error": exited}
+                        for name in worker.processor_names
+                    }
+                elif time.monotonic() >= worker.restart_at:
+                    self._start_worker(worker)
+
+    def apply(self, new_spec: GLControlSpec) -> dict[str, list[str]]:
+        """Reconfigure to match `new_spec`.  Actions are updated in place.  Any other change
+        means re-planning the shards, and restarting the workers whose shard came out
+        different, while the rest carry on undisturbed."""
+        changes = {
+            "cameras": sorted(changed_names(self.spec.cameras, new_spec.cameras)),
+            "detectors": sorted(changed_names(self.spec.detectors, new_spec.detectors)),
+            "processors": sorted(changed_names(self.spec.processors, new_spec.processors)),
+            "actions": sorted(self.results.apply(new_spec)),
+        }
+        restart = changes["cameras"] or changes["detectors"] or changes["processors"]
+        self.spec = new_spec
+        if restart and self._running:
+            with self._lock:
+                self._reconfiguring = True
+            try:
+                self._replan(
+                    plan_shards(new_spec, self.processes),
+                    timeout=parse_time_str(str(new_spec.runtime.scheduler.shutdown_timeout), default=10),
+                )
+            finally:
+                with self._lock:
+                    self._reconfiguring = False
+        return changes
+
+    def _replan(self, plans: list[ShardPlan], timeout: float):
+        """Switch the workers over to `plans`, restarting only those whose plan changed.
+        Shared frame slots which a worker that keeps running still uses are kept too."""
+        with self._lock:
+            old = list(self._workers)
+        keep = {index for index, plan in enumerate(plans) if index < len(old) and old[index].plan == plan}
+        self._stop_workers(timeout, [worker for worker in old if worker.index not in keep])
+        in_use = {name for index in keep for name in plans[index].publish + plans[index].subscribe}
+        self._close_slots([name for name in self._slots if name not in in_use])
+        self._create_slots(plans)
+        restarted = []
+        with self._lock:
+            self._workers = [old[index] if index in keep else _Worker(index, plan) for index, plan in enumerate(plans)]
+            for worker in self._workers:
+                if worker.index not in keep:
+                    self._start_worker(worker)
+                    restarted.append(worker.index)
+        logger.info(f"Restarted worker processes {restarted} with the new config, leaving {sorted(keep)} running")
+
+    def wait(self, timeout: float | None = None) -> bool:
+        """Block until stop_all is called.  Returns True if it was."""
+        return self._stopped.wait(timeout)
+
+    def health(self) -> dict[str, dict]:
+        """Health of each processor, by name, from whichever worker runs it."""
+        health = {
+            name: {"state": "failed", "healthy": False, "last_error": error} for name, error in self.failed.items()
+        }
+        with self._lock:
+            for worker in self._workers:
+                health.update(worker.health)
+        return health
+
+    def _stop_workers(self, timeout: float, workers: list[_Worker] | None = None) -> bool:
+        """Stop `workers` (by default all of them), killing any still running after `timeout` seconds."""
+        deadline = time.monotonic() + timeout
+        if workers is None:
+            with self._lock:
+                workers = list(self._workers)
+        for worker in workers:
+            worker.stop.set()
+        clean = True
+        for worker in workers:
+            if worker.process is None:
+                continue
+            worker.process.join(timeout=max(0.0, deadline - time.monotonic()))
+            if worker.process.is_alive():
+                logger.warning(f"Worker {worker.index} didn't stop in time, killing it")
+                worker.process.kill()
+                worker.process.join()
+                clean = False
+        return clean
+
+    def _drain(self):
+        """Handle the last results and health the workers sent on their way out."""
+        while True:
+            try:
+                self._handle(self._queue.get(timeout=0.1))
+            except queue.Empty:
+                return
+
+    def stop_all(self, timeout: float | None = None) -> bool:
+        """Stop all the workers, giving up on (and killing) any which haven't stopped after
+        `timeout` seconds.  Returns False if some had to be killed."""
+        if timeout is None:
+            timeout = parse_time_str(str(self.spec.runtime.scheduler.shutdown_timeout), default=10)
+        deadline = time.monotonic() + timeout
+        self._running = False
+        if self._collector:
+            self._collector.join()
+        clean = self._stop_workers(timeout=timeout)
+        self._close_slots(list(self._slots))
+        self._drain()
+        clean &= self.results.close(timeout=max(0.0, deadline - time.monotonic()))
+        self._stopped.set()
+        return clean
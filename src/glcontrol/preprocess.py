@@ -0,0 +1,65 @@
+import logging
+
+import cv2
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class FramePreprocessor:
+    """Shrinks frames before they get uploaded: crops to a region of interest, resizes so the
+    longest side is at most `max_dim`, and encodes to JPEG at the given quality.
+
+    The ROI is given as fractions of the frame, (left, top, right, bottom), and is cropped
+    as a view without copying.  Resizing writes into a buffer which is reused from one
+    frame to the next, so arrays returned by `prepare` are only valid until the next call.
+    """
+
+    def __init__(
+        self,
+        roi: tuple[float, float, float, float] | None = None,
+        max_dim: int | None = None,
+        jpeg_quality: int = 90,
+    ):
+        self.roi = roi
+        self.max_dim = max_dim
+        self.jpeg_quality = jpeg_quality
+        self._resize_buffer: np.ndarray | None = None
+
+    def __repr__(self):
+        return f"FramePreprocessor(roi={self.roi}, max_dim={self.max_dim}, jpeg_quality={self.jpeg_quality})"
+
+    def crop(self, frame: np.ndarray) -> np.ndarray:
+        """Crop the frame to the ROI.  Returns a view into the original frame."""
+        if not self.roi:
+            return frame
+        height, width = frame.shape[:2]
+        left, top, right, bottom = self.roi
+        return frame[int(top * height) : int(bottom * height), int(left * width) : int(right * width)]
+
+    def resize(self, frame: np.ndarray) -> np.ndarray:
+        """Shrink the frame so its longest side is at most max_dim.  Never enlarges."""
+        height, width = frame.shape[:2]
+        if not self.max_dim or max(height, width) <= self.max_dim:
+            return frame
+        scale = self.max_dim / max(height, width)
+        new_width, new_height = max(1, round(width * scale)), max(1, round(height * scale))
+        out_shape = (new_height, new_width) + frame.shape[2:]
+        if self._resize_buffer is None or self._resize_buffer.shape != out_shape:
+            self._resize_buffer = np.empty(out_shape, dtype=frame.dtype)
+        return cv2.resize(frame, (new_width, new_height), dst=self._resize_buffer, interpolation=cv2.INTER_AREA)
+
+    def prepare(self, frame: np.ndarray) -> np.ndarray:
+        """Crop and resize the frame, without encoding it."""
+        return self.resize(self.crop(frame))
+
+    def encode(self, frame: np.ndarray) -> bytes:
+        """Encode the frame as a JPEG."""
+        ok, buffer = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, self.jpeg_quality])
+        if not ok:
+            raise ValueError(f"Failed to JPEG-encode frame of shape {frame.shape}")
+        return buffer.tobytes()
+
+    def process(self, frame: np.ndarray) -> bytes:
+        """Crop, resize and encode the frame, ready to send to Groundlight."""
+        return self.encode(self.prepare(frame))
@@ -0,0 +1,253 @@
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from collections.abc import Callable
+from typing import TextIO
+
+import cv2
+import numpy as np
+from pydantic import BaseModel
+
+from glcontrol.bench import StubGroundlight
+from glcontrol.cfgtools.specs import CameraSpec, GLControlSpec
+from glcontrol.resultcache import result_confidence, result_label
+from glcontrol.runner import SpecRunner
+from glcontrol.scheduler import VirtualClock
+
+logger = logging.getLogger(__name__)
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".npy")
+
+# Further ahead than this, a video is seeked rather than decoded frame by frame
+SEEK_FRAMES = 64
+
+
+def load_image(path: str) -> np.ndarray | None:
+    """Reads an image file through a memory map, so only the one being decoded is ever in memory.
+    `.npy` files aren't decoded at all: the array is the memory-mapped file."""
+    if path.endswith(".npy"):
+        return np.load(path, mmap_mode="r")
+    return cv2.imdecode(np.memmap(path, dtype=np.uint8, mode="r"), cv2.IMREAD_COLOR)
+
+
+class ImageDirectory:
+    """A recording made of a directory of images, in filename order, one every 1/fps seconds.
+    Each image is only read when a frame from its slot is asked for."""
+
+    def __init__(self, path: str, fps: float = 1.0):
+        self.path = path
+        self.fps = fps
+        self.files = sorted(
+            os.path.join(path, name) for name in os.listdir(path) if name.lower().endswith(IMAGE_EXTENSIONS)
+        )
+        if not self.files:
+            raise ValueError(f"No images in {path}")
+        self.duration = len(self.files) / fps
+        self._index = -1
+        self._frame: np.ndarray | None = None
+
+    def __repr__(self):
+        return f"ImageDirectory('{self.path}', {len(self.files)} images @ {self.fps} fps)"
+
+    def frame_at(self, t: float) -> np.ndarray | None:
+        """The frame showing at `t` seconds into the recording, or None past the end."""
+        index = int(t * self.fps)
+        if not 0 <= index < len(self.files):
+            return None
+        if index != self._index:
+            self._frame, self._index = load_image(self.files[index]), index
+        return self._frame
+
+    def close(self):
+        self._frame = None
+
+
+class VideoFile:
+    """A recording in a video file, decoded lazily.  Frames between the ones asked for are
+    skipped without being converted, and long gaps are seeked over."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._capture = cv2.VideoCapture(path)
+        if not self._capture.isOpened():
+            raise ValueError(f"Can't open video {path}")
+        self.fps = self._capture.get(cv2.CAP_PROP_FPS) or 30.0
+        self.duration = self._capture.get(cv2.CAP_PROP_FRAME_COUNT) / self.fps
+        self._index = -1
+        self._frame: np.ndarray | None = None
+
+    def __repr__(self):
+        return f"VideoFile('{self.path}', {self.duration:.0f}s @ {self.fps} fps)"
+
+    def frame_at(self, t: float) -> np.ndarray | None:
+        """The frame showing at `t` seconds into the recording, or None past the end."""
+        index = int(t * self.fps)
+        if index == self._index:
+            return self._frame
+        if index < self._index or index - self._index > SEEK_FRAMES:
+            self._capture.set(cv2.CAP_PROP_POS_FRAMES, index)
+            self._index = index - 1
+        self._frame = None
+        while self._index < index:
+            if not self._capture.grab():
+                return None
+            self._index += 1
+        ok, frame = self._capture.retrieve()
+        self._frame = frame if ok else None
+        return self._frame
+
+    def close(self):
+        self._capture.release()
+
+
+def open_recording(path: str, fps: float = 1.0) -> ImageDirectory | VideoFile:
+    """A directory of images (at `fps`), or a video file."""
+    if os.path.isdir(path):
+        return ImageDirectory(path, fps=fps)
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"No such recording: {path}")
+    return VideoFile(path)
+
+
+class ReplayGrabber:
+    """Stands in for a framegrab FrameGrabber, returning the frame from a recording which
+    matches the clock, counting from `start`."""
+
+    def __init__(self, recording: ImageDirectory | VideoFile, clock: Callable[[], float], start: float = 0.0):
+        self.recording = recording
+        self.clock = clock
+        self.start = start
+
+    def __repr__(self):
+        return f"ReplayGrabber({self.recording!r})"
+
+    def grab(self) -> np.ndarray | None:
+        return self.recording.frame_at(self.clock() - self.start)
+
+    def release(self):
+        self.recording.close()
+
+
+class ReplayGrabberFactory:
+    """Opens the recording for each camera.  `sources` maps camera names to recordings,
+    and a recording under None is used for any camera which doesn't have its own."""
+
+    def __init__(self, sources: dict[str | None, str], clock: Callable[[], float], fps: float = 1.0):
+        self.sources = sources
+        self.clock = clock
+        self.fps = fps
+        self.start = clock()
+        self.duration = 0.0
+
+    def __call__(self, camera: CameraSpec) -> ReplayGrabber:
+        path = self.sources.get(camera.name, self.sources.get(None))
+        if path is None:
+            raise ValueError(f"No recording given for camera {camera.name}")
+        recording = open_recording(path, fps=self.fps)
+        logger.info(f"Replaying {recording!r} as camera {camera.name}")
+        self.duration = max(self.duration, recording.duration)
+        return ReplayGrabber(recording, self.clock, start=self.start)
+
+
+class ReplayLog:
+    """Writes each result to `stream` as a line of JSON, stamped with the time into the recording,
+    so that runs with different settings can be compared."""
+
+    def __init__(self, stream: TextIO, clock: Callable[[], float]):
+        self.stream = stream
+        self.clock = clock
+        self.start = clock()
+        self.counts: Counter[str] = Counter()
+        self._lock = threading.Lock()
+
+    def __call__(self, detector_name: str, result, processor: str | None = None):
+        record = {
+            "time": round(self.clock() - self.start, 3),
+            "processor": processor,
+            "detector": detector_name,
+            "label": result_label(result),
+            "confidence": result_confidence(result),
+        }
+        with self._lock:
+            self.stream.write(json.dumps(record) + "\n")
+            self.counts[processor or detector_name] += 1
+
+    def results_for(self, processor: str) -> int:
+        """How many results came from the processor, including those from each of its
+        cameras or regions, which are logged as "<processor>/<name>"."""
+        with self._lock:
+            return sum(n for name, n in self.counts.items() if name == processor or name.startswith(f"{processor}/"))
+
+
+class ProcessorReplay(BaseModel):
+    name: str
+    polls: int
+    errors: int
+    results: int
+
+
+class ReplayResult(BaseModel):
+    footage_seconds: float
+    wall_seconds: float
+    polls: int
+    results: int
+    frames_sent: int | None
+    processors: list[ProcessorReplay]
+
+    @property
+    def speedup(self) -> float:
+        return self.footage_seconds / self.wall_seconds if self.wall_seconds else float("inf")
+
+
+def run_replay(
+    spec: GLControlSpec,
+    sources: dict[str | None, str],
+    sdk=None,
+    fps: float = 1.0,
+    duration: float | None = None,
+    output: TextIO | None = None,
+) -> ReplayResult:
+    """Run `spec` against recordings instead of cameras, in virtual time, logging every
+    result to `output` as JSON lines.  By default the answers come from a StubGroundlight,
+    so nothing is sent anywhere.  `duration` defaults to the length of the longest recording."""
+    clock = VirtualClock()
+    factory = ReplayGrabberFactory(sources, clock, fps=fps)
+    stub = sdk is None
+    sdk = StubGroundlight(latency=0, seed=0) if stub else sdk
+    log = ReplayLog(output or sys.stdout, clock)
+    runner = SpecRunner(spec, sdk=sdk, grabber_factory=factory, result_handler=log, clock=clock)
+    duration = factory.duration if duration is None else duration
+    wall_start = time.monotonic()
+    try:
+        polls = runner.run_virtual(duration)
+    finally:
+        runner.stop_all()
+    return ReplayResult(
+        footage_seconds=duration,
+        wall_seconds=time.monotonic() - wall_start,
+        polls=polls,
+        results=sum(log.counts.values()),
+        frames_sent=sdk.requests if stub else None,
+        processors=[
+            ProcessorReplay(name=job.name, polls=job.runs, errors=job.errors, results=log.results_for(job.name))
+            for job in runner.scheduler.jobs
+        ],
+    )
+
+
+def format_replay_result(result: ReplayResult) -> str:
+    """Render a replay's summary as a plain-text table."""
+    header = f"{'processor':<30} {'polls':>7} {'errors':>7} {'results':>8}"
+    lines = [header, "-" * len(header)]
+    for p in result.processors:
+        lines.append(f"{p.name:<30} {p.polls:>7} {p.errors:>7} {p.results:>8}")
+    sent = "" if result.frames_sent is None else f", {result.frames_sent} frames sent to the stub"
+    lines.append(
+        f"Replayed {result.footage_seconds:.0f}s of footage in {result.wall_seconds:.1f}s"
+        f" ({result.speedup:.0f}x): {result.polls} polls, {result.results} results{sent}"
+    )
+    return "\n".join(lines)
@@ -0,0 +1,90 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+def dhash(frame: np.ndarray, hash_size: int = 8) -> int:
+    """Difference hash of a frame: a 64-bit (for hash_size=8) perceptual fingerprint.
+    Near-identical frames get hashes which differ in only a few bits.
+    """
+    height, width = frame.shape[:2]
+    # Stride down to something small first, so the resize stays cheap on big frames
+    step = max(1, min(height, width) // (hash_size * 8))
+    # Averaged over the channels, which a grayscale frame has one of once it's at least 3D
+    small = np.atleast_3d(frame[::step, ::step]).mean(axis=2, dtype=np.float32)
+    thumb = cv2.resize(small, (hash_size + 1, hash_size), interpolation=cv2.INTER_AREA)
+    bits = (thumb[:, 1:] > thumb[:, :-1]).flatten()
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+def result_confidence(result) -> float | None:
+    """Pulls the confidence out of an ImageQuery, if it has one."""
+    return getattr(getattr(result, "result", None), "confidence", None)
+
+
+def result_label(result) -> str | None:
+    """Pulls the label out of an ImageQuery, if it has one."""
+    label = getattr(getattr(result, "result", None), "label", None)
+    return getattr(label, "value", label)
+
+
+class ResultCache:
+    """LRU cache of detector results, keyed by the perceptual hash of the frame they were for.
+
+    A lookup matches any entry whose hash is within `max_distance` bits of the frame's hash,
+    and younger than `ttl` seconds.  Only results with confidence of at least `min_confidence`
+    get stored, so uncertain answers are always asked again.
+    """
+
+    def __init__(self, max_entries: int = 128, ttl: float = 300, max_distance: int = 4, min_confidence: float = 0.9):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_distance = max_distance
+        self.min_confidence = min_confidence
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[int, tuple[object, float]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return f"ResultCache(entries={len(self._entries)}, hits={self.hits}, misses={self.misses})"
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, frame_hash: int, now: float | None = None):
+        """Returns a cached result for a near-identical frame, or None."""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            best_key, best_distance = None, self.max_distance + 1
+            for key, (_, stored_at) in list(self._entries.items()):
+                if now - stored_at > self.ttl:
+                    del self._entries[key]
+                    continue
+                distance = (key ^ frame_hash).bit_count()
+                if distance < best_distance:
+                    best_key, best_distance = key, distance
+            if best_key is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(best_key)
+            self.hits += 1
+            return self._entries[best_key][0]
+
+    def put(self, frame_hash: int, result, now: float | None = None):
+        """Stores the result, if it's confident enough."""
+        confidence = result_confidence(result)
+        if confidence is None or confidence < self.min_confidence:
+            return
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            self._entries[frame_hash] = (result, now)
+            self._entries.move_to_end(frame_hash)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
@@ -0,0 +1,99 @@
+import logging
+import threading
+from collections.abc import Callable
+
+from groundlight import Groundlight
+
+from glcontrol.cfgtools.specs import RoutingPolicy
+from glcontrol.metrics import REGISTRY
+from glcontrol.resultcache import result_confidence
+
+logger = logging.getLogger(__name__)
+
+ROUTED_REQUESTS = REGISTRY.counter(
+    "glcontrol_routed_requests_total", "Inference requests by where they were answered", ("route",)
+)
+
+
+class _Route:
+    __slots__ = ("policy", "escalate_below")
+
+    def __init__(self, policy: RoutingPolicy, escalate_below: float):
+        self.policy = policy
+        self.escalate_below = escalate_below
+
+
+class InferenceRouter:
+    """Decides, detector by detector, whether frames go to a local edge endpoint or the cloud.
+
+    The policies are:
+    - `cloud-only`: straight to the cloud, as if there were no edge endpoint.
+    - `local-only`: only ever the edge endpoint.
+    - `local-first`: the edge endpoint, falling back to the cloud if it fails.
+    - `local-escalate`: the edge endpoint, escalating to the cloud when it fails or its
+      answer's confidence is below the detector's `escalate_below`.
+
+    Without an `edge` client, every detector is cloud-only.  Anything other than asking
+    goes to the cloud, which is where detectors are created.
+    """
+
+    def __init__(self, cloud: Groundlight, edge: Groundlight | None = None):
+        self.cloud = cloud
+        self.edge = edge
+        self._routes: dict[str, _Route] = {}
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return f"InferenceRouter(cloud={self.cloud!r}, edge={self.edge!r})"
+
+    def __getattr__(self, name: str):
+        # Only called for attributes we don't have, like `endpoint` or get_or_create_detector
+        return getattr(self.cloud, name)
+
+    def set_route(self, detector_id: str, policy: RoutingPolicy, escalate_below: float = 0.9):
+        """Set the routing policy for a detector."""
+        if policy != RoutingPolicy.cloud_only and self.edge is None:
+            logger.warning(f"No edge endpoint is configured, so detector {detector_id} will use the cloud")
+            policy = RoutingPolicy.cloud_only
+        with self._lock:
+            self._routes[detector_id] = _Route(policy, escalate_below)
+
+    def _route(self, method: str, detector, image, **kwargs):
+        detector_id = getattr(detector, "id", detector)
+        route = self._routes.get(detector_id)
+        if route is None or route.policy == RoutingPolicy.cloud_only:
+            ROUTED_REQUESTS.labels("cloud").inc()
+            return getattr(self.cloud, method)(detector, image, **kwargs)
+        ask_edge: Callable = getattr(self.edge, method)
+        if route.policy == RoutingPolicy.local_only:
+            ROUTED_REQUESTS.labels("edge").inc()
+            return ask_edge(detector, image, **kwargs)
+        try:
+            result = ask_edge(detector, image, **kwargs)
+        except Exception as e:
+            logger.debug("Edge endpoint failed for %s, asking the cloud instead: %r", detector_id, e)
+            ROUTED_REQUESTS.labels("fallback").inc()
+            return getattr(self.cloud, method)(detector, image, **kwargs)
+        if route.policy == RoutingPolicy.local_escalate:
+            confidence = result_confidence(result)
+            if confidence is None or confidence < route.escalate_below:
+                ROUTED_REQUESTS.labels("escalated").inc()
+                return getattr(self.cloud, method)(detector, image, **kwargs)
+        ROUTED_REQUESTS.labels("edge").inc()
+        return result
+
+    def ask_ml(self, detector, image, **kwargs):
+        return self._route("ask_ml", detector, image, **kwargs)
+
+    def ask_confident(self, detector, image, **kwargs):
+        return self._route("ask_confident", detector, image, **kwargs)
+
+    def close(self, timeout: float | None = None):
+        for client in (self.cloud, self.edge):
+            if hasattr(client, "close"):
+                client.close(timeout=timeout)
+
+
+def edge_connect(endpoint: str) -> Groundlight:
+    """Connect to a Groundlight Edge Endpoint, which speaks the same API as the cloud."""
+    return Groundlight(endpoint=endpoint)
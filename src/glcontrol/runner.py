@@ -1,16 +1,65 @@
 import logging
 import threading
 import time
+from collections.abc import Callable
+from concurrent.futures import Future, ThreadPoolExecutor
+from types import SimpleNamespace
 from typing import Dict, Type
 
 import framegrab
 from framegrab.cli.clitools import preview_image
 from groundlight import Groundlight
 
-from glcontrol.cfgtools.specs import CameraSpec, ControlLoopSpec, DetectorSpec, GLControlSpec
+from glcontrol.actions import Action, ActionPool, ActionRT, ActionTrigger
+from glcontrol.cfgtools.specs import (
+    ActionSpec,
+    CameraSpec,
+    ClientSpec,
+    ControlLoopSpec,
+    DetectorSpec,
+    GLControlSpec,
+    MotionDetectionSpec,
+    PollSpec,
+    PreprocessSpec,
+    RegionSpec,
+    RuleSpec,
+)
+from glcontrol.client import FrameSpool, ResilientClient, is_not_found, tune_sdk
+from glcontrol.clips import FrameBuffer, buffer_budgets
+from glcontrol.composite import Rule
+from glcontrol.dispatch import DispatchError, InferenceDispatcher
+from glcontrol.history import ResultHistory
+from glcontrol.lifecycle import CancellationToken, LoopCancelledError, LoopHealth
+from glcontrol.metrics import REGISTRY
+from glcontrol.motion import MotionGate
+from glcontrol.preprocess import FramePreprocessor
+from glcontrol.resultcache import ResultCache, dhash, result_confidence, result_label
+from glcontrol.routing import InferenceRouter, edge_connect
+from glcontrol.scheduler import AdaptiveInterval, ScheduledJob, Scheduler
+from glcontrol.startup import DetectorCache, run_parallel
+from glcontrol.watchdog import CameraError, FrameCheck, GrabberWatchdog
 
 logger = logging.getLogger(__name__)
 
+GRAB_SECONDS = REGISTRY.histogram("glcontrol_grab_seconds", "Time to grab a frame from a camera", ("camera",))
+PREPROCESS_SECONDS = REGISTRY.histogram(
+    "glcontrol_preprocess_seconds", "Time to crop, resize and encode a frame", ("processor",)
+)
+INFERENCE_SECONDS = REGISTRY.histogram(
+    "glcontrol_inference_seconds", "Time waiting for an answer from Groundlight", ("processor",)
+)
+STORE_RESULT_SECONDS = REGISTRY.histogram(
+    "glcontrol_store_result_seconds", "Time to store a detector result", ("processor",)
+)
+LOOP_PERIOD_SECONDS = REGISTRY.histogram(
+    "glcontrol_loop_period_seconds", "Time between the starts of successive polls", ("processor",)
+)
+LOOP_DURATION_SECONDS = REGISTRY.histogram("glcontrol_loop_duration_seconds", "Time taken by one poll", ("processor",))
+LOOP_ERRORS = REGISTRY.counter("glcontrol_loop_errors_total", "Polls which raised an exception", ("processor",))
+SKIPPED_FRAMES = REGISTRY.counter(
+    "glcontrol_skipped_frames_total", "Frames which weren't sent to Groundlight", ("processor", "reason")
+)
+
 
 def sdk_connect() -> Groundlight:
     """Connect to the Groundlight SDK."""
@@ -47,22 +96,40 @@ def parse_time_str(time_str: str = None, default: float = 60.0) -> float:
         return num * 60
     elif unit in ("h", "hr", "hour", "hours"):
         return num * 60 * 60
+    elif unit in ("d", "day", "days"):
+        return num * 60 * 60 * 24
     else:
         raise ValueError(f"Unrecognized time string: {time_str}")
 
 
 class DetectorRT:
     """Interprets a DetectorSpec and creates it in the SDK.
-    This class also stores a registry of all the detectors by name.
+    This class also stores a registry of all the detectors by name, which the runner
+    adds each one to once it's been set up.
     """
 
     registry: dict[str, "DetectorRT"] = {}
 
-    def __init__(self, spec: DetectorSpec, sdk: Groundlight):
+    def __init__(
+        self,
+        spec: DetectorSpec,
+        sdk: Groundlight,
+        detector_cache: DetectorCache | None = None,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        """`clock` is what the result cache's ttl is measured with."""
         self.sdk = sdk
         self.spec = spec
-        self.detector = self._init_detector()
-        self.registry[spec.name] = self
+        self.clock = clock
+        self.detector = None
+        self.detector_cache = detector_cache
+        self.from_cache = False
+        self._lock = threading.Lock()
+        self.detector_id = self._init_detector(detector_cache)
+        self.on_result: Callable[[str, object, str | None], None] | None = None
+        # Called with this detector when its ID changes, after the cached one turned out to be stale
+        self.on_resolved: Callable[["DetectorRT"], None] | None = None
+        self.result_cache = self._init_result_cache()
         self._last_result = None
 
     @classmethod
@@ -70,47 +137,237 @@ class DetectorRT:
         """Get a detector by name."""
         return cls.registry[name]
 
-    def _init_detector(self) -> "Detector":
-        """Instantiate the detector using the spec."""
-        out = self.sdk.get_or_create_detector(
+    def _init_detector(self, detector_cache: DetectorCache | None = None) -> str:
+        """Instantiate the detector using the spec, and return its ID.
+        If the ID is in the detector cache, the API isn't called at all, and `self.detector` stays None.
+        """
+        if detector_cache:
+            detector_id = detector_cache.get(self._cache_key())
+            if detector_id:
+                logger.debug(f"Found detector {self.spec.name} in cache: {detector_id}")
+                self.from_cache = True
+                return detector_id
+        return self._resolve(detector_cache)
+
+    def _cache_key(self) -> str:
+        return DetectorCache.key(
+            self.spec.name, self.spec.query, self.spec.confidence_threshold, getattr(self.sdk, "endpoint", "")
+        )
+
+    def _resolve(self, detector_cache: DetectorCache | None = None) -> str:
+        self.detector = self.sdk.get_or_create_detector(
             name=self.spec.name, query=self.spec.query, confidence_threshold=self.spec.confidence_threshold
         )
-        return out
+        if detector_cache:
+            detector_cache.put(self._cache_key(), self.detector.id)
+        return self.detector.id
+
+    def recover(self, exc: BaseException, detector_id: str) -> bool:
+        """Called when a request to `detector_id` failed with `exc`.  If the ID came from the
+        detector cache and the server doesn't know it (say the detector was deleted and made
+        again), the stale entry is dropped and the detector looked up afresh, so the next
+        request goes to the right place.  Returns True if the ID changed."""
+        if not is_not_found(exc):
+            return False
+        with self._lock:
+            # Only the first of the requests which failed together needs to look it up
+            if not self.from_cache or detector_id != self.detector_id:
+                return False
+            logger.warning(f"Cached ID {detector_id} for detector {self.spec.name} wasn't found, looking it up again")
+            self.detector_cache.drop(self._cache_key())
+            try:
+                self.detector_id = self._resolve(self.detector_cache)
+            except Exception:
+                logger.exception(f"Failed to look up detector {self.spec.name} again")
+                return False
+            self.from_cache = False
+        logger.info(f"Found detector: {self}")
+        if self.on_resolved:
+            self.on_resolved(self)
+        return True
+
+    def _init_result_cache(self) -> ResultCache | None:
+        """Set up the cache of answers for near-identical frames, if the spec asks for one."""
+        cache_spec = self.spec.result_cache
+        if not cache_spec:
+            return None
+        return ResultCache(
+            max_entries=cache_spec.max_entries,
+            ttl=parse_time_str(str(cache_spec.ttl)),
+            max_distance=cache_spec.max_distance,
+            min_confidence=cache_spec.min_confidence,
+        )
 
     def __repr__(self):
-        d_id = self.detector.id if self.detector else "None"
-        return f"DetectorRT('{self.spec.name}', id={d_id})"
+        return f"DetectorRT('{self.spec.name}', id={self.detector_id})"
 
-    def store_result(self, result: dict):
-        """Store the result in the detector."""
+    def frame_hash(self, frame) -> int | None:
+        """Perceptual hash of the frame, or None if this detector doesn't cache results."""
+        if self.result_cache is None or frame is None:
+            return None
+        return dhash(frame)
+
+    def cached_result(self, frame_hash: int | None):
+        """A recent confident result for a near-identical frame, if there is one."""
+        if frame_hash is None:
+            return None
+        return self.result_cache.get(frame_hash, now=self.clock())
+
+    def store_result(self, result: dict, frame_hash: int | None = None, processor: str | None = None):
+        """Store the result in the detector, and pass it on to `on_result` if that's set."""
         self._last_result = result
+        if frame_hash is not None:
+            self.result_cache.put(frame_hash, result, now=self.clock())
+        if self.on_result:
+            try:
+                self.on_result(self.spec.name, result, processor)
+            except Exception:
+                logger.exception("Failed to pass on the result from %s", self)
+
+
+def create_grabber(spec: CameraSpec) -> "framegrab.FrameGrabber":
+    """Open the camera using framegrab."""
+    camera_d = spec.model_dump(exclude={"frame_cache"})
+    return framegrab.FrameGrabber.create_grabber(camera_d)
 
 
 class ImageSourceRT:
     """Interprets a CameraSpec and creates it using framegrab.
-    This class also stores a registry of all the cameras by name.
+    This class also stores a registry of all the cameras by name, which the runner
+    adds each one to once it's open.
+
+    If the camera has a `frame_cache`, the latest frame is shared between all the
+    processors reading from it, so the camera is only decoded once per `max_age`.
+    Cached frames are handed out without copying, and are marked read-only.
     """
 
     registry: dict[str, "ImageSourceRT"] = {}
 
-    def __init__(self, spec: CameraSpec):
+    def __init__(
+        self,
+        spec: CameraSpec,
+        grabber: "framegrab.FrameGrabber | None" = None,
+        grabber_factory: Callable[[CameraSpec], "framegrab.FrameGrabber"] | None = None,
+        clock: Callable[[], float] = time.monotonic,
+        buffer_bytes: int = 0,
+    ):
+        """`grabber_factory` opens the camera (by default with framegrab), and is called
+        again whenever the watchdog finds it's stopped working.  `grabber` is an
+        already-open one to start with.  `clock` is what the frame cache's max_age is
+        measured with.  With `buffer_bytes`, every frame grabbed is kept in a FrameBuffer
+        of that size."""
         self.spec = spec
-        logger.info(f"Setting up camera: {spec.name}")
-        camera_d = spec.model_dump()
-        self.grabber = framegrab.FrameGrabber.create_grabber(camera_d)
-        self.registry[spec.name] = self
+        self.clock = clock
+        self.buffer = FrameBuffer(spec.name, buffer_bytes) if buffer_bytes else None
+        try:
+            self.watchdog = self._setup_watchdog(grabber, grabber_factory or create_grabber)
+        except Exception:
+            if self.buffer:
+                self.buffer.close()
+            raise
+        self.max_age = parse_time_str(str(spec.frame_cache.max_age), default=0)
+        self._grab_seconds = GRAB_SECONDS.labels(spec.name)
+        self.frame_time = 0.0
+        self._frame = None
+        self._cache_lock = threading.Lock()
+        self._grab_lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
+        if spec.frame_cache.background:
+            self.interval = parse_time_str(str(spec.frame_cache.interval or ""), default=self.max_age or 1.0)
+            if self.max_age <= 0:
+                self.max_age = 2 * self.interval
+            self._start_background_grabber()
+
+    def _setup_watchdog(self, grabber, grabber_factory: Callable) -> GrabberWatchdog:
+        watchdog_spec = self.spec.watchdog
+        grab_timeout, stale_after = watchdog_spec.grab_timeout, watchdog_spec.stale_after
+        return GrabberWatchdog(
+            self.spec.name,
+            lambda: grabber_factory(self.spec),
+            grabber=grabber,
+            check=FrameCheck(
+                blank_std=watchdog_spec.blank_std,
+                stale_after=parse_time_str(str(stale_after)) if stale_after is not None else None,
+            ),
+            grab_timeout=parse_time_str(str(grab_timeout)) if grab_timeout is not None else None,
+            max_failures=watchdog_spec.max_failures,
+            backoff=parse_time_str(str(watchdog_spec.backoff), default=1),
+            max_backoff=parse_time_str(str(watchdog_spec.max_backoff), default=300),
+        )
+
+    @property
+    def grabber(self) -> "framegrab.FrameGrabber":
+        """The camera's current grabber, which changes if the watchdog reopens it."""
+        return self.watchdog.grabber
 
     @classmethod
     def by_name(cls, name: str) -> "ImageSourceRT":
         """Get a camera by name."""
-        print(f"looking up {name} in {cls}")
         return cls.registry[name]
 
     def grab(self) -> "framegrab.Frame":
-        """Grab a frame from the camera."""
-        frame = self.grabber.grab()
+        """Grab a frame from the camera, or return the cached one if it's fresh enough."""
+        if self.max_age <= 0 and not self._thread:
+            with self._grab_lock, self._grab_seconds.time():
+                frame = self.watchdog.grab()
+            if self.buffer is not None:
+                self.buffer.append(frame)
+            return frame
+        frame = self._cached_frame()
+        if frame is not None:
+            return frame
+        with self._grab_lock:
+            # Another consumer might have refreshed the frame while we waited for the lock
+            frame = self._cached_frame()
+            if frame is not None:
+                return frame
+            return self._refresh()
+
+    def _cached_frame(self) -> "framegrab.Frame | None":
+        """Returns the cached frame if it's younger than max_age, otherwise None."""
+        with self._cache_lock:
+            if self._frame is not None and self.clock() - self.frame_time <= self.max_age:
+                return self._frame
+        return None
+
+    def _refresh(self) -> "framegrab.Frame":
+        """Grab a new frame into the cache.  Caller must hold the grab lock."""
+        with self._grab_seconds.time():
+            frame = self.watchdog.grab()
+        frame.flags.writeable = False
+        with self._cache_lock:
+            self._frame = frame
+            self.frame_time = self.clock()
+        if self.buffer is not None:
+            self.buffer.append(frame)
         return frame
 
+    def _start_background_grabber(self):
+        """Start a thread which keeps the cached frame fresh."""
+        self._thread = threading.Thread(target=self._background_grab, name=f"grabber-{self.spec.name}", daemon=True)
+        self._thread.start()
+
+    def _background_grab(self):
+        while not self._stop_event.is_set():
+            try:
+                with self._grab_lock:
+                    self._refresh()
+            except CameraError as e:
+                logger.debug("Background grab failed for %s: %s", self, e)
+            except Exception:
+                logger.exception("Background grab failed for %s", self)
+            self._stop_event.wait(self.interval)
+
+    def close(self):
+        """Stop the background grabber (if any) and release the camera."""
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join(timeout=self.interval + 1)
+        self.watchdog.release()
+        if self.buffer is not None:
+            self.buffer.close()
+
     def __repr__(self):
         return f"ImageSourceRT('{self.spec.name}')"
 
@@ -145,16 +402,36 @@ class ControlLoop(metaclass=ControlLoopRegistry):
     registry_name: str = "abstract-base"
     spec: ControlLoopSpec
     sdk: Groundlight
+    dispatcher: InferenceDispatcher | None
 
-    def __init__(self, spec: ControlLoopSpec, sdk: Groundlight):
+    def __init__(self, spec: ControlLoopSpec, sdk: Groundlight, dispatcher: InferenceDispatcher | None = None):
         self.spec = spec
         self.sdk = sdk
+        self.dispatcher = dispatcher
+        self.poll = self._setup_poll()
+        self.adaptive = self._setup_adaptive()
+        self.poll_delay = self.adaptive.slowest if self.adaptive else parse_time_str(str(self.poll.every), default=60)
+        self.cancel_token = CancellationToken()
+        # What motion gating goes by.  The runner replaces it with its own clock.
+        self.clock: Callable[[], float] = time.monotonic
+        # Where results the loop works out itself, rather than getting from a detector, go
+        self.on_result: Callable[[str, object, str | None], None] | None = None
+        self.health = LoopHealth(self.poll_delay)
+        self._last_tick: float | None = None
+        self._loop_period = LOOP_PERIOD_SECONDS.labels(spec.name)
+        self._loop_duration = LOOP_DURATION_SECONDS.labels(spec.name)
+        self._loop_errors = LOOP_ERRORS.labels(spec.name)
+        self._preprocess_seconds = PREPROCESS_SECONDS.labels(spec.name)
+        self._inference_seconds = INFERENCE_SECONDS.labels(spec.name)
+        self._store_result_seconds = STORE_RESULT_SECONDS.labels(spec.name)
 
     def __repr__(self):
         return f"ControlLoop<type={self.registry_name}, name='{self.spec.name}'>"
 
     @staticmethod
-    def from_spec(spec: ControlLoopSpec, sdk: Groundlight) -> "ControlLoop":
+    def from_spec(
+        spec: ControlLoopSpec, sdk: Groundlight, dispatcher: InferenceDispatcher | None = None
+    ) -> "ControlLoop":
         """
         Factory method to instantiate subclasses based on their registration name.
         """
@@ -162,19 +439,233 @@ class ControlLoop(metaclass=ControlLoopRegistry):
         if name not in ControlLoopRegistry.registry:
             raise ValueError(f"Unknown control type '{name}'")
         cls = ControlLoopRegistry.registry[name]
-        return cls(spec, sdk)
+        return cls(spec, sdk, dispatcher)
+
+    def run_once(self):
+        """
+        A single iteration of the control loop.  The SpecRunner's scheduler calls this every poll.
+        """
+        raise NotImplementedError("ControlLoop subclasses must implement run_once")
+
+    def tick(self) -> float | None:
+        """
+        Runs one iteration with run_once, recording how long it took and whether it failed.
+        With adaptive polling, returns how long to wait before the next one.
+        """
+        if self.cancel_token.cancelled:
+            return None
+        start = time.monotonic()
+        if self._last_tick is not None:
+            self._loop_period.observe(start - self._last_tick)
+        self._last_tick = start
+        self.health.started()
+        try:
+            self.run_once()
+            self.health.succeeded()
+        except LoopCancelledError:
+            logger.debug("Poll of %s cancelled", self.spec.name)
+        except Exception as e:
+            self.health.failed(e)
+            self._loop_errors.inc()
+            raise
+        finally:
+            self._loop_duration.observe(time.monotonic() - start)
+            if self.cancel_token.cancelled:
+                self.health.stopped()
+        return self.adaptive.delay if self.adaptive else None
+
+    def skip_frame(self, reason: str):
+        """
+        Count a frame which wasn't sent to Groundlight.
+        """
+        SKIPPED_FRAMES.labels(self.spec.name, reason).inc()
 
     def run_loop(self):
         """
-        Main loop for the control loop.
+        Runs the control loop in the current thread, at a fixed rate, until stop_loop is called.
         """
-        raise NotImplementedError("ControlLoop subclasses must implement run_loop")
+        logger.info(f"Starting control loop: {self.spec.name}")
+        next_run = time.monotonic()
+        while not self.cancel_token.cancelled:
+            delay = self.tick()
+            if delay is not None:
+                self.cancel_token.wait(delay)
+                next_run = time.monotonic()
+                continue
+            next_run += self.poll_delay
+            now = time.monotonic()
+            if next_run < now:
+                # Overran, so skip the slots we missed rather than running back-to-back
+                next_run += ((now - next_run) // self.poll_delay + 1) * self.poll_delay
+            self.cancel_token.wait(next_run - now)
 
     def stop_loop(self):
         """
-        Stop the loop.
+        Stop the loop.  A poll which is waiting on Groundlight gives up straight away.
+        """
+        self.cancel_token.cancel()
+        self.health.stopped()
+
+    def _setup_poll(self) -> PollSpec:
+        """
+        Reads the poll schedule from the options.  Accepts `poll: {every: 60 sec}`,
+        the shorthand `poll: every 60 sec`, or the older `poll_delay: 60 sec`.
+        """
+        poll = self.spec.options.get("poll")
+        if poll is None:
+            return PollSpec(every=self.spec.options.get("poll_delay") or 60)
+        if isinstance(poll, str):
+            return PollSpec(every=poll.removeprefix("every").strip())
+        return PollSpec(**poll)
+
+    def _setup_adaptive(self) -> AdaptiveInterval | None:
+        """
+        Creates the adaptive interval if `poll.adaptive` is set.
+        """
+        adaptive = self.poll.adaptive
+        if adaptive is None:
+            return None
+        return AdaptiveInterval(
+            fastest=parse_time_str(str(adaptive.fastest), default=5),
+            slowest=parse_time_str(str(adaptive.slowest), default=300),
+            backoff=adaptive.backoff,
+            min_confidence=adaptive.min_confidence,
+        )
+
+    def _ask(self, detector_rt: DetectorRT, frame):
+        """
+        Send the frame to the detector, through the dispatcher if there is one.
+        """
+        self.cancel_token.raise_if_cancelled()
+        detector_id = detector_rt.detector_id
+        try:
+            if self.dispatcher:
+                return self.cancel_token.result(
+                    self.dispatcher.submit(detector_id, frame, cancel_token=self.cancel_token)
+                )
+            return self.sdk.ask_ml(detector_id, frame)
+        except Exception as e:
+            detector_rt.recover(e, detector_id)
+            raise
+
+    def _detect(self, detector_rt: DetectorRT, frame, preprocessor: FramePreprocessor | None = None):
+        """
+        Preprocess the frame and get the detector's answer for it, reusing a cached
+        answer if the detector has one for a near-identical frame.
         """
-        raise NotImplementedError("ControlLoop subclasses can implement stop_loop")
+        result, image, frame_hash = self._prepare_request(detector_rt, frame, preprocessor)
+        if result is not None:
+            return result
+        logger.debug("Sending frame to %s", detector_rt)
+        with self._inference_seconds.time():
+            result = self._ask(detector_rt, image)
+        with self._store_result_seconds.time():
+            detector_rt.store_result(result, frame_hash, processor=self.spec.name)
+        return result
+
+    def _prepare_request(
+        self,
+        detector_rt: DetectorRT,
+        frame,
+        preprocessor: FramePreprocessor | None = None,
+        processor: str | None = None,
+    ):
+        """
+        Preprocess the frame for the detector.  Returns (cached_result, None, None) if the
+        detector already has an answer for a near-identical frame, and otherwise
+        (None, image_to_send, frame_hash).  A cached answer is passed on as coming from
+        `processor`, by default this loop.
+        """
+        with self._preprocess_seconds.time():
+            prepared = preprocessor.prepare(frame) if preprocessor else frame
+            frame_hash = detector_rt.frame_hash(prepared)
+        result = detector_rt.cached_result(frame_hash)
+        if result is not None:
+            # Don't re-cache it, or a static scene would keep the entry alive forever
+            logger.debug("Reusing cached result for %s", detector_rt)
+            self.skip_frame("cached")
+            detector_rt.store_result(result, processor=processor or self.spec.name)
+            return result, None, None
+        with self._preprocess_seconds.time():
+            image = preprocessor.encode(prepared) if preprocessor else frame
+        return None, image, frame_hash
+
+    def _detect_batch(
+        self, requests: dict[str, tuple[DetectorRT, object, FramePreprocessor | None]], errors: dict[str, Exception]
+    ) -> dict[str, object]:
+        """
+        Ask about several frames at once, submitting all of them before waiting on any of the answers.
+        `requests` maps a name to the detector, frame and preprocessor for it.  Returns the answers
+        by name.  Failures go into `errors`.  Each answer is passed on as coming from
+        "<processor>/<name>", so the history and actions can tell the cameras or regions apart.
+        """
+        self.cancel_token.raise_if_cancelled()
+        results = {}
+        pending = {}
+        for name, (detector_rt, frame, preprocessor) in requests.items():
+            result, image, frame_hash = self._prepare_request(
+                detector_rt, frame, preprocessor, processor=f"{self.spec.name}/{name}"
+            )
+            if result is not None:
+                results[name] = result
+                continue
+            try:
+                pending[name] = (detector_rt, detector_rt.detector_id, self._submit(detector_rt, image), frame_hash)
+            except DispatchError as e:
+                logger.warning("Couldn't submit the frame for %s: %r", name, e)
+                errors[name] = e
+        if not pending:
+            return results
+        logger.debug("Sending %d frames from %s", len(pending), self.spec.name)
+        with self._inference_seconds.time():
+            for name, (detector_rt, detector_id, future, frame_hash) in pending.items():
+                try:
+                    results[name] = self.cancel_token.result(future)
+                except LoopCancelledError:
+                    raise
+                except Exception as e:
+                    logger.warning("Failed to get an answer for %s: %r", name, e)
+                    errors[name] = e
+                    detector_rt.recover(e, detector_id)
+                    continue
+                with self._store_result_seconds.time():
+                    detector_rt.store_result(results[name], frame_hash, processor=f"{self.spec.name}/{name}")
+        return results
+
+    def _adapt(self, results: dict[str, object]):
+        """
+        With adaptive polling, update the interval from a poll's answers by name.
+        """
+        if self.adaptive:
+            self.adaptive.observe_many(
+                {name: (result_label(result), result_confidence(result)) for name, result in results.items()}
+            )
+
+    def _submit(self, detector_rt: DetectorRT, image) -> Future:
+        """
+        Send the image to the detector without waiting for the answer.
+        """
+        if self.dispatcher:
+            return self.dispatcher.submit(detector_rt.detector_id, image, cancel_token=self.cancel_token)
+        future = Future()
+        try:
+            future.set_result(self.sdk.ask_ml(detector_rt.detector_id, image))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+    def camera_names(self) -> list[str]:
+        """
+        Names of the cameras this loop reads from.
+        """
+        return [entry["camera"] for entry in self.spec.inputs if isinstance(entry, dict) and "camera" in entry]
+
+    def detector_names(self) -> list[str]:
+        """
+        Names of the detectors this loop sends images to.
+        """
+        detector = self.spec.options.get("detector")
+        return [detector] if detector else []
 
     def _setup_camera(self) -> ImageSourceRT:
         """
@@ -207,29 +698,401 @@ class ControlLoop(metaclass=ControlLoopRegistry):
         """
         return DetectorRT.by_name(self.spec.options["detector"])
 
+    def _setup_motion_gate(self) -> MotionGate | None:
+        """
+        Creates a motion gate if `motion-detection` is enabled in the options.
+        """
+        motion_spec = MotionDetectionSpec(**self.spec.options.get("motion-detection", {}))
+        if not motion_spec.enabled:
+            return None
+        return MotionGate(
+            val_threshold=motion_spec.val_threshold,
+            pct_threshold=motion_spec.pct_threshold,
+            max_skip=parse_time_str(str(motion_spec.max_skip)),
+            max_dim=motion_spec.max_dim,
+        )
+
+    def _setup_preprocessor(self) -> FramePreprocessor | None:
+        """
+        Creates a preprocessor if `preprocess` is set in the options.
+        """
+        if "preprocess" not in self.spec.options:
+            return None
+        preprocess_spec = PreprocessSpec(**self.spec.options["preprocess"])
+        return FramePreprocessor(
+            roi=preprocess_spec.roi.as_tuple() if preprocess_spec.roi else None,
+            max_dim=preprocess_spec.max_dim,
+            jpeg_quality=preprocess_spec.jpeg_quality,
+        )
+
 
 class SimpleCameraDetectorLoop(ControlLoop):
     registry_name = "simple-camera-detector"  # Explicitly defining the registration name
 
-    def __init__(self, spec: ControlLoopSpec, sdk: Groundlight):
-        super().__init__(spec, sdk)
+    def __init__(self, spec: ControlLoopSpec, sdk: Groundlight, dispatcher: InferenceDispatcher | None = None):
+        super().__init__(spec, sdk, dispatcher)
         self.camera = self._setup_camera()
         self.detector_rt = self._setup_detector()
-        self.poll_delay = parse_time_str(self.spec.options["poll_delay"], default=60)
+        self.motion_gate = self._setup_motion_gate()
+        self.preprocessor = self._setup_preprocessor()
+
+    def run_once(self):
+        """Grab a single frame and send it to the detector, unless motion gating skips it."""
+        frame = self.camera.grab()
+        if self.motion_gate and not self.motion_gate.should_submit(frame, now=self.clock()):
+            logger.debug("No motion on %s, skipping frame", self.camera)
+            self.skip_frame("no-motion")
+            if self.adaptive:
+                self.adaptive.unchanged()
+            return
+        if self.spec.options.get("log_images"):
+            preview_image(frame, title=self.spec.name, output_type=self.spec.options["log_images"])
+        # TODO: make the `ask_*` type configurable
+        result = self._detect(self.detector_rt, frame, self.preprocessor)
+        logger.debug("Got result: %s", result)
+        if self.adaptive:
+            self.adaptive.observe(result_label(result), result_confidence(result))
+
+
+class MultiCameraDetectorLoop(ControlLoop):
+    """
+    Sends frames from several cameras to one detector, as a single scheduled job.
+
+    Each poll grabs from all the cameras in parallel, then submits all the frames at
+    once and collects the answers, so a group of cameras costs one schedule slot rather
+    than one per camera.  The latest answer for each camera is kept in `results`.
+    A camera which fails doesn't stop the others from being checked, but the poll
+    is still counted as failed.
+    """
+
+    registry_name = "multi-camera-detector"
+
+    def __init__(self, spec: ControlLoopSpec, sdk: Groundlight, dispatcher: InferenceDispatcher | None = None):
+        super().__init__(spec, sdk, dispatcher)
+        self.cameras = self._setup_cameras()
+        if not self.cameras:
+            raise ValueError(f"Processor {spec.name} needs at least one camera input")
+        self.detector_rt = self._setup_detector()
+        self.motion_gates = {camera.spec.name: self._setup_motion_gate() for camera in self.cameras}
+        self.preprocessor = self._setup_preprocessor()
+        max_parallel = self.spec.options.get("max_parallel", 8)
+        self._pool = ThreadPoolExecutor(
+            max_workers=min(len(self.cameras), max_parallel), thread_name_prefix=f"{spec.name}-grab"
+        )
+        self.results: dict[str, object] = {}
+
+    def run_once(self) -> dict[str, object]:
+        """Grab from every camera, ask the detector about each new frame, and return the answers by camera name."""
+        errors: dict[str, Exception] = {}
+        frames = self._grab_all(errors)
+        frames = {name: frame for name, frame in frames.items() if self._should_submit(name, frame)}
+        results = self._detect_batch(
+            {name: (self.detector_rt, frame, self.preprocessor) for name, frame in frames.items()}, errors
+        )
+        self.results.update(results)
+        for name, result in results.items():
+            logger.debug("Got result for %s: %s", name, result)
+        self._adapt(results)
+        if errors:
+            raise RuntimeError(f"{len(errors)} of {len(self.cameras)} cameras failed: {errors}")
+        return results
+
+    def _grab_all(self, errors: dict[str, Exception]) -> dict[str, "framegrab.Frame"]:
+        """Grab a frame from each camera in parallel.  Failures go into `errors`."""
+        futures = {camera.spec.name: self._pool.submit(camera.grab) for camera in self.cameras}
+        frames = {}
+        for name, future in futures.items():
+            try:
+                frames[name] = self.cancel_token.result(future)
+            except LoopCancelledError:
+                raise
+            except Exception as e:
+                logger.warning("Failed to grab from %s: %r", name, e)
+                errors[name] = e
+        return frames
+
+    def _should_submit(self, name: str, frame) -> bool:
+        motion_gate = self.motion_gates[name]
+        if motion_gate and not motion_gate.should_submit(frame, now=self.clock()):
+            logger.debug("No motion on %s, skipping frame", name)
+            self.skip_frame("no-motion")
+            return False
+        if self.spec.options.get("log_images"):
+            preview_image(frame, title=f"{self.spec.name}/{name}", output_type=self.spec.options["log_images"])
+        return True
+
+    def _submit(self, detector_rt: DetectorRT, image) -> Future:
+        if self.dispatcher:
+            return self.dispatcher.submit(detector_rt.detector_id, image, cancel_token=self.cancel_token)
+        return self._pool.submit(self.sdk.ask_ml, detector_rt.detector_id, image)
+
+    def stop_loop(self):
+        super().stop_loop()
+        self._pool.shutdown(wait=False, cancel_futures=True)
 
-    def run_loop(self):
-        logger.info(f"Starting control loop: {self.spec.name}")
-        while True:
-            frame = self.camera.grab()
-            if self.spec.options["log_images"]:
-                preview_image(frame, title=self.spec.name, output_type=self.spec.options["log_images"])
-            # TODO: make the `ask_*` type configurable
-            logger.debug(f"Sending frame to detector: {self.detector_rt.detector}")
-            result = self.sdk.ask_ml(self.detector_rt.detector, frame)
-            logger.debug(f"Got result: {result}")
-            self.detector_rt.store_result(result)
-            logger.debug(f"Sleeping for {self.poll_delay} seconds")
-            time.sleep(self.poll_delay)
+
+class RoiDetectorLoop(ControlLoop):
+    """
+    Asks separate questions about named regions of one camera's frame, such as each door
+    of a loading dock, as a single scheduled job.
+
+    Each poll grabs one frame and cuts each region out of it as a view, without copying.
+    With motion gating on, each region is gated separately, so only the regions which
+    changed get sent.  Each region's crop goes to its own detector, and all of them are
+    submitted before waiting on any answers.  The latest answer for each region is kept
+    in `results`.  A region which fails doesn't stop the others, but the poll is still
+    counted as failed.
+    """
+
+    registry_name = "roi-detector"
+
+    def __init__(self, spec: ControlLoopSpec, sdk: Groundlight, dispatcher: InferenceDispatcher | None = None):
+        super().__init__(spec, sdk, dispatcher)
+        self.camera = self._setup_camera()
+        self.regions = self._setup_regions()
+        self.detectors = {region.name: DetectorRT.by_name(region.detector) for region in self.regions}
+        self.motion_gates = {region.name: self._setup_motion_gate() for region in self.regions}
+        self.preprocessors = {region.name: self._setup_region_preprocessor(region) for region in self.regions}
+        self.results: dict[str, object] = {}
+
+    def run_once(self) -> dict[str, object]:
+        """Grab a frame, ask each region's detector about it if that region changed,
+        and return the answers by region."""
+        frame = self.camera.grab()
+        now = self.clock()
+        requests = {}
+        for region in self.regions:
+            preprocessor = self.preprocessors[region.name]
+            motion_gate = self.motion_gates[region.name]
+            if motion_gate and not motion_gate.should_submit(preprocessor.crop(frame), now=now):
+                logger.debug("No motion in %s on %s, skipping it", region.name, self.camera)
+                self.skip_frame("no-motion")
+                continue
+            requests[region.name] = (self.detectors[region.name], frame, preprocessor)
+        errors: dict[str, Exception] = {}
+        results = self._detect_batch(requests, errors)
+        self.results.update(results)
+        for name, result in results.items():
+            logger.debug("Got result for %s: %s", name, result)
+        self._adapt(results)
+        if errors:
+            raise RuntimeError(f"{len(errors)} of {len(self.regions)} regions failed: {errors}")
+        return results
+
+    def detector_names(self) -> list[str]:
+        return [region.detector for region in self.regions]
+
+    def _setup_regions(self) -> list[RegionSpec]:
+        """
+        Reads the list of regions from the `rois` option.
+        """
+        regions = [RegionSpec(**region) for region in self.spec.options.get("rois", [])]
+        if not regions:
+            raise ValueError(f"Processor {self.spec.name} needs at least one region in `rois`")
+        names = [region.name for region in regions]
+        if len(set(names)) != len(names):
+            raise ValueError(f"Processor {self.spec.name} has regions with the same name: {names}")
+        return regions
+
+    def _setup_region_preprocessor(self, region: RegionSpec) -> FramePreprocessor:
+        """
+        A preprocessor which crops to the region, and applies any `preprocess` options to the crop.
+        Each region has its own, since a preprocessor reuses its resize buffer.
+        """
+        preprocess_spec = PreprocessSpec(**self.spec.options.get("preprocess", {}))
+        if preprocess_spec.roi:
+            raise ValueError(f"Processor {self.spec.name} sets its regions in `rois`, not `preprocess.roi`")
+        return FramePreprocessor(
+            roi=region.roi.as_tuple(), max_dim=preprocess_spec.max_dim, jpeg_quality=preprocess_spec.jpeg_quality
+        )
+
+
+class CompositeDetectorLoop(ControlLoop):
+    """
+    Checks one camera's frame against a `rule` combining several detectors, such as
+    "door open and nobody there", as a single scheduled job.
+
+    Detectors are only asked as far as it takes to decide the rule: `all` stops at the
+    first false term and `any` at the first true one, and each tries first whichever of
+    its terms has been most likely to decide it for what it costs.  The answer is passed
+    on as a YES or NO result under the processor's own name, so that actions and the
+    history can use it like a detector's, with the lowest confidence of the answers it
+    was worked out from.  The latest one is kept in `result`.
+    """
+
+    registry_name = "composite-detector"
+
+    def __init__(self, spec: ControlLoopSpec, sdk: Groundlight, dispatcher: InferenceDispatcher | None = None):
+        super().__init__(spec, sdk, dispatcher)
+        self.camera = self._setup_camera()
+        self.rule = self._setup_rule()
+        self.detectors = {name: DetectorRT.by_name(name) for name in self.rule.detectors()}
+        self.motion_gate = self._setup_motion_gate()
+        self.preprocessor = self._setup_preprocessor()
+        self.result = None
+
+    def run_once(self):
+        """Grab a frame, and ask the detectors about it until the rule is decided."""
+        frame = self.camera.grab()
+        if self.motion_gate and not self.motion_gate.should_submit(frame, now=self.clock()):
+            logger.debug("No motion on %s, skipping frame", self.camera)
+            self.skip_frame("no-motion")
+            if self.adaptive:
+                self.adaptive.unchanged()
+            return None
+        answers = {}
+
+        def ask(name: str) -> str | None:
+            # A detector can be in the rule more than once, but only gets asked once per frame
+            if name not in answers:
+                answers[name] = self._detect(self.detectors[name], frame, self.preprocessor)
+            return result_label(answers[name])
+
+        value = self.rule.evaluate(ask)
+        for _ in range(len(self.detectors) - len(answers)):
+            self.skip_frame("short-circuit")
+        confidences = [c for c in map(result_confidence, answers.values()) if c is not None]
+        self.result = SimpleNamespace(
+            id=None, result=SimpleNamespace(label="YES" if value else "NO", confidence=min(confidences, default=None))
+        )
+        logger.debug("Rule %r is %s after asking %d detectors", self.rule, value, len(answers))
+        if self.on_result:
+            try:
+                self.on_result(self.spec.name, self.result, self.spec.name)
+            except Exception:
+                logger.exception("Failed to pass on the result from %s", self)
+        if self.adaptive:
+            self.adaptive.observe(result_label(self.result), result_confidence(self.result))
+        return self.result
+
+    def detector_names(self) -> list[str]:
+        return list(self.detectors)
+
+    def _setup_rule(self) -> Rule:
+        """
+        Reads the rule from the `rule` option.
+        """
+        if "rule" not in self.spec.options:
+            raise ValueError(f"Processor {self.spec.name} needs a `rule`")
+        return Rule.from_spec(RuleSpec(**self.spec.options["rule"]))
+
+
+class ResultRouter:
+    """Passes each new detector result on to the result history and the actions.
+    The SpecRunner has one of these, or with several processes, the supervisor does.
+    """
+
+    def __init__(self, spec: GLControlSpec, remote_cameras: bool = False):
+        """`remote_cameras` means the cameras are run by other processes, so actions
+        which need their frame buffers can't be set up."""
+        self.spec = spec
+        self.remote_cameras = remote_cameras
+        self.failed: dict[str, str] = {}
+        self.history = self._setup_history()
+        self.action_pool = ActionPool(workers=spec.runtime.actions.workers)
+        self._actions_by_detector: dict[str, list[ActionRT]] = {}
+        self.actions = self._setup_actions()
+
+    def _create_action(self, action: ActionSpec) -> ActionRT:
+        logger.info(f"Setting up action: {action.name}")
+        if self.remote_cameras and Action.type_for(action.type).needs_frame_buffers:
+            raise ValueError(f"{action.type} actions need the cameras in the same process, so don't work with several")
+        trigger = action.trigger
+        action_rt = ActionRT(
+            action.name,
+            action.detector,
+            Action.from_type(action.type, action.name, action.options),
+            ActionTrigger(
+                label=trigger.label,
+                on_change=trigger.on_change,
+                debounce=parse_time_str(str(trigger.debounce), default=0),
+                min_confidence=trigger.min_confidence,
+            ),
+            min_interval=parse_time_str(str(action.min_interval), default=0),
+        )
+        if self.history:
+            # Pick up where we left off, so a restart doesn't look like a change
+            last = self.history.latest(action.detector)
+            action_rt.trigger.state = last.label if last else None
+        return action_rt
+
+    def _setup_history(self) -> ResultHistory | None:
+        """Open the result history, if it's turned on."""
+        history_spec = self.spec.runtime.history
+        if not history_spec.path:
+            return None
+        retention = history_spec.retention
+        return ResultHistory(
+            history_spec.path,
+            flush_interval=parse_time_str(str(history_spec.flush_interval), default=1),
+            batch_size=history_spec.batch_size,
+            retention=parse_time_str(str(retention)) if retention is not None else None,
+            prune_interval=parse_time_str(str(history_spec.prune_interval), default=3600),
+            compact_interval=(
+                parse_time_str(str(history_spec.compact_interval))
+                if history_spec.compact_interval is not None
+                else None
+            ),
+        )
+
+    def _setup_actions(self) -> list[ActionRT]:
+        """Instantiate the actions using the spec, and hook them up to their detectors."""
+        actions = []
+        for action_spec in self.spec.actions:
+            try:
+                actions.append(self._create_action(action_spec))
+            except Exception as e:
+                logger.error(f"Failed to set up action {action_spec.name}: {e!r}")
+                self.failed[action_spec.name] = f"{type(e).__name__}: {e}"
+        self._route_actions(actions)
+        return actions
+
+    def _route_actions(self, actions: list[ActionRT]):
+        by_detector: dict[str, list[ActionRT]] = {}
+        for action_rt in actions:
+            by_detector.setdefault(action_rt.detector_name, []).append(action_rt)
+        self._actions_by_detector = by_detector
+
+    def handle(self, detector_name: str, result, processor: str | None = None):
+        """Called from the control loops with every new result, so it mustn't block."""
+        if self.history:
+            self.history.record(detector_name, result, processor=processor)
+        for action_rt in self._actions_by_detector.get(detector_name, ()):
+            event = action_rt.observe(result, processor=processor)
+            if event:
+                self.action_pool.submit(action_rt, event)
+
+    def apply(self, new_spec: GLControlSpec) -> set[str]:
+        """Re-create the actions which changed in `new_spec`, and return their names."""
+        changed_actions = changed_names(self.spec.actions, new_spec.actions)
+        actions = [action_rt for action_rt in self.actions if action_rt.name not in changed_actions]
+        for action_spec in new_spec.actions:
+            if action_spec.name not in changed_actions:
+                continue
+            try:
+                actions.append(self._create_action(action_spec))
+            except Exception:
+                logger.exception(f"Failed to set up action {action_spec.name}, leaving it off")
+        for action_rt in self.actions:
+            if action_rt.name in changed_actions:
+                # Lets anything it's already started finish in the background
+                action_rt.action.close(timeout=0)
+        self.actions = actions
+        self._route_actions(actions)
+        self.spec = new_spec
+        return changed_actions
+
+    def close(self, timeout: float) -> bool:
+        """Finish off the actions which are waiting, and close the history.
+        Returns False if that took longer than `timeout` seconds."""
+        deadline = time.monotonic() + timeout
+        actions_timeout = parse_time_str(str(self.spec.runtime.actions.shutdown_timeout), default=5)
+        clean = self.action_pool.shutdown(timeout=min(actions_timeout, timeout))
+        for action_rt in self.actions:
+            clean &= action_rt.action.close(timeout=_remaining(deadline))
+        if self.history:
+            clean &= self.history.close(timeout=_remaining(deadline))
+        return clean
 
 
 class SpecRunner:
@@ -239,55 +1102,383 @@ class SpecRunner:
     sdk: Groundlight
     image_sources: list[ImageSourceRT]
     detectors: list[DetectorRT]
+    dispatcher: InferenceDispatcher
+    scheduler: Scheduler
     control_loops: list[ControlLoop]
 
-    def __init__(self, spec: GLControlSpec):
+    def __init__(
+        self,
+        spec: GLControlSpec,
+        sdk: Groundlight | None = None,
+        grabber_factory: Callable[[CameraSpec], "framegrab.FrameGrabber"] | None = None,
+        result_handler: Callable[[str, object, str | None], None] | None = None,
+        edge_sdk: Groundlight | None = None,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        """`sdk` and `grabber_factory` replace the Groundlight client and the framegrab
+        cameras, for running against fakes, and `edge_sdk` the client for the edge
+        endpoint.  `result_handler` is given every result in place of the runner's own
+        history and actions.  `clock` drives the schedule, frame caches, motion gating and
+        result caches; give it a VirtualClock to replay recordings with `run_virtual`."""
         self.spec = spec
-        self.sdk = sdk_connect()
+        self.clock = clock
+        self.sdk = self._setup_router(self._setup_client(sdk if sdk is not None else sdk_connect()), edge_sdk)
+        self.grabber_factory = grabber_factory
+        self.result_handler = result_handler
+        self.failed: dict[str, str] = {}
+        cache_path = spec.runtime.startup.detector_cache
+        self.detector_cache = DetectorCache(cache_path) if cache_path else None
+        self.buffer_budgets = buffer_budgets(spec)
+        self.results = ResultRouter(spec)
+        self.failed.update(self.results.failed)
         self.image_sources = self._setup_image_sources()
         self.detectors = self._setup_detectors()
+        self.dispatcher = self._setup_dispatcher()
+        self.scheduler = Scheduler(
+            workers=spec.runtime.scheduler.workers,
+            stagger=spec.runtime.scheduler.stagger,
+            clock=clock,
+        )
         self.control_loops = self._setup_control_loops()
+        self._jobs: dict[str, ScheduledJob] = {}
+        self._running = False
+        self._stopped = threading.Event()
+
+    def _setup_client(self, sdk: Groundlight) -> ResilientClient:
+        """Wrap the Groundlight client with retries, circuit breakers, rate limiting and
+        the offline spool, and size its connection pool for the dispatcher and startup."""
+        runtime = self.spec.runtime
+        client_spec: ClientSpec = runtime.client
+        tune_sdk(sdk, client_spec.pool_size or runtime.dispatcher.workers + runtime.startup.max_parallel)
+        spool_spec = client_spec.spool
+        spool = FrameSpool(spool_spec.max_frames, path=spool_spec.path) if spool_spec.max_frames else None
+        return ResilientClient(
+            sdk,
+            retries=client_spec.retries,
+            backoff=parse_time_str(str(client_spec.backoff), default=0.5),
+            max_backoff=parse_time_str(str(client_spec.max_backoff), default=10),
+            rate_limit=client_spec.rate_limit,
+            burst=client_spec.burst,
+            failures=client_spec.breaker.failures,
+            detector_failures=client_spec.breaker.detector_failures,
+            reset_after=parse_time_str(str(client_spec.breaker.reset_after), default=30),
+            spool=spool,
+            replay_interval=parse_time_str(str(spool_spec.replay_interval), default=5),
+        )
+
+    def _setup_router(self, cloud: ResilientClient, edge_sdk: Groundlight | None) -> InferenceRouter:
+        """Set up routing between the cloud and the edge endpoint, if there is one."""
+        edge_spec = self.spec.runtime.edge
+        if edge_sdk is None and edge_spec.endpoint:
+            edge_sdk = edge_connect(edge_spec.endpoint)
+        if edge_sdk is None:
+            return InferenceRouter(cloud)
+        runtime = self.spec.runtime
+        tune_sdk(edge_sdk, runtime.client.pool_size or runtime.dispatcher.workers)
+        edge = ResilientClient(
+            edge_sdk,
+            retries=0,
+            failures=edge_spec.failures,
+            detector_failures=edge_spec.failures,
+            reset_after=parse_time_str(str(edge_spec.reset_after), default=30),
+        )
+        return InferenceRouter(cloud, edge)
+
+    def _create_image_source(self, camera: CameraSpec) -> ImageSourceRT:
+        logger.info(f"Setting up camera: {camera.name}")
+        return ImageSourceRT(
+            camera,
+            grabber_factory=self.grabber_factory,
+            clock=self.clock,
+            buffer_bytes=self.buffer_budgets.get(camera.name, 0),
+        )
+
+    def _create_detector(self, detector: DetectorSpec) -> DetectorRT:
+        logger.info(f"Setting up detector: {detector.name}")
+        new_detector = DetectorRT(detector, self.sdk, detector_cache=self.detector_cache, clock=self.clock)
+        new_detector.on_result = self.result_handler or self.results.handle
+        new_detector.on_resolved = self._detector_resolved
+        self._set_route(new_detector)
+        logger.info(f"Found detector: {new_detector}")
+        return new_detector
+
+    def _set_route(self, detector_rt: DetectorRT):
+        routing = detector_rt.spec.routing
+        threshold = detector_rt.spec.confidence_threshold
+        self.sdk.set_route(
+            detector_rt.detector_id,
+            routing.policy,
+            escalate_below=routing.escalate_below if routing.escalate_below is not None else threshold or 0.9,
+        )
+
+    def _detector_resolved(self, detector_rt: DetectorRT):
+        """Route the detector's new ID like the old one, and give it the same concurrency limit."""
+        self._set_route(detector_rt)
+        self._set_detector_limit(self.dispatcher, detector_rt)
+
+    def _create_control_loop(self, control: ControlLoopSpec) -> ControlLoop:
+        logger.info(f"Setting up control loop: {control.name}")
+        loop = ControlLoop.from_spec(control, self.sdk, self.dispatcher)
+        loop.clock = self.clock
+        loop.on_result = self.result_handler or self.results.handle
+        return loop
 
     def _setup_image_sources(self) -> list[ImageSourceRT]:
-        """Instantiate the cameras using framegrab"""
-        out = []
-        for camera in self.spec.cameras:
-            logger.info(f"Setting up camera: {camera.name}")
-            new_camera = ImageSourceRT(camera)
-            out.append(new_camera)
-        return out
+        """Instantiate the cameras using framegrab, opening them in parallel"""
+        timeout = parse_time_str(str(self.spec.runtime.startup.camera_timeout), default=30)
+        return self._create_all(
+            self._create_image_source,
+            self.spec.cameras,
+            timeout,
+            "open-camera",
+            ImageSourceRT.registry,
+            discard=ImageSourceRT.close,
+        )
 
     def _setup_detectors(self) -> list[DetectorRT]:
-        """Instantiate the detectors using the spec."""
-        out = []
-        for detector in self.spec.detectors:
-            logger.info(f"Setting up detector: {detector.name}")
-            new_detector = DetectorRT(detector, self.sdk)
-            out.append(new_detector)
-            print(f"Found detector: {new_detector}")
-        return out
+        """Instantiate the detectors using the spec, looking them up in parallel."""
+        timeout = parse_time_str(str(self.spec.runtime.startup.detector_timeout), default=30)
+        return self._create_all(
+            self._create_detector, self.spec.detectors, timeout, "resolve-detector", DetectorRT.registry
+        )
+
+    def _create_all(
+        self, create: Callable, specs: list, timeout: float, name: str, registry: dict, discard: Callable | None = None
+    ) -> list:
+        """Run `create` on each spec in parallel, and add the ones which work to the registry.
+        Anything which fails or times out is logged and recorded in `self.failed`, so that
+        only the processors which use it are affected.  Anything which finishes after timing
+        out is passed to `discard`, since it never makes it into the registry.
+        """
+        outcomes = run_parallel(
+            create,
+            specs,
+            max_parallel=self.spec.runtime.startup.max_parallel,
+            timeout=timeout,
+            name=name,
+            discard=discard,
+        )
+        created = []
+        for spec, (result, error) in zip(specs, outcomes):
+            if error is not None:
+                logger.error(f"Failed to {name.replace('-', ' ')} {spec.name}: {error}")
+                self.failed[spec.name] = f"{type(error).__name__}: {error}"
+                registry.pop(spec.name, None)
+                continue
+            registry[spec.name] = result
+            created.append(result)
+        return created
+
+    def _setup_dispatcher(self) -> InferenceDispatcher:
+        """Create the dispatcher which all the control loops send their images through."""
+        dispatcher_spec = self.spec.runtime.dispatcher
+        max_queue_time = dispatcher_spec.max_queue_time
+        dispatcher = InferenceDispatcher(
+            self.sdk,
+            workers=dispatcher_spec.workers,
+            queue_size=dispatcher_spec.queue_size,
+            detector_limit=dispatcher_spec.detector_limit,
+            wait=dispatcher_spec.wait,
+            max_queue_time=parse_time_str(str(max_queue_time)) if max_queue_time is not None else None,
+            overflow=dispatcher_spec.overflow,
+        )
+        for detector_rt in self.detectors:
+            self._set_detector_limit(dispatcher, detector_rt)
+        return dispatcher
+
+    @staticmethod
+    def _set_detector_limit(dispatcher: InferenceDispatcher, detector_rt: DetectorRT):
+        if detector_rt.spec.max_concurrency:
+            dispatcher.set_limit(detector_rt.detector_id, detector_rt.spec.max_concurrency)
 
     def _setup_control_loops(self) -> list[ControlLoop]:
-        """Instantiate the control loops using the spec."""
-        out = []
+        """Instantiate the control loops using the spec.
+        A loop which can't be set up (say because its camera didn't open) is left out,
+        and recorded in `self.failed`."""
+        loops = []
         for control in self.spec.processors:
-            logger.info(f"Setting up control loop: {control.name}")
-            new_loop = ControlLoop.from_spec(control, self.sdk)
-            out.append(new_loop)
-        return out
+            try:
+                loops.append(self._create_control_loop(control))
+            except Exception as e:
+                logger.error(f"Failed to set up control loop {control.name}, leaving it stopped: {e!r}")
+                self.failed[control.name] = f"{type(e).__name__}: {e}"
+        return loops
+
+    def _schedule(self, loop: ControlLoop):
+        offset = loop.poll.offset
+        # Adaptive loops pick their own next run; the fixed period only kicks in if a poll fails
+        period = loop.adaptive.fastest if loop.adaptive else loop.poll_delay
+        self._jobs[loop.spec.name] = self.scheduler.add(
+            loop.spec.name,
+            loop.tick,
+            period,
+            offset=parse_time_str(str(offset)) if offset is not None else None,
+            jitter=parse_time_str(str(loop.poll.jitter), default=0),
+            overrun=loop.poll.overrun,
+        )
+
+    def _unschedule(self, loop: ControlLoop):
+        job = self._jobs.pop(loop.spec.name, None)
+        if job:
+            self.scheduler.remove(job)
+        loop.stop_loop()
 
     def run_all(self) -> None:
-        """Run all the control loops and return"""
+        """Schedule all the control loops on the shared scheduler and return"""
         if len(self.control_loops) == 0:
             logger.warning("No control loops found.")
-        else:
-            threads = []
-            for loop in self.control_loops:
-                t = threading.Thread(target=loop.run_loop)
-                threads.append(t)
-                t.start()
-
-    def stop_all(self) -> None:
-        """Stop all the control loops."""
+        for loop in self.control_loops:
+            self._schedule(loop)
+        self._running = True
+        self.scheduler.start()
+
+    def run_virtual(self, duration: float) -> int:
+        """Run all the control loops on the calling thread for `duration` seconds of virtual
+        time, as fast as they'll go, and return the number of polls.  The runner must have
+        been made with a VirtualClock."""
+        for loop in self.control_loops:
+            if loop.spec.name not in self._jobs:
+                self._schedule(loop)
+        return self.scheduler.run_virtual(self.clock() + duration)
+
+    def apply(self, new_spec: GLControlSpec) -> dict[str, list[str]]:
+        """Reconfigure the running system to match `new_spec`, without restarting anything
+        that hasn't changed.  Cameras and detectors are only reopened or re-created if their
+        spec changed, and processors are only restarted if their spec changed or they use a
+        camera or detector which did.  Processors which failed to set up are tried again, in case
+        whatever they needed has been fixed.  Actions which changed are re-created, starting from a clean state.
+        Returns the names of the cameras, detectors, processors and actions which were touched.
+        """
+        changed_cameras = changed_names(self.spec.cameras, new_spec.cameras)
+        changed_detectors = changed_names(self.spec.detectors, new_spec.detectors)
+        changed_processors = changed_names(self.spec.processors, new_spec.processors)
+        for loop in self.control_loops:
+            if set(loop.camera_names()) & changed_cameras or set(loop.detector_names()) & changed_detectors:
+                changed_processors.add(loop.spec.name)
+        changed_processors.update(control.name for control in new_spec.processors if control.name in self.failed)
+        if new_spec.runtime != self.spec.runtime:
+            logger.warning("Changes to the runtime settings only take effect after a restart.")
+        for name in changed_cameras | changed_detectors | changed_processors:
+            self.failed.pop(name, None)
+
+        try:
+            for loop in [loop for loop in self.control_loops if loop.spec.name in changed_processors]:
+                logger.info(f"Stopping control loop: {loop.spec.name}")
+                self._unschedule(loop)
+                self.control_loops.remove(loop)
+            self._reload_cameras(new_spec, changed_cameras)
+            self._reload_detectors(new_spec, changed_detectors)
+            for control in new_spec.processors:
+                if control.name not in changed_processors:
+                    continue
+                loop = self._try_create(self._create_control_loop, control, "set up control loop")
+                if loop:
+                    self.control_loops.append(loop)
+                    if self._running:
+                        self._schedule(loop)
+            changed_actions = self.results.apply(new_spec)
+        finally:
+            # Even if something went wrong part way, what's running now belongs to the new spec
+            self.spec = new_spec
+        return {
+            "cameras": sorted(changed_cameras),
+            "detectors": sorted(changed_detectors),
+            "processors": sorted(changed_processors),
+            "actions": sorted(changed_actions),
+        }
+
+    def _reload_cameras(self, new_spec: GLControlSpec, changed: set[str]):
+        """Close the cameras named in `changed`, and open them again from `new_spec`."""
+        for camera in [camera for camera in self.image_sources if camera.spec.name in changed]:
+            logger.info(f"Closing camera: {camera.spec.name}")
+            camera.close()
+            self.image_sources.remove(camera)
+            ImageSourceRT.registry.pop(camera.spec.name, None)
+        self.buffer_budgets = buffer_budgets(new_spec)
+        for camera_spec in new_spec.cameras:
+            if camera_spec.name in changed:
+                camera = self._try_create(self._create_image_source, camera_spec, "open camera")
+                if camera:
+                    ImageSourceRT.registry[camera_spec.name] = camera
+                    self.image_sources.append(camera)
+
+    def _reload_detectors(self, new_spec: GLControlSpec, changed: set[str]):
+        """Drop the detectors named in `changed`, and resolve them again from `new_spec`."""
+        for detector_rt in [d for d in self.detectors if d.spec.name in changed]:
+            self.detectors.remove(detector_rt)
+            DetectorRT.registry.pop(detector_rt.spec.name, None)
+        for detector_spec in new_spec.detectors:
+            if detector_spec.name in changed:
+                detector_rt = self._try_create(self._create_detector, detector_spec, "resolve detector")
+                if detector_rt:
+                    DetectorRT.registry[detector_spec.name] = detector_rt
+                    self._set_detector_limit(self.dispatcher, detector_rt)
+                    self.detectors.append(detector_rt)
+
+    def _try_create(self, create: Callable, spec, what: str):
+        """Run `create` on the spec during a reload.  A failure is logged and recorded in
+        `self.failed` rather than raised, so the rest of the reload still goes ahead."""
+        try:
+            return create(spec)
+        except Exception as e:
+            logger.exception(f"Failed to {what} {spec.name}, leaving it off")
+            self.failed[spec.name] = f"{type(e).__name__}: {e}"
+            return None
+
+    def wait(self, timeout: float | None = None) -> bool:
+        """Block until stop_all is called.  Returns True if it was."""
+        return self._stopped.wait(timeout)
+
+    def health(self) -> dict[str, dict]:
+        """Health of each control loop, by name, along with anything which failed to start."""
+        health = {
+            name: {"state": "failed", "healthy": False, "last_error": error} for name, error in self.failed.items()
+        }
+        health.update({loop.spec.name: loop.health.as_dict() for loop in self.control_loops})
+        return health
+
+    def stop_all(self, timeout: float | None = None) -> bool:
+        """Stop all the control loops and release the cameras, giving up on anything
+        which hasn't finished after `timeout` seconds (by default the scheduler's
+        shutdown_timeout).  Returns False if something had to be abandoned.
+        """
+        if timeout is None:
+            timeout = parse_time_str(str(self.spec.runtime.scheduler.shutdown_timeout), default=10)
+        deadline = time.monotonic() + timeout
+        self._running = False
         for loop in self.control_loops:
             loop.stop_loop()
+        clean = self.scheduler.stop(timeout=_remaining(deadline))
+        clean &= self.dispatcher.shutdown(timeout=_remaining(deadline))
+        clean &= self.results.close(timeout=_remaining(deadline))
+        self.sdk.close(timeout=_remaining(deadline))
+        clean &= self._close_cameras(timeout=_remaining(deadline))
+        self._stopped.set()
+        return clean
+
+    def _close_cameras(self, timeout: float) -> bool:
+        """Close all the cameras in parallel, since a dead stream can take a while to release."""
+        threads = [
+            threading.Thread(target=camera.close, name=f"close-{camera.spec.name}", daemon=True)
+            for camera in self.image_sources
+        ]
+        deadline = time.monotonic() + timeout
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join(timeout=_remaining(deadline))
+        stuck = [t.name for t in threads if t.is_alive()]
+        if stuck:
+            logger.warning(f"Gave up waiting for cameras to close: {stuck}")
+        return not stuck
+
+
+def _remaining(deadline: float) -> float:
+    return max(0.0, deadline - time.monotonic())
+
+
+def changed_names(old: list, new: list) -> set[str]:
+    """Names of the specs which were added, removed or modified between two lists of specs."""
+    old_by_name = {spec.name: spec for spec in old}
+    new_by_name = {spec.name: spec for spec in new}
+    return {name for name in old_by_name.keys() | new_by_name.keys() if old_by_name.get(name) != new_by_name.get(name)}
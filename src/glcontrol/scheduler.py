@@ -0,0 +1,329 @@
+import heapq
+import itertools
+import logging
+import queue
+import random
+import threading
+import time
+from collections.abc import Callable
+
+from glcontrol.cfgtools.specs import OverrunPolicy
+
+logger = logging.getLogger(__name__)
+
+# Spreads successive offsets evenly over [0, 1) however many jobs there end up being
+GOLDEN_RATIO_FRACTION = 0.6180339887498949
+
+
+class ScheduledJob:
+    """A function which the Scheduler calls every `period` seconds.
+    If the function returns a number, the next run is that many seconds after it finished instead.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        func: Callable[[], None],
+        period: float,
+        first_run: float,
+        jitter: float = 0.0,
+        overrun: OverrunPolicy = OverrunPolicy.skip,
+    ):
+        self.name = name
+        self.func = func
+        self.period = period
+        self.jitter = jitter
+        self.overrun = overrun
+        self.next_run = first_run
+        self.running = False
+        self.pending = False
+        self.cancelled = False
+        self.heap_key = -1
+        self.runs = 0
+        self.skipped = 0
+        self.errors = 0
+
+    def __repr__(self):
+        return f"ScheduledJob('{self.name}', every {self.period}s, runs={self.runs}, skipped={self.skipped})"
+
+    def advance(self, now: float):
+        """Move next_run to the next slot after `now`, staying on the original grid so there's no drift."""
+        if self.period <= 0:
+            self.next_run = now
+            return
+        missed = int((now - self.next_run) // self.period) + 1
+        self.next_run += max(missed, 1) * self.period
+
+
+class AdaptiveInterval:
+    """Works out how long to wait before the next poll, from the answers coming back.
+
+    Starts at `fastest`.  Each answer which is the same as the last one, and at least
+    `min_confidence`, multiplies the wait by `backoff`, up to `slowest`.  A changed or
+    unsure answer drops straight back to `fastest`.  A poll which gets several answers
+    (one per camera, say) only backs off if none of them changed or were unsure.
+    """
+
+    def __init__(self, fastest: float, slowest: float, backoff: float = 2.0, min_confidence: float = 0.9):
+        self.fastest = fastest
+        self.slowest = max(slowest, fastest)
+        self.backoff = backoff
+        self.min_confidence = min_confidence
+        self.delay = fastest
+        self.last_label: str | None = None
+        self.last_labels: dict[str, str | None] = {}
+
+    def __repr__(self):
+        return f"AdaptiveInterval({self.fastest}-{self.slowest}s, now {self.delay}s)"
+
+    def observe(self, label: str | None, confidence: float | None) -> float:
+        """Update the wait after an answer, and return it."""
+        changed = label != self.last_label
+        unsure = confidence is not None and confidence < self.min_confidence
+        self.last_label = label
+        if changed or unsure:
+            self.delay = self.fastest
+        else:
+            self.delay = min(self.delay * self.backoff, self.slowest)
+        return self.delay
+
+    def observe_many(self, answers: dict[str, tuple[str | None, float | None]]) -> float:
+        """Update the wait after a poll's (label, confidence) answers by name, and return it.
+        With no answers at all (e.g. nothing moved), it backs off as for `unchanged`."""
+        if not answers:
+            return self.unchanged()
+        changed = False
+        for name, (label, confidence) in answers.items():
+            if name not in self.last_labels or label != self.last_labels[name]:
+                changed = True
+            if confidence is not None and confidence < self.min_confidence:
+                changed = True
+            self.last_labels[name] = label
+        if changed:
+            self.delay = self.fastest
+        else:
+            self.delay = min(self.delay * self.backoff, self.slowest)
+        return self.delay
+
+    def unchanged(self) -> float:
+        """Back off when there was nothing new to ask about (e.g. no motion), and return the new wait."""
+        self.delay = min(self.delay * self.backoff, self.slowest)
+        return self.delay
+
+
+class VirtualClock:
+    """A clock which only moves when it's told to, for running a schedule faster than real time."""
+
+    def __init__(self, start: float = 0.0):
+        self.now = start
+
+    def __repr__(self):
+        return f"VirtualClock({self.now})"
+
+    def __call__(self) -> float:
+        return self.now
+
+    def advance_to(self, when: float):
+        """Move the clock on to `when`.  It never goes backwards."""
+        self.now = max(self.now, when)
+
+
+class Scheduler:
+    """Runs periodic jobs at a fixed rate, from one timer thread.
+
+    Jobs are scheduled on a fixed grid (start + n * period), so the time a job takes
+    doesn't push back later runs.  The timer thread only keeps time; the jobs themselves
+    run on a bounded pool of worker threads.  If a job is still running when its next
+    slot comes around, the overrun policy decides what happens: `skip` drops that slot,
+    while `catch-up` runs the job again as soon as it finishes.
+
+    The workers are daemon threads, so a job that hangs (on a dead camera, say) can't
+    stop the process from exiting once `stop` has given up waiting for it.
+    """
+
+    def __init__(self, workers: int = 16, stagger: bool = True, clock: Callable[[], float] = time.monotonic):
+        self.workers = workers
+        self.stagger = stagger
+        self.clock = clock
+        self._jobs: list[ScheduledJob] = []
+        self._heap: list[tuple[float, int, ScheduledJob]] = []
+        self._counter = itertools.count()
+        self._cond = threading.Condition()
+        self._work_queue: queue.SimpleQueue[ScheduledJob | None] = queue.SimpleQueue()
+        self._workers: list[threading.Thread] = []
+        self._thread: threading.Thread | None = None
+        self._stopping = False
+
+    def __repr__(self):
+        return f"Scheduler(jobs={len(self._jobs)}, workers={self.workers})"
+
+    @property
+    def jobs(self) -> list[ScheduledJob]:
+        return list(self._jobs)
+
+    def add(
+        self,
+        name: str,
+        func: Callable[[], None],
+        period: float,
+        offset: float | None = None,
+        jitter: float = 0.0,
+        overrun: OverrunPolicy = OverrunPolicy.skip,
+    ) -> ScheduledJob:
+        """Schedule `func` to run every `period` seconds.
+        If `offset` isn't given and staggering is on, the first run is spread out
+        over the first period so that jobs don't all fire at once.
+        """
+        if offset is None:
+            offset = (len(self._jobs) * GOLDEN_RATIO_FRACTION % 1.0) * period if self.stagger else 0.0
+        job = ScheduledJob(name, func, period, self.clock() + offset, jitter=jitter, overrun=overrun)
+        with self._cond:
+            self._jobs.append(job)
+            self._push(job)
+            self._cond.notify()
+        return job
+
+    def remove(self, job: ScheduledJob):
+        """Stop scheduling the job.  A run which is already in progress is allowed to finish."""
+        with self._cond:
+            job.cancelled = True
+            if job in self._jobs:
+                self._jobs.remove(job)
+            self._cond.notify()
+
+    def _push(self, job: ScheduledJob):
+        fire_at = job.next_run + (random.uniform(0, job.jitter) if job.jitter else 0.0)
+        # Only the latest entry for a job counts, so a job can be rescheduled without searching the heap
+        job.heap_key = next(self._counter)
+        heapq.heappush(self._heap, (fire_at, job.heap_key, job))
+
+    def start(self):
+        """Start the timer thread and the worker pool."""
+        with self._cond:
+            if self._thread:
+                return
+            self._stopping = False
+            self._work_queue = queue.SimpleQueue()
+            self._workers = [
+                threading.Thread(target=self._work, name=f"scheduler-worker-{n}", daemon=True)
+                for n in range(self.workers)
+            ]
+            for worker in self._workers:
+                worker.start()
+            self._thread = threading.Thread(target=self._run_timer, name="scheduler-timer", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout: float | None = None) -> bool:
+        """Stop firing jobs, and wait up to `timeout` seconds for running jobs to finish.
+        Returns False if some jobs were still running when the timeout ran out.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            self._stopping = True
+            self._cond.notify()
+            thread, self._thread = self._thread, None
+            workers, self._workers = self._workers, []
+        if thread:
+            thread.join(timeout=_remaining(deadline))
+        for _ in workers:
+            self._work_queue.put(None)
+        for worker in workers:
+            worker.join(timeout=_remaining(deadline))
+        busy = [job.name for job in self._jobs if job.running]
+        if busy:
+            logger.warning(f"Gave up waiting for jobs to finish: {busy}")
+        return not busy
+
+    def run_virtual(self, until: float) -> int:
+        """Run the jobs due before `until` on the calling thread, in order.
+
+        Rather than waiting for each slot, the VirtualClock jumps straight to it, so hours
+        of schedule go by as fast as the jobs run.  Jobs run one at a time, so nothing ever
+        overruns.  Returns the number of runs.
+        """
+        if not isinstance(self.clock, VirtualClock):
+            raise TypeError("run_virtual needs the scheduler to have a VirtualClock")
+        runs = 0
+        while True:
+            with self._cond:
+                if not self._heap or self._heap[0][0] >= until:
+                    break
+                fire_at, key, job = heapq.heappop(self._heap)
+                if job.cancelled or key != job.heap_key:
+                    continue
+                self.clock.advance_to(fire_at)
+                job.advance(self.clock())
+                self._push(job)
+                job.running = True
+            self._execute(job)
+            runs += 1
+        self.clock.advance_to(until)
+        return runs
+
+    def _run_timer(self):
+        with self._cond:
+            while not self._stopping:
+                if not self._heap:
+                    self._cond.wait()
+                    continue
+                fire_at, key, job = self._heap[0]
+                now = self.clock()
+                if fire_at > now:
+                    self._cond.wait(fire_at - now)
+                    continue
+                heapq.heappop(self._heap)
+                if job.cancelled or key != job.heap_key:
+                    continue
+                self._fire(job, now)
+
+    def _fire(self, job: ScheduledJob, now: float):
+        """Called with the lock held, when the job's slot comes up."""
+        job.advance(now)
+        self._push(job)
+        if job.running:
+            if job.overrun == OverrunPolicy.catch_up:
+                job.pending = True
+            else:
+                job.skipped += 1
+                logger.debug("Skipping %s: previous run still going", job.name)
+            return
+        job.running = True
+        self._work_queue.put(job)
+
+    def _work(self):
+        while True:
+            job = self._work_queue.get()
+            if job is None:
+                return
+            if self._stopping:
+                job.running = False
+                continue
+            self._execute(job)
+
+    def _execute(self, job: ScheduledJob):
+        while True:
+            next_delay = None
+            try:
+                next_delay = job.func()
+            except Exception:
+                job.errors += 1
+                logger.exception("Scheduled job %s failed", job.name)
+            with self._cond:
+                job.runs += 1
+                if isinstance(next_delay, int | float) and not job.cancelled:
+                    job.next_run = self.clock() + next_delay
+                    job.pending = False
+                    self._push(job)
+                    self._cond.notify()
+                if not job.pending or job.cancelled or self._stopping:
+                    job.running = False
+                    job.pending = False
+                    return
+                job.pending = False
+
+
+def _remaining(deadline: float | None) -> float | None:
+    """Seconds left until the deadline, or None if there isn't one."""
+    if deadline is None:
+        return None
+    return max(0.0, deadline - time.monotonic())
@@ -0,0 +1,139 @@
+import contextlib
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+from collections.abc import Callable, Sequence
+from typing import Any
+
+logger = logging.getLogger(__name__)
+
+
+def run_parallel(
+    func: Callable[[Any], Any],
+    items: Sequence,
+    max_parallel: int = 8,
+    timeout: float | None = None,
+    name: str = "startup",
+    discard: Callable[[Any], None] | None = None,
+) -> list[tuple[Any, Exception | None]]:
+    """Calls `func` on each item, with at most `max_parallel` running at once.
+    Returns a (result, error) pair for each item, in order.  An item which takes longer
+    than `timeout` seconds gets a TimeoutError, and its slot is given to the next item;
+    the call itself is left to finish (or not) on a daemon thread.  If it does finish,
+    its result is nobody's, so it's passed to `discard` to be cleaned up.
+    """
+    outcomes: list[tuple[Any, Exception | None] | None] = [None] * len(items)
+    slots = threading.Semaphore(max_parallel)
+    all_settled = threading.Condition()
+    remaining = [len(items)]
+
+    def settle(index: int, result: Any, error: Exception | None) -> bool:
+        with all_settled:
+            if outcomes[index] is not None:
+                return False
+            outcomes[index] = (result, error)
+            remaining[0] -= 1
+            all_settled.notify_all()
+        slots.release()
+        return True
+
+    def call(index: int, item: Any):
+        try:
+            result = func(item)
+        except Exception as e:
+            settle(index, None, e)
+            return
+        if not settle(index, result, None) and discard is not None:
+            logger.warning(f"{name} of {item} finished after timing out, discarding it")
+            try:
+                discard(result)
+            except Exception:
+                logger.exception(f"Failed to discard the late {name} of {item}")
+
+    timers = []
+    for index, item in enumerate(items):
+        slots.acquire()
+        threading.Thread(target=call, args=(index, item), name=f"{name}-{index}", daemon=True).start()
+        if timeout is not None:
+            error = TimeoutError(f"{name} of {item} took over {timeout} seconds")
+            timer = threading.Timer(timeout, settle, args=(index, None, error))
+            timer.daemon = True
+            timer.start()
+            timers.append(timer)
+    with all_settled:
+        all_settled.wait_for(lambda: remaining[0] == 0)
+    for timer in timers:
+        timer.cancel()
+    return outcomes
+
+
+class DetectorCache:
+    """Remembers detector IDs on disk, so a restart doesn't have to look every detector up again.
+    Entries are keyed by everything which goes into get_or_create_detector, plus the API endpoint.
+    Worker processes can share the file: each write merges in what's already there, and a
+    write which fails is logged and otherwise ignored, since the cache is only a shortcut.
+    """
+
+    def __init__(self, path: str):
+        self.path = os.path.expanduser(path)
+        self._lock = threading.Lock()
+        self._entries: dict[str, str] = self._load()
+
+    def __repr__(self):
+        return f"DetectorCache('{self.path}', entries={len(self._entries)})"
+
+    def _load(self) -> dict[str, str]:
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable detector cache {self.path}: {e}")
+            return {}
+
+    @staticmethod
+    def key(name: str, query: str, confidence_threshold: float | None, endpoint: str = "") -> str:
+        raw = json.dumps([name, query, confidence_threshold, endpoint])
+        return hashlib.sha256(raw.encode()).hexdigest()
+
+    def get(self, key: str) -> str | None:
+        with self._lock:
+            return self._entries.get(key)
+
+    def put(self, key: str, detector_id: str):
+        """Store the detector ID and write the cache file out."""
+        with self._lock:
+            if self._entries.get(key) == detector_id:
+                return
+            self._entries[key] = detector_id
+            self._write({key: detector_id}, [])
+
+    def drop(self, key: str):
+        """Forget a detector ID which turned out to be wrong."""
+        with self._lock:
+            if self._entries.pop(key, None) is not None:
+                self._write({}, [key])
+
+    def _write(self, changed: dict[str, str], dropped: list[str]):
+        # Apply the change to what's on disk, which other processes may have added to since
+        entries = {**self._load(), **changed}
+        for key in dropped:
+            entries.pop(key, None)
+        tmp_path = None
+        try:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with tempfile.NamedTemporaryFile(
+                "w", dir=os.path.dirname(self.path) or ".", prefix=".detector-cache-", delete=False
+            ) as f:
+                tmp_path = f.name
+                json.dump(entries, f, indent=2)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.warning(f"Couldn't write the detector cache {self.path}: {e}")
+            if tmp_path:
+                with contextlib.suppress(OSError):
+                    os.unlink(tmp_path)
@@ -0,0 +1,240 @@
+import logging
+import queue
+import threading
+import time
+from collections.abc import Callable
+from concurrent.futures import Future
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+import numpy as np
+
+from glcontrol.metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+BAD_FRAMES = REGISTRY.counter(
+    "glcontrol_camera_bad_frames_total", "Grabs which didn't produce a usable frame", ("camera", "reason")
+)
+RECONNECTS = REGISTRY.counter(
+    "glcontrol_camera_reconnects_total", "Attempts to reopen a camera which stopped working", ("camera", "outcome")
+)
+
+
+class CameraError(RuntimeError):
+    """Raised instead of returning a frame which shouldn't be used."""
+
+    def __init__(self, camera: str, reason: str, detail: str = ""):
+        super().__init__(f"Camera {camera}: {detail or reason}")
+        self.camera = camera
+        self.reason = reason
+
+
+class FrameCheck:
+    """Cheap checks for frames which aren't worth sending: missing, blank or stale.
+
+    The checks look at a subsample of every `step`th pixel in each direction, which is
+    plenty to tell a live scene from a dead stream.  A frame is blank if the standard
+    deviation of that sample is under `blank_std` (out of 255), which catches the flat
+    black, grey or green frames a broken decoder puts out.  It's stale if the sample
+    hasn't changed at all for `stale_after` seconds, since a live sensor is never that
+    still.  Either check is off if its threshold is None.
+    """
+
+    def __init__(self, blank_std: float | None = None, stale_after: float | None = None, step: int = 16):
+        self.blank_std = blank_std
+        self.stale_after = stale_after
+        self.step = step
+        self._last_sample: np.ndarray | None = None
+        self._changed_at = 0.0
+
+    def __repr__(self):
+        return f"FrameCheck(blank_std={self.blank_std}, stale_after={self.stale_after})"
+
+    def problem(self, frame, now: float | None = None) -> str | None:
+        """What's wrong with the frame, or None if it's fine."""
+        if frame is None or getattr(frame, "size", 1) == 0:
+            return "missing"
+        if self.blank_std is None and self.stale_after is None:
+            return None
+        sample = frame[:: self.step, :: self.step]
+        if self.blank_std is not None and sample.std() < self.blank_std:
+            return "blank"
+        if self.stale_after is not None:
+            now = time.monotonic() if now is None else now
+            if self._last_sample is None or not np.array_equal(sample, self._last_sample):
+                # Copy, since the grabber may hand out the same buffer next time
+                self._last_sample = sample.copy()
+                self._changed_at = now
+            elif now - self._changed_at > self.stale_after:
+                return "stale"
+        return None
+
+
+class _GrabWorker:
+    """Runs one grabber's grabs on a daemon thread, so that a grab which hangs can be abandoned."""
+
+    def __init__(self, grabber, name: str):
+        self.grabber = grabber
+        self._requests: queue.SimpleQueue[Future | None] = queue.SimpleQueue()
+        threading.Thread(target=self._run, name=f"grab-{name}", daemon=True).start()
+
+    def _run(self):
+        while True:
+            future = self._requests.get()
+            if future is None:
+                return
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(self.grabber.grab())
+            except BaseException as e:
+                future.set_exception(e)
+
+    def grab(self, timeout: float):
+        future = Future()
+        self._requests.put(future)
+        return future.result(timeout)
+
+    def stop(self):
+        self._requests.put(None)
+
+
+class GrabberWatchdog:
+    """Keeps a camera's grabber working, replacing it when it stops.
+
+    Each grab is given `grab_timeout` seconds, and its frame goes through `check`.  A grab
+    which times out, or `max_failures` bad grabs in a row, mean the stream is dead: the
+    grabber is released, and `factory` is called on a background thread to open a new
+    one, retrying with exponential backoff from `backoff` up to `max_backoff` seconds.
+    Until it's back, `grab` raises CameraError straight away rather than blocking.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        factory: Callable[[], object],
+        grabber=None,
+        check: FrameCheck | None = None,
+        grab_timeout: float | None = 10.0,
+        max_failures: int = 3,
+        backoff: float = 1.0,
+        max_backoff: float = 300.0,
+    ):
+        self.name = name
+        self.factory = factory
+        self.check = check or FrameCheck()
+        self.grab_timeout = grab_timeout
+        self.max_failures = max_failures
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.grabber = grabber if grabber is not None else factory()
+        self.failures = 0
+        self.reconnects = 0
+        self._worker = _GrabWorker(self.grabber, name) if grab_timeout else None
+        self._connected = True
+        self._delay = backoff
+        self._next_attempt = 0.0
+        self._reconnecting = False
+        self._closed = False
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return f"GrabberWatchdog('{self.name}', connected={self.connected})"
+
+    @property
+    def connected(self) -> bool:
+        with self._lock:
+            return self._connected
+
+    def grab(self):
+        """A good frame from the camera, or CameraError."""
+        with self._lock:
+            if not self._connected:
+                self._start_reconnect()
+                raise CameraError(self.name, "disconnected", "reconnecting")
+            grabber, worker = self.grabber, self._worker
+        try:
+            frame = worker.grab(self.grab_timeout) if worker else grabber.grab()
+        except FutureTimeoutError:
+            # The grabber is stuck somewhere we can't interrupt, so it's gone either way
+            self._failed(grabber, "timeout", f"grab took over {self.grab_timeout} seconds", fatal=True)
+        except Exception as e:
+            self._failed(grabber, "error", f"grab failed: {e!r}")
+        problem = self.check.problem(frame)
+        if problem is not None:
+            self._failed(grabber, problem, f"{problem} frame")
+        with self._lock:
+            self.failures = 0
+        return frame
+
+    def _failed(self, grabber, reason: str, detail: str, fatal: bool = False):
+        BAD_FRAMES.labels(self.name, reason).inc()
+        with self._lock:
+            # A slow grab from a grabber we've already replaced doesn't count against the new one
+            if grabber is self.grabber and self._connected:
+                self.failures += 1
+                if fatal or self.failures >= self.max_failures:
+                    logger.warning(f"Camera {self.name} looks dead after {self.failures} bad grabs ({detail})")
+                    self._disconnect()
+        raise CameraError(self.name, reason, detail)
+
+    def _disconnect(self):
+        """Drop the current grabber.  Caller must hold the lock."""
+        self._connected = False
+        old_grabber, old_worker = self.grabber, self._worker
+        if old_worker:
+            old_worker.stop()
+        # Releasing a dead stream can hang too
+        threading.Thread(target=_release_quietly, args=(old_grabber, self.name), daemon=True).start()
+        self._next_attempt = time.monotonic()
+        self._start_reconnect()
+
+    def _start_reconnect(self):
+        """Start a reconnection attempt if one is due.  Caller must hold the lock."""
+        if self._reconnecting or self._closed or time.monotonic() < self._next_attempt:
+            return
+        self._reconnecting = True
+        threading.Thread(target=self._reconnect, name=f"reconnect-{self.name}", daemon=True).start()
+
+    def _reconnect(self):
+        try:
+            grabber = self.factory()
+        except Exception as e:
+            with self._lock:
+                self._reconnecting = False
+                self._next_attempt = time.monotonic() + self._delay
+                logger.warning(f"Couldn't reopen camera {self.name}, trying again in {self._delay:.0f}s: {e!r}")
+                self._delay = min(self._delay * 2, self.max_backoff)
+            RECONNECTS.labels(self.name, "failed").inc()
+            return
+        with self._lock:
+            self._reconnecting = False
+            if self._closed:
+                _release_quietly(grabber, self.name)
+                return
+            self.grabber = grabber
+            self._worker = _GrabWorker(grabber, self.name) if self.grab_timeout else None
+            self._connected = True
+            self._delay = self.backoff
+            self.failures = 0
+            self.reconnects += 1
+        RECONNECTS.labels(self.name, "ok").inc()
+        logger.info(f"Reopened camera {self.name}")
+
+    def release(self):
+        """Stop reconnecting, and release the grabber."""
+        with self._lock:
+            self._closed = True
+            connected, grabber, worker = self._connected, self.grabber, self._worker
+            self._connected = False
+        if worker:
+            worker.stop()
+        if connected:
+            grabber.release()
+
+
+def _release_quietly(grabber, name: str):
+    try:
+        grabber.release()
+    except Exception as e:
+        logger.debug(f"Error releasing the old grabber for {name}: {e!r}")
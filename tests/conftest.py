@@ -0,0 +1,76 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import pytest
+from groundlight import Groundlight
+
+IMAGE_QUERY = {
+    "metadata": None,
+    "id": "iq_1",
+    "type": "image_query",
+    "created_at": "2024-01-01T00:00:00Z",
+    "query": "Is it?",
+    "detector_id": "det_1",
+    "result_type": "binary_classification",
+    "result": {"label": "YES", "confidence": 0.95, "source": "ALGORITHM"},
+    "patience_time": 30.0,
+    "confidence_threshold": 0.9,
+    "rois": None,
+    "text": None,
+}
+
+
+class FakeService:
+    """A local stand-in for the Groundlight API (or an edge endpoint).  Image queries fail
+    with each status in `failures` in turn, then succeed with `confidence`."""
+
+    def __init__(self):
+        self.failures: list[int] = []
+        self.confidence = 0.95
+        self.posts: list[str] = []
+        self.ports: set[int] = set()
+        self._lock = threading.Lock()
+
+
+@pytest.fixture
+def fake_service():
+    service = FakeService()
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def _send(self, status: int, body: dict):
+            data = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):  # noqa: N802
+            service.ports.add(self.client_address[1])
+            self._send(200, {"username": "tester"})
+
+        def do_POST(self):  # noqa: N802
+            self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            with service._lock:
+                service.posts.append(self.path)
+                status = service.failures.pop(0) if service.failures else 200
+            if status != 200:
+                self._send(status, {"detail": "nope"})
+                return
+            detector_id = parse_qs(urlsplit(self.path).query).get("detector_id", ["det_1"])[0]
+            result = {**IMAGE_QUERY["result"], "confidence": service.confidence}
+            self._send(200, {**IMAGE_QUERY, "detector_id": detector_id, "result": result})
+
+        def log_message(self, format, *args):  # noqa: A002
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    service.sdk = Groundlight(endpoint=f"http://127.0.0.1:{server.server_address[1]}", api_token="test-token-000")
+    service.ports.clear()
+    yield service
+    server.shutdown()
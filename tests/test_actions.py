@@ -0,0 +1,170 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+
+import pytest
+
+from glcontrol.actions import Action, ActionEvent, ActionPool, ActionRT, ActionTrigger
+from glcontrol.bench import StubGroundlight, SyntheticFrameGrabber
+from glcontrol.cfgtools.specs import GLControlSpec
+from glcontrol.runner import SpecRunner
+
+
+class RecordingAction(Action):
+    """Remembers the events it's given, taking `delay` seconds over each."""
+
+    registry_name = "test-recording"
+
+    def __init__(self, name: str, options: dict):
+        super().__init__(name, options)
+        self.delay = options.get("delay", 0)
+        self.events: list[ActionEvent] = []
+
+    def run(self, event: ActionEvent):
+        time.sleep(self.delay)
+        self.events.append(event)
+
+
+@pytest.fixture
+def webhook_server():
+    """A local stand-in for a webhook endpoint, which records what's posted to it."""
+    received = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):  # noqa: N802
+            received.append(json.loads(self.rfile.read(int(self.headers["Content-Length"]))))
+            self.send_response(204)
+            self.end_headers()
+
+        def log_message(self, format, *args):  # noqa: A002
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_address[1]}/hook", received
+    server.shutdown()
+
+
+def _result(label: str, confidence: float = 0.95):
+    return SimpleNamespace(id="iq_1", result=SimpleNamespace(label=label, confidence=confidence))
+
+
+def _action_rt(delay: float = 0, min_interval: float = 0, **trigger) -> ActionRT:
+    action = Action.from_type("test-recording", "act", {"delay": delay})
+    return ActionRT("act", "det", action, ActionTrigger(**trigger), min_interval=min_interval)
+
+
+def test_trigger_fires_on_change_to_label():
+    trigger = ActionTrigger(label="YES")
+    fired = [trigger.observe(label, 0.9, now)[0] for now, label in enumerate(["NO", "YES", "YES", "NO", "YES"])]
+    assert fired == [False, True, False, False, True]
+
+
+def test_trigger_debounces_flicker():
+    trigger = ActionTrigger(label="YES", debounce=10)
+    assert not trigger.observe("YES", 0.9, 0)[0]
+    assert not trigger.observe("NO", 0.9, 5)[0]
+    assert not trigger.observe("YES", 0.9, 6)[0]
+    assert trigger.observe("YES", 0.9, 16) == (True, None)
+
+
+def test_trigger_ignores_low_confidence():
+    trigger = ActionTrigger(min_confidence=0.8)
+    assert not trigger.observe("YES", 0.5, 0)[0]
+    assert trigger.observe("YES", 0.9, 1)[0]
+
+
+def test_slow_action_coalesces_without_blocking():
+    action_rt = _action_rt(delay=0.2, on_change=False)
+    pool = ActionPool(workers=2)
+    start = time.monotonic()
+    for _ in range(5):
+        pool.submit(action_rt, action_rt.observe(_result("YES")))
+        time.sleep(0.01)
+    assert time.monotonic() - start < 0.15
+    assert pool.shutdown(timeout=2)
+    events = action_rt.action.events
+    assert len(events) == 2  # the first run, then everything which arrived during it
+    assert events[1].coalesced == 3
+
+
+def test_each_processor_has_its_own_trigger_state():
+    action_rt = _action_rt(label="YES")
+    events = [
+        action_rt.observe(_result(label), processor=f"multi/cam-{n}")
+        for n, label in [(0, "NO"), (1, "YES"), (0, "NO"), (1, "YES"), (0, "YES")]
+    ]
+    assert [event is not None for event in events] == [False, True, False, False, True]
+    assert [events[1].processor, events[4].processor] == ["multi/cam-1", "multi/cam-0"]
+
+
+def test_min_interval_spaces_runs():
+    action_rt = _action_rt(min_interval=0.2, on_change=False)
+    pool = ActionPool(workers=2)
+    pool.submit(action_rt, action_rt.observe(_result("YES")))
+    time.sleep(0.05)
+    pool.submit(action_rt, action_rt.observe(_result("YES")))
+    time.sleep(0.05)
+    assert len(action_rt.action.events) == 1
+    time.sleep(0.2)
+    assert len(action_rt.action.events) == 2
+    pool.shutdown(timeout=1)
+
+
+def test_webhook_action(webhook_server):
+    url, received = webhook_server
+    action = Action.from_type("webhook", "hook", {"url": url})
+    action.run(ActionEvent(action="hook", detector="det", label="YES", timestamp=0))
+    assert received[0]["label"] == "YES"
+
+
+def test_webhook_body_copes_with_missing_confidence():
+    action = Action.from_type(
+        "webhook", "hook", {"url": "http://unused", "body": {"text": "{label} ({confidence:.0%})"}}
+    )
+    payload = [
+        json.loads(action.payload(ActionEvent(action="hook", detector="det", label="YES", confidence=c, timestamp=0)))
+        for c in (0.9, None)
+    ]
+    assert [p["text"] for p in payload] == ["YES (90%)", "YES (unknown)"]
+
+
+def test_shell_and_file_actions(tmp_path):
+    out = tmp_path / "shell.txt"
+    shell = Action.from_type("shell", "sh", {"command": ["sh", "-c", f'echo "$GLCONTROL_LABEL" > {out}']})
+    shell.run(ActionEvent(action="sh", detector="det", label="NO", timestamp=0))
+    assert out.read_text().strip() == "NO"
+
+    log = tmp_path / "events.jsonl"
+    file_action = Action.from_type("file", "log", {"path": str(log)})
+    for label in ["YES", "NO"]:
+        file_action.run(ActionEvent(action="log", detector="det", label=label, timestamp=0))
+    assert [json.loads(line)["label"] for line in log.read_text().splitlines()] == ["YES", "NO"]
+
+
+def test_runner_sends_results_to_webhook(webhook_server):
+    url, received = webhook_server
+    spec = GLControlSpec(
+        cameras=[{"name": "act-cam", "input_type": "generic_usb", "id": {"serial_number": "0"}}],
+        detectors=[{"name": "act-det", "query": "Is it?"}],
+        processors=[
+            {
+                "name": "act-proc",
+                "type": "simple-camera-detector",
+                "inputs": [{"camera": "act-cam"}],
+                "options": {"detector": "act-det", "poll": {"every": 0.02}},
+            }
+        ],
+        actions=[{"name": "act-hook", "type": "webhook", "detector": "act-det", "options": {"url": url}}],
+    )
+    runner = SpecRunner(
+        spec, sdk=StubGroundlight(latency=0, yes_rate=1.0), grabber_factory=lambda c: SyntheticFrameGrabber()
+    )
+    runner.run_all()
+    time.sleep(0.3)
+    assert runner.stop_all(timeout=2)
+    assert len(received) == 1  # the label never changed after the first answer
+    assert received[0]["detector"] == "act-det"
+    assert received[0]["label"] == "YES"
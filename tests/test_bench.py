@@ -0,0 +1,47 @@
+import pytest
+
+from glcontrol.bench import (
+    StubApiError,
+    StubGroundlight,
+    SyntheticFrameGrabber,
+    format_config_results,
+    format_results,
+    run_config_bench,
+    run_scenario,
+)
+from glcontrol.cfgtools.base import SpecCache
+
+
+def test_synthetic_grabber_frames_change_at_fps():
+    grabber = SyntheticFrameGrabber(width=64, height=48, fps=1000)
+    frame = grabber.grab()
+    assert frame.shape == (48, 64, 3)
+    slow = SyntheticFrameGrabber(width=64, height=48, fps=0.001)
+    assert slow.grab() is slow.grab()
+
+
+def test_stub_failures():
+    sdk = StubGroundlight(latency=0, failure_rate=1.0)
+    detector = sdk.get_or_create_detector("d", "Is it?")
+    with pytest.raises(StubApiError):
+        sdk.ask_ml(detector, None)
+    assert sdk.failures == 1
+
+
+def test_run_small_scenario():
+    sdk = StubGroundlight(latency=0.01)
+    result = run_scenario(3, duration=0.5, period=0.1, sdk=sdk, width=64, height=48)
+    assert result.frames_sent >= 6
+    assert result.errors == 0
+    assert result.p50_ms > 0
+    assert "procs" in format_results([result])
+
+
+def test_config_bench(tmp_path):
+    cache = SpecCache(path=str(tmp_path))
+    result = run_config_bench(200, cache_dir=str(tmp_path), cache=cache)
+    # One load each: cold, then from disk, then from memory
+    assert (cache.misses, cache.disk_hits, cache.hits) == (1, 1, 1)
+    assert len(list(tmp_path.glob("*.json"))) == 1
+    assert result.cold_ms > 0
+    assert "entries" in format_config_results([result])
@@ -1,5 +1,9 @@
+from types import SimpleNamespace
+
+import pytest
 from typer.testing import CliRunner
 
+from glcontrol import cli
 from glcontrol.cli import app
 
 
@@ -15,3 +19,15 @@ def test_cli_noargs():
     runner = CliRunner()
     result = runner.invoke(app, [])  # Simulating no arguments passed
     assert result.exit_code != 0  # Non-zero exit code indicates an error
+
+
+def test_reload_retries_a_config_which_vanished(tmp_path, monkeypatch):
+    config = tmp_path / "glcontrol.yaml"
+    config.write_text("glcontrol: {}\n")
+
+    def vanished(path):
+        raise FileNotFoundError(path)
+
+    monkeypatch.setattr(cli.GLControlManifest, "from_file", vanished)
+    runner = SimpleNamespace(apply=lambda spec: pytest.fail("nothing to apply"))
+    assert cli.reload_config_if_updated(runner, str(config), last_updated=0) == 0
@@ -0,0 +1,114 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+
+from glcontrol import client
+from glcontrol.client import (
+    BreakerState,
+    CircuitBreaker,
+    CircuitOpenError,
+    FrameSpool,
+    ResilientClient,
+    TokenBucket,
+    is_transient,
+    tune_sdk,
+)
+from tests.conftest import FakeService
+
+
+def _client(service: FakeService, **kwargs) -> ResilientClient:
+    kwargs.setdefault("backoff", 0.01)
+    tune_sdk(service.sdk, 4)
+    return ResilientClient(service.sdk, **kwargs)
+
+
+def test_retries_transient_errors(fake_service):
+    fake_service.failures = [503, 502]
+    iq = _client(fake_service).ask_ml("det_1", b"jpeg")
+    assert iq.result.label.value == "YES"
+    assert len(fake_service.posts) == 3
+
+
+def test_does_not_retry_bad_requests(fake_service):
+    fake_service.failures = [400]
+    with pytest.raises(Exception) as info:
+        _client(fake_service).ask_ml("det_1", b"jpeg")
+    assert not is_transient(info.value)
+    assert len(fake_service.posts) == 1
+
+
+def test_detector_breaker_fails_fast(fake_service):
+    fake_service.failures = [503] * 10
+    client = _client(fake_service, retries=0, detector_failures=2)
+    for _ in range(2):
+        with pytest.raises(Exception):
+            client.ask_ml("det_1", b"jpeg")
+    with pytest.raises(CircuitOpenError):
+        client.ask_ml("det_1", b"jpeg")
+    assert len(fake_service.posts) == 2
+    # Other detectors are unaffected
+    fake_service.failures = []
+    assert client.ask_ml("det_2", b"jpeg").id == "iq_1"
+
+
+def test_breaker_half_opens_after_reset():
+    now = [0.0]
+    breaker = CircuitBreaker("test", failures=2, reset_after=10, clock=lambda: now[0])
+    breaker.record_failure()
+    assert breaker.allow()
+    breaker.record_failure()
+    assert not breaker.allow()
+    now[0] = 10
+    assert breaker.allow()  # the probe
+    assert not breaker.allow()  # only one at a time
+    breaker.record_failure()
+    assert breaker.state == BreakerState.open
+    now[0] = 20
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == BreakerState.closed
+
+
+def test_token_bucket_paces_calls():
+    now = [0.0]
+    bucket = TokenBucket(rate=10, burst=2, clock=lambda: now[0])
+    assert [bucket.reserve() for _ in range(4)] == pytest.approx([0, 0, 0.1, 0.2])
+    now[0] = 1.0
+    assert bucket.reserve() == 0
+
+
+def test_spool_replays_once_service_recovers(fake_service, tmp_path):
+    fake_service.failures = [503] * 2
+    client = _client(fake_service, retries=1, spool=FrameSpool(10, path=str(tmp_path)), replay_interval=60)
+    with pytest.raises(Exception):
+        client.ask_ml("det_1", np.zeros((8, 8, 3), dtype=np.uint8))
+    assert len(client.spool) == 1
+    assert len(list(tmp_path.iterdir())) == 1
+    assert client.replay() == 1
+    assert len(client.spool) == 0
+    assert list(tmp_path.iterdir()) == []
+    assert "want_async=True" in fake_service.posts[-1]
+    client.close()
+
+
+def test_spool_survives_restart_and_drops_oldest(tmp_path):
+    spool = FrameSpool(2, path=str(tmp_path))
+    for n in range(3):
+        spool.put(f"det_{n}", b"jpeg")
+    reloaded = FrameSpool(2, path=str(tmp_path))
+    assert [reloaded.peek().detector, len(reloaded)] == ["det_1", 2]
+
+
+def test_connection_pool_keeps_connections_alive(fake_service):
+    assert tune_sdk(fake_service.sdk, 4)
+    with ThreadPoolExecutor(4) as pool:
+        list(pool.map(lambda _: fake_service.sdk.whoami(), range(40)))
+    assert len(fake_service.ports) <= 4
+
+
+def test_untested_sdk_versions_are_left_alone(fake_service, monkeypatch):
+    monkeypatch.setattr(client, "_sdk_version", lambda: (0, 99))
+    rest_client = fake_service.sdk.api_client.rest_client
+    assert not tune_sdk(fake_service.sdk, 4)
+    assert fake_service.sdk.api_client.rest_client is rest_client
@@ -0,0 +1,135 @@
+import os
+import time
+
+import numpy as np
+
+from glcontrol.bench import StubGroundlight, SyntheticFrameGrabber
+from glcontrol.cfgtools.specs import GLControlSpec
+from glcontrol.clips import MB, ClipExporter, FrameBuffer, buffer_budgets
+from glcontrol.multiproc import MultiprocessRunner
+from glcontrol.runner import SpecRunner
+
+
+def _frame(n: int) -> np.ndarray:
+    return np.full((48, 64, 3), n, dtype=np.uint8)
+
+
+def test_buffer_memory_is_bounded():
+    buffer = FrameBuffer("ring-cam", max_bytes=5 * _frame(0).nbytes + 100)
+    for n in range(12):
+        buffer.append(_frame(n), ts=float(n))
+    assert len(buffer) == buffer.capacity == 5
+    assert [ts for _, ts in buffer.timestamps()] == [7.0, 8.0, 9.0, 10.0, 11.0]
+    assert [int(frame[0, 0, 0]) for _, frame in buffer.frames(8.5, 10)] == [9, 10]
+    ts, frame = buffer.frame_at(9.5)
+    assert ts == 9.0 and frame[0, 0, 0] == 9
+    assert buffer.frame_at(3) is None  # long gone
+    assert FrameBuffer.registry["ring-cam"] is buffer
+    buffer.close()
+    assert "ring-cam" not in FrameBuffer.registry
+
+
+def test_buffer_restarts_on_new_frame_size():
+    buffer = FrameBuffer("resize-cam", max_bytes=MB)
+    buffer.append(_frame(1), ts=1)
+    buffer.append(np.zeros((96, 128, 3), dtype=np.uint8), ts=2)
+    assert [ts for _, ts in buffer.timestamps()] == [2.0]
+    buffer.close()
+
+
+def test_buffer_budgets_are_shared_out():
+    spec = GLControlSpec(
+        cameras=[
+            {"name": f"budget-cam-{n}", "input_type": "generic_usb", "id": {"serial_number": str(n)}, "buffer": buffer}
+            for n, buffer in enumerate([{"memory_mb": 300}, {"memory_mb": 100}, {}])
+        ],
+        runtime={"buffers": {"max_memory_mb": 200}},
+    )
+    assert buffer_budgets(spec) == {"budget-cam-0": 150 * MB, "budget-cam-1": 50 * MB}
+
+
+def test_clip_waits_for_frames_after_the_event(tmp_path):
+    buffer = FrameBuffer("clip-cam", max_bytes=MB)
+    exporter = ClipExporter(str(tmp_path))
+    start = time.time()
+    for n in range(3):
+        buffer.append(_frame(n), ts=start - 0.3 + 0.1 * n)
+    assert exporter.request(buffer, start - 1, start + 0.2, "event")
+    buffer.append(_frame(3), ts=start + 0.1)  # after the event, but still in the clip
+    directory = tmp_path / "clip-cam" / "event"
+    assert not directory.exists()
+    deadline = time.monotonic() + 2
+    while exporter.saved == 0:
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+    assert len(os.listdir(directory)) == 4
+    assert sorted(os.listdir(directory))[0] == "000000_00000700.jpg"
+    assert exporter.close(timeout=1)
+    buffer.close()
+
+
+def test_clip_backlog_is_bounded(tmp_path):
+    buffer = FrameBuffer("backlog-cam", max_bytes=MB)
+    buffer.append(_frame(0), ts=0)
+    exporter = ClipExporter(str(tmp_path), max_pending=2, clock=lambda: 0.0)
+    assert [exporter.request(buffer, 0, 10, f"clip-{n}") for n in range(3)] == [True, True, False]
+    assert exporter.dropped == 1
+    # Closing saves what's waiting without waiting for the end of the clips
+    assert exporter.close(timeout=2)
+    assert exporter.saved == 2
+    buffer.close()
+
+
+def test_clip_action_saves_on_detector_change(tmp_path):
+    spec = GLControlSpec(
+        cameras=[
+            {
+                "name": "action-cam",
+                "input_type": "generic_usb",
+                "id": {"serial_number": "0"},
+                "buffer": {"memory_mb": 1},
+            }
+        ],
+        detectors=[{"name": "action-det", "query": "Is it?"}],
+        processors=[
+            {
+                "name": "action-proc",
+                "type": "simple-camera-detector",
+                "inputs": [{"camera": "action-cam"}],
+                "options": {"detector": "action-det"},
+            }
+        ],
+        actions=[
+            {
+                "name": "save-clip",
+                "type": "clip",
+                "detector": "action-det",
+                "options": {"camera": "action-cam", "path": str(tmp_path), "before": 60, "after": 60},
+            }
+        ],
+    )
+    runner = SpecRunner(
+        spec, sdk=StubGroundlight(latency=0, yes_rate=0), grabber_factory=lambda c: SyntheticFrameGrabber(64, 48)
+    )
+    (loop,) = runner.control_loops
+    for _ in range(3):
+        loop.run_once()
+    assert len(runner.image_sources[0].buffer) == 3
+    assert runner.stop_all(timeout=2)
+    (clip,) = os.listdir(tmp_path / "action-cam")
+    assert clip.endswith("-NO")
+    assert len(os.listdir(tmp_path / "action-cam" / clip)) == 3
+
+
+def test_clip_action_is_rejected_with_several_processes(tmp_path):
+    spec = GLControlSpec(
+        detectors=[{"name": "mp-clip-det", "query": "Is it?"}],
+        actions=[
+            {"name": "mp-clip", "type": "clip", "detector": "mp-clip-det", "options": {"camera": "cam"}},
+            {"name": "mp-file", "type": "file", "detector": "mp-clip-det", "options": {"path": str(tmp_path / "f")}},
+        ],
+    )
+    runner = MultiprocessRunner(spec, processes=2)
+    assert "same process" in runner.failed["mp-clip"]
+    assert [action_rt.name for action_rt in runner.results.actions] == ["mp-file"]
+    assert runner.stop_all(timeout=1)
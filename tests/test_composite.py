@@ -0,0 +1,69 @@
+import pytest
+from pydantic import ValidationError
+
+from glcontrol.cfgtools.specs import RuleSpec
+from glcontrol.composite import AllRule, Rule
+
+
+def _rule(spec: dict) -> Rule:
+    return Rule.from_spec(RuleSpec(**spec))
+
+
+def _asker(labels: dict[str, str], asked: list[str]):
+    def ask(name: str) -> str:
+        asked.append(name)
+        return labels[name]
+
+    return ask
+
+
+def test_all_stops_at_first_false_term():
+    rule = _rule({"all": [{"detector": "door"}, {"detector": "dark"}, {"not": {"detector": "person"}}]})
+    asked = []
+    assert not rule.evaluate(_asker({"door": "NO", "dark": "YES", "person": "NO"}, asked))
+    assert asked == ["door"]
+    asked.clear()
+    assert rule.evaluate(_asker({"door": "YES", "dark": "YES", "person": "NO"}, asked))
+    assert asked == ["door", "dark", "person"]
+    assert rule.detectors() == ["door", "dark", "person"]
+
+
+def test_any_stops_at_first_true_term():
+    rule = _rule({"any": [{"detector": "smoke"}, {"detector": "fire", "label": "NO"}]})
+    asked = []
+    assert rule.evaluate(_asker({"smoke": "YES", "fire": "YES"}, asked))
+    assert asked == ["smoke"]
+    asked.clear()
+    assert not rule.evaluate(_asker({"smoke": "UNCLEAR", "fire": "YES"}, asked))
+    assert asked == ["smoke", "fire"]
+
+
+def test_cheap_and_selective_terms_go_first():
+    rule = _rule({"all": [{"detector": "slow", "cost": 2}, {"detector": "fast", "cost": 0.5}]})
+    asked = []
+    rule.evaluate(_asker({"slow": "NO", "fast": "YES"}, asked))
+    assert asked == ["fast", "slow"]
+    # Equal costs: the term which is usually false decides the rule, so it's learned to go first
+    rule = _rule({"all": [{"detector": "usually-yes", "cost": 1}, {"detector": "usually-no", "cost": 1}]})
+    labels = {"usually-yes": "YES", "usually-no": "NO"}
+    asked = []
+    for _ in range(5):
+        rule.evaluate(_asker(labels, asked))
+    assert asked[-1] == "usually-no"
+    assert asked.count("usually-yes") == 1
+    assert isinstance(rule, AllRule) and rule.cost < 1.5
+
+
+@pytest.mark.parametrize(
+    "spec",
+    [
+        {},
+        {"detector": "a", "all": [{"detector": "b"}]},
+        {"any": []},
+        {"all": [{"detector": "a"}], "label": "NO"},
+        {"detector": "a", "cost": 0},
+    ],
+)
+def test_bad_rules(spec):
+    with pytest.raises(ValidationError):
+        RuleSpec(**spec)
@@ -0,0 +1,126 @@
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from glcontrol.cfgtools.specs import OverflowPolicy
+from glcontrol.dispatch import DispatcherFullError, DispatchError, InferenceDispatcher, RequestDroppedError
+from glcontrol.lifecycle import CancellationToken, LoopCancelledError
+
+
+class StubGroundlight:
+    """Stands in for the Groundlight client, tracking how many calls are in flight."""
+
+    def __init__(self, latency: float = 0.01):
+        self.latency = latency
+        self.calls = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+
+    def _answer(self, method: str, detector, image, **kwargs):
+        with self._lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        time.sleep(self.latency)
+        with self._lock:
+            self.in_flight -= 1
+            self.calls.append((method, detector.id, kwargs))
+        return SimpleNamespace(detector_id=detector.id, image=image, method=method)
+
+    def ask_ml(self, detector, image):
+        return self._answer("ask_ml", detector, image)
+
+    def ask_confident(self, detector, image, wait=None):
+        return self._answer("ask_confident", detector, image, wait=wait)
+
+
+def _detector(detector_id: str = "det_1"):
+    return SimpleNamespace(id=detector_id)
+
+
+def test_ask_returns_result():
+    sdk = StubGroundlight()
+    dispatcher = InferenceDispatcher(sdk, workers=2)
+    result = dispatcher.ask(_detector(), "frame")
+    assert result.image == "frame"
+    assert result.method == "ask_ml"
+    dispatcher.shutdown()
+
+
+def test_confidence_wait_mode():
+    sdk = StubGroundlight()
+    dispatcher = InferenceDispatcher(sdk, workers=1, wait=5)
+    result = dispatcher.ask(_detector(), "frame")
+    assert result.method == "ask_confident"
+    assert sdk.calls[0][2] == {"wait": 5}
+    dispatcher.shutdown()
+
+
+def test_per_detector_limit():
+    sdk = StubGroundlight(latency=0.05)
+    dispatcher = InferenceDispatcher(sdk, workers=8, detector_limit=2)
+    futures = [dispatcher.submit(_detector(), n) for n in range(6)]
+    assert [f.result().image for f in futures] == list(range(6))
+    assert sdk.max_in_flight == 2
+    dispatcher.shutdown()
+
+
+def test_cancelled_loop_stops_waiting_for_detector_limit():
+    sdk = StubGroundlight(latency=1)
+    dispatcher = InferenceDispatcher(sdk, workers=1, detector_limit=1)
+    dispatcher.submit(_detector(), 0)
+    token = CancellationToken()
+    threading.Timer(0.05, token.cancel).start()
+    start = time.monotonic()
+    with pytest.raises(LoopCancelledError):
+        dispatcher.submit(_detector(), 1, cancel_token=token)
+    assert time.monotonic() - start < 0.5
+    dispatcher.shutdown(timeout=0)
+
+
+def test_full_queue_raises():
+    sdk = StubGroundlight(latency=0.2)
+    dispatcher = InferenceDispatcher(sdk, workers=1, queue_size=1, detector_limit=10, overflow=OverflowPolicy.block)
+    dispatcher.submit(_detector(), 0)
+    time.sleep(0.05)  # let the worker pick up the first request
+    dispatcher.submit(_detector(), 1)
+    with pytest.raises(DispatcherFullError):
+        dispatcher.submit(_detector(), 2, timeout=0.01)
+    dispatcher.shutdown()
+
+
+def test_stale_requests_expire():
+    sdk = StubGroundlight(latency=0.1)
+    dispatcher = InferenceDispatcher(sdk, workers=1, detector_limit=10, max_queue_time=0.05)
+    first = dispatcher.submit(_detector(), 0)
+    second = dispatcher.submit(_detector(), 1)
+    assert first.result().image == 0
+    with pytest.raises(DispatchError):
+        second.result()
+    dispatcher.shutdown()
+
+
+def test_full_queue_drops_oldest():
+    sdk = StubGroundlight(latency=0.2)
+    dispatcher = InferenceDispatcher(sdk, workers=1, queue_size=1, detector_limit=10)
+    running = dispatcher.submit(_detector(), 0)
+    time.sleep(0.05)  # let the worker pick up the first request
+    oldest = dispatcher.submit(_detector(), 1)
+    newest = dispatcher.submit(_detector(), 2)
+    with pytest.raises(RequestDroppedError):
+        oldest.result()
+    assert running.result().image == 0
+    assert newest.result().image == 2
+    dispatcher.shutdown()
+
+
+def test_shutdown_cancels_queued_requests():
+    sdk = StubGroundlight(latency=0.2)
+    dispatcher = InferenceDispatcher(sdk, workers=1, detector_limit=10)
+    dispatcher.submit(_detector(), 0)
+    time.sleep(0.05)
+    queued = dispatcher.submit(_detector(), 1)
+    assert dispatcher.shutdown(timeout=1)
+    assert queued.cancelled()
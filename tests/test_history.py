@@ -0,0 +1,97 @@
+import time
+from types import SimpleNamespace
+
+from glcontrol.bench import StubGroundlight, SyntheticFrameGrabber
+from glcontrol.cfgtools.specs import GLControlSpec
+from glcontrol.history import ResultHistory
+from glcontrol.runner import SpecRunner
+
+
+def _result(label: str, confidence: float = 0.9, query_id: str = "iq_1"):
+    return SimpleNamespace(id=query_id, result=SimpleNamespace(label=label, confidence=confidence))
+
+
+def test_record_and_query(tmp_path):
+    history = ResultHistory(str(tmp_path / "history.db"))
+    for n in range(10):
+        history.record("door", _result("YES" if n % 2 else "NO"), processor="proc-a", ts=1000 + n)
+    history.record("window", _result("NO"), processor="proc-b", ts=1005)
+    assert history.flush(timeout=5)
+    door = history.query(detector="door", since=1002, until=1006)
+    assert [r.ts for r in door] == [1002, 1003, 1004, 1005]
+    assert [r.label for r in door] == ["NO", "YES", "NO", "YES"]
+    assert [r.detector for r in history.query(processor="proc-b")] == ["window"]
+    assert history.latest("door").ts == 1009
+    assert history.latest("nothing") is None
+    history.close()
+
+
+def test_writes_are_batched(tmp_path):
+    history = ResultHistory(str(tmp_path / "history.db"), flush_interval=0.2)
+    start = time.monotonic()
+    for n in range(5000):
+        history.record("door", _result("NO"), ts=n)
+    assert time.monotonic() - start < 0.5  # no disk I/O on the caller's thread
+    assert history.flush(timeout=5)
+    assert len(history.query(detector="door")) == 5000
+    history.close()
+
+
+def test_prune_and_compact(tmp_path):
+    history = ResultHistory(str(tmp_path / "history.db"))
+    for n in range(100):
+        history.record("door", _result("NO"), ts=n)
+    history.flush()
+    assert history.prune(before=90) == 90
+    history.compact()
+    assert [r.ts for r in history.query()] == list(range(90, 100))
+    history.close()
+
+
+def test_compacts_after_pruning(tmp_path):
+    history = ResultHistory(str(tmp_path / "history.db"), flush_interval=0.02, retention=60, prune_interval=0.02)
+    history.compact_interval = 0
+    compactions = []
+    vacuum = history._vacuum
+    history._vacuum = lambda: (compactions.append(time.monotonic()), vacuum())
+    for n in range(100):
+        history.record("door", _result("NO"), ts=n)
+    history.record("door", _result("YES"))
+    deadline = time.monotonic() + 5
+    while not compactions and time.monotonic() < deadline:
+        time.sleep(0.02)
+    assert compactions
+    assert [r.label for r in history.query()] == ["YES"]
+    history.close()
+
+
+def test_survives_restart(tmp_path):
+    path = str(tmp_path / "history.db")
+    history = ResultHistory(path)
+    history.record("door", _result("YES"), ts=1)
+    assert history.close()
+    assert ResultHistory(path).latest("door").label == "YES"
+
+
+def test_runner_records_results(tmp_path):
+    path = str(tmp_path / "history.db")
+    spec = GLControlSpec(
+        cameras=[{"name": "hist-cam", "input_type": "generic_usb", "id": {"serial_number": "0"}}],
+        detectors=[{"name": "hist-det", "query": "Is it?"}],
+        processors=[
+            {
+                "name": "hist-proc",
+                "type": "simple-camera-detector",
+                "inputs": [{"camera": "hist-cam"}],
+                "options": {"detector": "hist-det", "poll": {"every": 0.02}},
+            }
+        ],
+        runtime={"history": {"path": path, "flush_interval": 0.05}},
+    )
+    runner = SpecRunner(spec, sdk=StubGroundlight(latency=0), grabber_factory=lambda c: SyntheticFrameGrabber())
+    runner.run_all()
+    time.sleep(0.2)
+    assert runner.stop_all(timeout=2)
+    records = ResultHistory(path).query(detector="hist-det")
+    assert len(records) > 0
+    assert all(r.processor == "hist-proc" for r in records)
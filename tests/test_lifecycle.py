@@ -0,0 +1,92 @@
+import threading
+import time
+from concurrent.futures import Future
+
+import pytest
+
+from glcontrol.bench import StubGroundlight, SyntheticFrameGrabber
+from glcontrol.cfgtools.specs import GLControlSpec
+from glcontrol.lifecycle import CancellationToken, LoopCancelledError, LoopHealth
+from glcontrol.runner import SpecRunner
+
+
+class HungGrabber(SyntheticFrameGrabber):
+    """A camera whose grab never comes back, like a stalled RTSP stream."""
+
+    def __init__(self):
+        super().__init__(width=32, height=24)
+        self.release_me = threading.Event()
+
+    def grab(self):
+        self.release_me.wait()
+        return super().grab()
+
+
+def _spec(poll: float = 0.05) -> GLControlSpec:
+    return GLControlSpec(
+        cameras=[{"name": "life-cam", "input_type": "generic_usb", "id": {"serial_number": "0"}}],
+        detectors=[{"name": "life-det", "query": "Is it?"}],
+        processors=[
+            {
+                "name": "life-proc",
+                "type": "simple-camera-detector",
+                "inputs": [{"camera": "life-cam"}],
+                "options": {"detector": "life-det", "poll": {"every": poll}},
+            }
+        ],
+    )
+
+
+def test_token_interrupts_wait_for_result():
+    token = CancellationToken()
+    future = Future()
+    threading.Timer(0.05, token.cancel).start()
+    start = time.monotonic()
+    with pytest.raises(LoopCancelledError):
+        token.result(future)
+    assert time.monotonic() - start < 1
+    assert future.cancelled()
+
+
+def test_token_returns_result():
+    token = CancellationToken()
+    future = Future()
+    threading.Timer(0.02, future.set_result, args=["done"]).start()
+    assert token.result(future) == "done"
+
+
+def test_health_tracks_errors():
+    health = LoopHealth(period=1)
+    health.started()
+    assert health.as_dict()["state"] == "running"
+    for _ in range(3):
+        health.failed(RuntimeError("camera gone"))
+    assert not health.healthy
+    assert health.last_error == "RuntimeError: camera gone"
+    health.succeeded()
+    assert health.healthy
+
+
+def test_stop_all_with_slow_backend_is_prompt():
+    runner = SpecRunner(
+        _spec(), sdk=StubGroundlight(latency=30, latency_sigma=0), grabber_factory=lambda c: SyntheticFrameGrabber()
+    )
+    runner.run_all()
+    time.sleep(0.2)
+    assert runner.health()["life-proc"]["state"] == "running"
+    start = time.monotonic()
+    runner.stop_all(timeout=2)
+    assert time.monotonic() - start < 2.5
+    assert runner.health()["life-proc"]["state"] == "stopped"
+
+
+def test_stop_all_gives_up_on_hung_camera():
+    grabber = HungGrabber()
+    runner = SpecRunner(_spec(), sdk=StubGroundlight(latency=0), grabber_factory=lambda c: grabber)
+    runner.run_all()
+    time.sleep(0.2)
+    start = time.monotonic()
+    assert not runner.stop_all(timeout=0.5)
+    assert time.monotonic() - start < 1.5
+    assert runner.wait(timeout=0)
+    grabber.release_me.set()
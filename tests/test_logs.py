@@ -0,0 +1,72 @@
+import io
+import json
+import logging
+import queue
+
+import pytest
+
+from glcontrol.logs import AsyncQueueHandler, RateLimitFilter, logging_settings, setup_logging, shutdown_logging
+
+
+@pytest.fixture
+def log_stream():
+    root = logging.getLogger()
+    level = root.level
+    stream = io.StringIO()
+    yield stream
+    shutdown_logging()
+    root.setLevel(level)
+
+
+def _record(msg: str, *args, lineno: int = 1) -> logging.LogRecord:
+    return logging.LogRecord("glcontrol.test", logging.WARNING, "test.py", lineno, msg, args, None)
+
+
+def test_rate_limit_is_per_line():
+    now = [0.0]
+    limit = RateLimitFilter(burst=3, period=60, clock=lambda: now[0])
+    assert [limit.filter(_record("poll failed")) for _ in range(5)] == [True, True, True, False, False]
+    assert limit.filter(_record("something else", lineno=2))
+    now[0] = 61
+    record = _record("poll failed")
+    assert limit.filter(record)
+    assert record.suppressed == 2
+
+
+def test_rate_limit_is_per_subject():
+    limit = RateLimitFilter(burst=2, period=60, clock=lambda: 0.0)
+    for _ in range(5):
+        limit.filter(_record("Scheduled job %s failed", "proc-a"))
+    assert not limit.filter(_record("Scheduled job %s failed", "proc-a"))
+    assert limit.filter(_record("Scheduled job %s failed", "proc-b"))  # same line, but another loop
+
+
+def test_queue_handler_drops_rather_than_blocks():
+    handler = AsyncQueueHandler(queue.Queue(1))
+    handler.handle(_record("first %s", "arg"))
+    handler.handle(_record("second"))
+    assert handler.dropped == 1
+    queued = handler.queue.get_nowait()
+    assert queued.msg == "first arg" and queued.args is None
+
+
+def test_json_output(log_stream):
+    setup_logging(level="debug", format="json", stream=log_stream)
+    logging.getLogger("glcontrol.test").debug("Grabbed %d frames", 3, extra={"camera": "front-door"})
+    shutdown_logging()
+    entry = json.loads(log_stream.getvalue())
+    assert entry["message"] == "Grabbed 3 frames"
+    assert entry["level"] == "DEBUG"
+    assert entry["camera"] == "front-door"
+    assert logging_settings()["format"] == "json"
+
+
+def test_text_output_notes_suppressed_messages(log_stream):
+    setup_logging(level="info", rate_limit=1, rate_period=0.05, stream=log_stream, tag="worker 1")
+    logger = logging.getLogger("glcontrol.test")
+    for _ in range(2):
+        logger.info("Camera is down")  # one line of code, so the second is suppressed
+    logger.debug("Not enabled")
+    shutdown_logging()
+    (line,) = log_stream.getvalue().splitlines()
+    assert line.startswith("[worker 1] ") and line.endswith("INFO glcontrol.test: Camera is down")
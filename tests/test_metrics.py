@@ -0,0 +1,62 @@
+import time
+import urllib.request
+
+from glcontrol.metrics import MetricsRegistry, MetricsServer
+
+
+def test_counter_and_histogram_render():
+    registry = MetricsRegistry()
+    errors = registry.counter("test_errors_total", "Errors", ("processor",))
+    latency = registry.histogram("test_latency_seconds", "Latency", ("camera",), buckets=(0.1, 1.0))
+    errors.labels("door").inc()
+    errors.labels("door").inc(2)
+    latency.labels("front").observe(0.05)
+    latency.labels("front").observe(0.5)
+    latency.labels("front").observe(5)
+    text = registry.render()
+    assert "# TYPE test_errors_total counter" in text
+    assert 'test_errors_total{processor="door"} 3.0' in text
+    assert 'test_latency_seconds_bucket{camera="front",le="0.1"} 1' in text
+    assert 'test_latency_seconds_bucket{camera="front",le="1.0"} 2' in text
+    assert 'test_latency_seconds_bucket{camera="front",le="+Inf"} 3' in text
+    assert 'test_latency_seconds_count{camera="front"} 3' in text
+
+
+def test_label_values_are_escaped():
+    registry = MetricsRegistry()
+    registry.counter("test_total", "Test", ("name",)).labels('say "hi"').inc()
+    assert 'test_total{name="say \\"hi\\""} 1.0' in registry.render()
+
+
+def test_reregistering_returns_same_metric():
+    registry = MetricsRegistry()
+    first = registry.counter("test_total", "Test", ("name",))
+    assert registry.counter("test_total", "Test", ("name",)) is first
+
+
+def test_metrics_server():
+    registry = MetricsRegistry()
+    registry.counter("test_served_total", "Served").labels().inc()
+    server = MetricsServer(0, registry=registry).start()
+    try:
+        with urllib.request.urlopen(f"http://127.0.0.1:{server.port}/metrics") as response:
+            body = response.read().decode()
+        assert "test_served_total 1.0" in body
+    finally:
+        server.stop()
+
+
+def test_observe_overhead_is_small():
+    """Benchmark the per-iteration cost of the instrumentation on a control loop."""
+    registry = MetricsRegistry()
+    histograms = [registry.histogram(f"test_h{n}_seconds", "Bench", ("processor",)).labels("p") for n in range(5)]
+    iterations = 10_000
+    start = time.perf_counter()
+    for _ in range(iterations):
+        for histogram in histograms:
+            with histogram.time():
+                pass
+    per_iteration = (time.perf_counter() - start) / iterations
+    # Typically a few microseconds, against a poll of tens of milliseconds at least.  The bound is
+    # loose so a busy machine doesn't fail it, while still catching anything like blocking I/O.
+    assert per_iteration < 1e-3
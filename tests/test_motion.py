@@ -0,0 +1,49 @@
+import numpy as np
+
+from glcontrol.motion import MotionGate
+
+
+def _frame(value: int = 0, height: int = 480, width: int = 640) -> np.ndarray:
+    return np.full((height, width, 3), value, dtype=np.uint8)
+
+
+def test_first_frame_always_submits():
+    gate = MotionGate()
+    assert gate.should_submit(_frame(), now=0)
+
+
+def test_static_scene_is_skipped():
+    gate = MotionGate(max_skip=60)
+    assert gate.should_submit(_frame(), now=0)
+    for t in range(1, 10):
+        assert not gate.should_submit(_frame(), now=t)
+    assert gate.skipped == 9
+
+
+def test_motion_submits():
+    gate = MotionGate(pct_threshold=1.0)
+    gate.should_submit(_frame(), now=0)
+    moved = _frame()
+    moved[100:300, 100:300] = 255
+    assert gate.should_submit(moved, now=1)
+    # The reference is now the moved frame, so the same frame again is static
+    assert not gate.should_submit(moved.copy(), now=2)
+
+
+def test_max_skip_forces_submission():
+    gate = MotionGate(max_skip=30)
+    gate.should_submit(_frame(), now=0)
+    assert not gate.should_submit(_frame(), now=29)
+    assert gate.should_submit(_frame(), now=30)
+
+
+def test_thumbnail_is_downscaled():
+    gate = MotionGate(max_dim=160)
+    thumb = gate.thumbnail(_frame(height=2160, width=3840))
+    assert max(thumb.shape) <= 160
+    assert thumb.ndim == 2
+
+
+def test_none_frame_is_never_submitted():
+    gate = MotionGate()
+    assert not gate.should_submit(None)
@@ -0,0 +1,166 @@
+import functools
+import json
+import threading
+import time
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from glcontrol.bench import StubGroundlight, SyntheticGrabberFactory
+from glcontrol.cfgtools.specs import GLControlSpec
+from glcontrol.multiproc import MultiprocessRunner, SharedFrameGrabber, SharedFrameSlot, plan_shards
+
+
+def _spec(camera_of: list[int], **extra) -> GLControlSpec:
+    """One processor per entry in `camera_of`, reading from that camera, each with its own detector."""
+    cameras = sorted(set(camera_of))
+    return GLControlSpec(
+        cameras=[
+            {"name": f"mp-cam-{n}", "input_type": "generic_usb", "id": {"serial_number": str(n)}} for n in cameras
+        ],
+        detectors=[{"name": f"mp-det-{n}", "query": "Is it?"} for n in range(len(camera_of))],
+        processors=[
+            {
+                "name": f"mp-proc-{n}",
+                "type": "simple-camera-detector",
+                "inputs": [{"camera": f"mp-cam-{camera}"}],
+                "options": {"detector": f"mp-det-{n}", "poll": {"every": 0.1}},
+            }
+            for n, camera in enumerate(camera_of)
+        ],
+        **extra,
+    )
+
+
+def test_plan_shards_splits_busy_camera():
+    plans = plan_shards(_spec([0, 0, 0, 1]), processes=2)
+    assert [[p.name for p in plan.spec.processors] for plan in plans] == [
+        ["mp-proc-0", "mp-proc-1"],
+        ["mp-proc-2", "mp-proc-3"],
+    ]
+    assert plans[0].publish == ["mp-cam-0"]
+    assert plans[1].subscribe == ["mp-cam-0"]
+    assert [d.name for d in plans[1].spec.detectors] == ["mp-det-2", "mp-det-3"]
+    assert plans[0].spec.cameras[0].frame_cache.background
+
+
+def test_plan_shards_keeps_camera_groups_together():
+    plans = plan_shards(_spec([0, 1, 0, 1]), processes=2)
+    assert all(len(plan.spec.cameras) == 1 for plan in plans)
+    assert not any(plan.publish or plan.subscribe for plan in plans)
+
+
+def test_shared_frame_slot():
+    slot = SharedFrameSlot.create(max_bytes=64 * 48 * 3)
+    reader = SharedFrameGrabber(SharedFrameSlot.attach(slot.name), first_frame_timeout=0.1)
+    assert slot.read() is None
+    frame = np.random.default_rng(0).integers(0, 255, (48, 64, 3), dtype=np.uint8)
+    slot.write(frame)
+    assert np.array_equal(reader.grab(), frame)
+    reader.release()
+    slot.close()
+    slot.unlink()
+
+
+def test_shared_frame_grabber_fails_once_frames_stop():
+    slot = SharedFrameSlot.create(max_bytes=64 * 48 * 3)
+    frame = np.zeros((48, 64, 3), dtype=np.uint8)
+    slot.write(frame)
+    reader = SharedFrameGrabber(SharedFrameSlot.attach(slot.name), first_frame_timeout=0.1)
+    reader.grab()
+    time.sleep(0.15)
+    with pytest.raises(RuntimeError, match="No new frames"):
+        reader.grab()
+    slot.write(frame)
+    assert np.array_equal(reader.grab(), frame)
+    reader.release()
+    slot.close()
+    slot.unlink()
+
+
+def test_shared_frame_slot_survives_changes_of_size():
+    slot = SharedFrameSlot.create(max_bytes=64 * 48 * 3)
+    frames = [np.full((48, 64, 3), 1, dtype=np.uint8), np.full((24, 32), 2, dtype=np.uint8)]
+    stop = threading.Event()
+
+    def write():
+        n = 0
+        while not stop.is_set():
+            slot.write(frames[n % 2])
+            n += 1
+            time.sleep(0.0001)
+
+    writer = threading.Thread(target=write)
+    writer.start()
+    try:
+        for _ in range(500):
+            frame = slot.read()
+            assert any(frame.shape == f.shape and np.array_equal(frame, f) for f in frames)
+    finally:
+        stop.set()
+        writer.join()
+    slot.close()
+    slot.unlink()
+
+
+def test_collector_leaves_workers_alone_while_reconfiguring():
+    runner = MultiprocessRunner(_spec([0]), processes=1)
+    worker = SimpleNamespace(
+        index=0,
+        process=SimpleNamespace(is_alive=lambda: False, exitcode=0),
+        restart_at=None,
+        processor_names=["mp-proc-0"],
+    )
+    runner._workers = [worker]
+    runner._running = True
+    runner._reconfiguring = True
+    runner._check_workers()
+    assert worker.restart_at is None
+    runner._reconfiguring = False
+    runner._check_workers()
+    assert worker.restart_at is not None
+
+
+def test_apply_only_restarts_changed_shards():
+    runner = MultiprocessRunner(_spec([0, 0, 0, 1]), processes=2)
+    started = []
+    runner._start_worker = lambda worker: started.append(worker.index)
+    runner._running = True
+    runner._start_workers(plan_shards(runner.spec, runner.processes))
+    slots = dict(runner._slots)
+    started.clear()
+    new_spec = _spec([0, 0, 0, 1])
+    new_spec.processors[3].options["poll"] = {"every": 0.2}
+    changes = runner.apply(new_spec)
+    assert changes["processors"] == ["mp-proc-3"]
+    assert started == [1]
+    assert runner._slots == slots  # mp-cam-0 is still published by worker 0
+    runner._running = False
+    runner._stop_workers(timeout=1)
+    runner._close_slots(list(runner._slots))
+
+
+def test_runs_processors_in_worker_processes(tmp_path):
+    events = tmp_path / "events.jsonl"
+    spec = _spec(
+        [0, 0, 1],
+        actions=[{"name": "mp-log", "type": "file", "detector": "mp-det-2", "options": {"path": str(events)}}],
+    )
+    runner = MultiprocessRunner(
+        spec,
+        processes=2,
+        sdk_factory=functools.partial(StubGroundlight, latency=0),
+        grabber_factory=SyntheticGrabberFactory(width=64, height=48),
+    )
+    runner.run_all()
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        health = runner.health()
+        if len(health) == 3 and all(entry.get("runs", 0) > 0 for entry in health.values()):
+            break
+        time.sleep(0.2)
+    assert runner.stop_all(timeout=10)
+    assert sorted(health) == ["mp-proc-0", "mp-proc-1", "mp-proc-2"]
+    assert all(entry["runs"] > 0 for entry in health.values())
+    assert json.loads(events.read_text().splitlines()[0])["detector"] == "mp-det-2"
@@ -1,5 +1,8 @@
+import json
 import os
 
+import pytest
+
 import glcontrol.cfgtools.base as cfgtools
 from glcontrol.cfgtools.specs import GLControlManifest
 
@@ -35,3 +38,40 @@ def test_parse_bad_samples():
             assert False, f"Expected to fail parsing {f}, but instead got a valid {out}"
         except cfgtools.ParsingError as e:
             print(f"Successfully failed parsing {f}: {e}")
+
+
+def _manifest_yaml(cameras: list[str]) -> str:
+    lines = ["glcontrol:", "  cameras:"]
+    for name in cameras:
+        lines += [f"    - name: {name}", "      input_type: generic_usb", "      id: {serial_number: '1'}"]
+    return "\n".join(lines) + "\n"
+
+
+def test_parse_reports_errors_in_bulk():
+    text = "glcontrol:\n  cameras:\n" + "".join(f"    - name: cam-{n}\n" for n in range(100))
+    with pytest.raises(cfgtools.ParsingError) as exc_info:
+        GLControlManifest.from_yaml(text)
+    message = str(exc_info.value)
+    assert "200 errors" in message  # input_type and id missing from each camera
+    assert "... and 150 more" in message
+
+
+def test_parse_rejects_duplicate_names():
+    with pytest.raises(cfgtools.ParsingError, match="Duplicate cameras names: cam-a"):
+        GLControlManifest.from_yaml(_manifest_yaml(["cam-a", "cam-b", "cam-a"]))
+
+
+def test_parse_caches_by_content(tmp_path, monkeypatch):
+    monkeypatch.setenv("GLCONTROL_SPEC_CACHE", str(tmp_path))
+    text = _manifest_yaml(["cached-cam"])
+    first = GLControlManifest.from_yaml(text)
+    assert GLControlManifest.from_yaml(text) is first
+    assert len(list(tmp_path.glob("*.json"))) == 1
+    cfgtools.SPEC_CACHE.clear()
+    assert GLControlManifest.from_yaml(text) == first  # from disk this time
+    assert GLControlManifest.from_yaml(_manifest_yaml(["other-cam"])) != first
+
+
+def test_parse_json_manifest():
+    text = json.dumps({"glcontrol": {"detectors": [{"name": "json-det", "query": "Is it?"}]}})
+    assert GLControlManifest.from_yaml(text).glcontrol.detectors[0].name == "json-det"
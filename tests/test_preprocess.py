@@ -0,0 +1,50 @@
+import cv2
+import numpy as np
+import pytest
+from pydantic import ValidationError
+
+from glcontrol.cfgtools.specs import PreprocessSpec
+from glcontrol.preprocess import FramePreprocessor
+
+
+def _frame(height: int = 2160, width: int = 3840) -> np.ndarray:
+    rng = np.random.default_rng(0)
+    return rng.integers(0, 255, size=(height, width, 3), dtype=np.uint8)
+
+
+def test_crop_is_a_view():
+    frame = _frame(100, 200)
+    cropped = FramePreprocessor(roi=(0.5, 0.0, 1.0, 0.5)).crop(frame)
+    assert cropped.shape == (50, 100, 3)
+    assert np.shares_memory(cropped, frame)
+
+
+def test_resize_limits_longest_side():
+    resized = FramePreprocessor(max_dim=640).resize(_frame())
+    assert resized.shape == (360, 640, 3)
+
+
+def test_resize_never_enlarges():
+    frame = _frame(100, 200)
+    assert FramePreprocessor(max_dim=640).resize(frame) is frame
+
+
+def test_resize_reuses_buffer():
+    preprocessor = FramePreprocessor(max_dim=320)
+    first = preprocessor.prepare(_frame(480, 640))
+    second = preprocessor.prepare(_frame(480, 640))
+    assert first is second
+
+
+def test_process_produces_smaller_jpeg():
+    frame = _frame()
+    full = FramePreprocessor(jpeg_quality=95).process(frame)
+    small = FramePreprocessor(roi=(0.25, 0.25, 0.75, 0.75), max_dim=640, jpeg_quality=60).process(frame)
+    assert len(small) < len(full)
+    decoded = cv2.imdecode(np.frombuffer(small, dtype=np.uint8), cv2.IMREAD_COLOR)
+    assert decoded.shape == (360, 640, 3)
+
+
+def test_spec_rejects_empty_roi():
+    with pytest.raises(ValidationError):
+        PreprocessSpec(roi={"left": 0.5, "right": 0.5})
@@ -0,0 +1,149 @@
+from glcontrol.bench import StubGroundlight, SyntheticFrameGrabber
+from glcontrol.cfgtools.specs import GLControlSpec
+from glcontrol.runner import SpecRunner
+
+
+class CountingStub(StubGroundlight):
+    def __init__(self):
+        super().__init__(latency=0)
+        self.created = []
+
+    def get_or_create_detector(self, name, query, confidence_threshold=None):
+        self.created.append(name)
+        return super().get_or_create_detector(name, query, confidence_threshold)
+
+
+def _spec(query_b: str = "Is B?", cameras: int = 2, poll: str = "1 min") -> GLControlSpec:
+    return GLControlSpec(
+        cameras=[
+            {"name": f"reload-cam-{n}", "input_type": "generic_usb", "id": {"serial_number": str(n)}}
+            for n in range(cameras)
+        ],
+        detectors=[{"name": "reload-a", "query": "Is A?"}, {"name": "reload-b", "query": query_b}],
+        processors=[
+            {
+                "name": "proc-a",
+                "type": "simple-camera-detector",
+                "inputs": [{"camera": "reload-cam-0"}],
+                "options": {"detector": "reload-a", "poll": {"every": poll}},
+            },
+            {
+                "name": "proc-b",
+                "type": "simple-camera-detector",
+                "inputs": [{"camera": "reload-cam-1"}],
+                "options": {"detector": "reload-b"},
+            },
+        ],
+    )
+
+
+def _runner(spec: GLControlSpec) -> tuple[SpecRunner, CountingStub, list]:
+    sdk = CountingStub()
+    opened = []
+
+    def grabber_factory(camera):
+        opened.append(camera.name)
+        return SyntheticFrameGrabber(width=32, height=24)
+
+    return SpecRunner(spec, sdk=sdk, grabber_factory=grabber_factory), sdk, opened
+
+
+def test_unchanged_config_touches_nothing():
+    runner, sdk, opened = _runner(_spec())
+    loops_before = list(runner.control_loops)
+    changes = runner.apply(_spec())
+    assert changes == {"cameras": [], "detectors": [], "processors": [], "actions": []}
+    assert runner.control_loops == loops_before
+    assert sdk.created == ["reload-a", "reload-b"]
+    assert opened == ["reload-cam-0", "reload-cam-1"]
+
+
+def test_changed_detector_restarts_only_its_processor():
+    runner, sdk, opened = _runner(_spec())
+    proc_a = next(loop for loop in runner.control_loops if loop.spec.name == "proc-a")
+    changes = runner.apply(_spec(query_b="Is B now?"))
+    assert changes["detectors"] == ["reload-b"]
+    assert changes["processors"] == ["proc-b"]
+    assert sdk.created == ["reload-a", "reload-b", "reload-b"]
+    assert proc_a in runner.control_loops
+    assert len(opened) == 2
+
+
+def test_changed_processor_is_rescheduled():
+    runner, sdk, opened = _runner(_spec())
+    runner.run_all()
+    try:
+        changes = runner.apply(_spec(poll="30 sec"))
+        assert changes["processors"] == ["proc-a"]
+        assert sorted(job.name for job in runner.scheduler.jobs) == ["proc-a", "proc-b"]
+        job_a = next(job for job in runner.scheduler.jobs if job.name == "proc-a")
+        assert job_a.period == 30
+    finally:
+        runner.stop_all()
+
+
+def test_removed_camera_is_closed_with_its_processor():
+    runner, sdk, opened = _runner(_spec())
+    spec = _spec(cameras=1)
+    spec.processors = spec.processors[:1]
+    changes = runner.apply(spec)
+    assert changes["cameras"] == ["reload-cam-1"]
+    assert changes["processors"] == ["proc-b"]
+    assert [loop.spec.name for loop in runner.control_loops] == ["proc-a"]
+    assert [camera.spec.name for camera in runner.image_sources] == ["reload-cam-0"]
+
+
+def test_reload_carries_on_past_a_camera_which_fails():
+    runner, sdk, opened = _runner(_spec())
+
+    def broken(camera):
+        raise RuntimeError("no such camera")
+
+    runner.grabber_factory = broken
+    new_spec = _spec(cameras=3)
+    new_spec.cameras[1].options = {"changed": True}
+    changes = runner.apply(new_spec)
+    assert changes["cameras"] == ["reload-cam-1", "reload-cam-2"]
+    assert runner.spec is new_spec
+    assert [camera.spec.name for camera in runner.image_sources] == ["reload-cam-0"]
+    health = runner.health()
+    assert not health["reload-cam-1"]["healthy"] and not health["reload-cam-2"]["healthy"]
+    assert health["proc-b"]["state"] == "failed"
+    assert health["proc-a"]["healthy"]
+    runner.stop_all(timeout=1)
+
+
+def test_reload_restarts_a_processor_once_its_camera_is_fixed():
+    runner, sdk, opened = _runner(_spec())
+    factory = runner.grabber_factory
+
+    def broken(camera):
+        raise RuntimeError("no such camera")
+
+    runner.grabber_factory = broken
+    broken_spec = _spec()
+    broken_spec.cameras[1].options = {"changed": True}
+    runner.apply(broken_spec)
+    assert runner.health()["proc-b"]["state"] == "failed"
+    runner.grabber_factory = factory
+    changes = runner.apply(_spec())
+    assert changes["cameras"] == ["reload-cam-1"]
+    assert changes["processors"] == ["proc-b"]
+    assert runner.health()["proc-b"]["healthy"]
+    assert sorted(loop.spec.name for loop in runner.control_loops) == ["proc-a", "proc-b"]
+    runner.stop_all(timeout=1)
+
+
+def test_reload_carries_on_past_a_detector_which_fails():
+    runner, sdk, opened = _runner(_spec())
+
+    def broken(name, query, confidence_threshold=None):
+        raise RuntimeError("service unavailable")
+
+    sdk.get_or_create_detector = broken
+    changes = runner.apply(_spec(query_b="Is B now?"))
+    assert changes["processors"] == ["proc-b"]
+    assert runner.health()["reload-b"]["state"] == "failed"
+    assert runner.health()["proc-b"]["state"] == "failed"
+    assert [loop.spec.name for loop in runner.control_loops] == ["proc-a"]
+    runner.stop_all(timeout=1)
@@ -0,0 +1,122 @@
+import io
+import json
+
+import cv2
+import numpy as np
+import pytest
+
+from glcontrol.cfgtools.specs import GLControlSpec
+from glcontrol.replay import ImageDirectory, VideoFile, format_replay_result, run_replay
+from glcontrol.scheduler import Scheduler, VirtualClock
+
+
+def _frame(n: int) -> np.ndarray:
+    frame = np.zeros((48, 64, 3), dtype=np.uint8)
+    frame[:, (n * 8) % 64 : (n * 8) % 64 + 8] = 255
+    return frame
+
+
+@pytest.fixture
+def image_dir(tmp_path):
+    for n in range(10):
+        cv2.imwrite(str(tmp_path / f"{n:03d}.png"), _frame(n))
+    return str(tmp_path)
+
+
+def _spec(**options) -> GLControlSpec:
+    return GLControlSpec(
+        cameras=[{"name": "replay-cam", "input_type": "generic_usb", "id": {"serial_number": "0"}}],
+        detectors=[{"name": "replay-det", "query": "Is it?"}],
+        processors=[
+            {
+                "name": "replay-proc",
+                "type": "simple-camera-detector",
+                "inputs": [{"camera": "replay-cam"}],
+                "options": {"detector": "replay-det", "poll": {"every": "60 sec", "offset": 0}, **options},
+            }
+        ],
+    )
+
+
+def test_virtual_time_runs_a_day_at_once():
+    clock = VirtualClock()
+    scheduler = Scheduler(stagger=False, clock=clock)
+    times = []
+    job = scheduler.add("hourly", lambda: times.append(clock()), period=3600)
+    assert scheduler.run_virtual(86400) == 24
+    assert times == [3600.0 * n for n in range(24)]
+    assert job.runs == 24
+    assert clock() == 86400
+
+
+def test_image_directory_frames(image_dir):
+    recording = ImageDirectory(image_dir, fps=2)
+    assert recording.duration == 5
+    assert np.array_equal(recording.frame_at(1.6), _frame(3))
+    assert recording.frame_at(1.9) is recording.frame_at(1.6)
+    assert recording.frame_at(5) is None
+
+
+def test_npy_frames_are_memory_mapped(tmp_path):
+    np.save(tmp_path / "000.npy", _frame(1))
+    frame = ImageDirectory(str(tmp_path)).frame_at(0)
+    assert isinstance(frame, np.memmap)
+    assert np.array_equal(frame, _frame(1))
+
+
+def test_video_file_frames(tmp_path):
+    path = str(tmp_path / "clip.avi")
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"MJPG"), 10, (64, 48))
+    for n in range(100):
+        writer.write(_frame(n))
+    writer.release()
+    recording = VideoFile(path)
+    assert recording.duration == pytest.approx(10)
+    for t in (0.0, 0.5, 9.0, 2.0):  # forwards, far forwards, then backwards
+        n = int(t * 10)
+        assert np.abs(recording.frame_at(t).astype(int) - _frame(n)).mean() < 10
+    assert recording.frame_at(11) is None
+    recording.close()
+
+
+def test_replay_logs_results_in_footage_time(image_dir):
+    output = io.StringIO()
+    result = run_replay(_spec(), {None: image_dir}, fps=1 / 60, output=output)
+    records = [json.loads(line) for line in output.getvalue().splitlines()]
+    assert [r["time"] for r in records] == [60.0 * n for n in range(10)]
+    assert {r["processor"] for r in records} == {"replay-proc"}
+    assert result.footage_seconds == 600
+    assert result.frames_sent == 10
+    assert result.processors[0].polls == 10
+    assert "10 results" in format_replay_result(result)
+
+
+def test_replay_counts_multi_camera_results(image_dir):
+    spec = GLControlSpec(
+        cameras=[
+            {"name": f"replay-cam-{n}", "input_type": "generic_usb", "id": {"serial_number": str(n)}} for n in range(2)
+        ],
+        detectors=[{"name": "replay-det", "query": "Is it?"}],
+        processors=[
+            {
+                "name": "replay-multi",
+                "type": "multi-camera-detector",
+                "inputs": [{"camera": "replay-cam-0"}, {"camera": "replay-cam-1"}],
+                "options": {"detector": "replay-det", "poll": {"every": "60 sec", "offset": 0}},
+            }
+        ],
+    )
+    output = io.StringIO()
+    result = run_replay(spec, {None: image_dir}, fps=1 / 60, output=output)
+    records = [json.loads(line) for line in output.getvalue().splitlines()]
+    assert {r["processor"] for r in records} == {"replay-multi/replay-cam-0", "replay-multi/replay-cam-1"}
+    assert result.processors[0].results == len(records) == 20
+
+
+def test_replay_motion_gating_uses_footage_time(tmp_path):
+    for n in range(10):
+        cv2.imwrite(str(tmp_path / f"{n:03d}.png"), _frame(0))
+    motion = {"motion-detection": {"enabled": True, "max_skip": "5 min"}}
+    result = run_replay(_spec(**motion), {"replay-cam": str(tmp_path)}, fps=1 / 60, output=io.StringIO())
+    # A still scene is only looked at every max_skip, of footage rather than wall time
+    assert result.frames_sent == 2
@@ -0,0 +1,79 @@
+from types import SimpleNamespace
+
+import numpy as np
+
+from glcontrol.cfgtools.specs import ControlLoopSpec, DetectorSpec
+from glcontrol.resultcache import ResultCache, dhash
+from glcontrol.runner import ControlLoop, DetectorRT
+
+
+def _result(label: str = "NO", confidence: float | None = 0.95):
+    return SimpleNamespace(result=SimpleNamespace(label=label, confidence=confidence))
+
+
+def _scene(seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    return rng.integers(0, 255, size=(480, 640, 3), dtype=np.uint8)
+
+
+class StubGroundlight:
+    def __init__(self, confidence: float = 0.95):
+        self.confidence = confidence
+        self.asked = 0
+
+    def get_or_create_detector(self, name, query, confidence_threshold=None):
+        return SimpleNamespace(id=f"det_{name}", name=name)
+
+    def ask_ml(self, detector, image):
+        self.asked += 1
+        return _result(confidence=self.confidence)
+
+
+class DetectOnlyLoop(ControlLoop):
+    registry_name = "test-detect-only"
+
+
+def test_dhash_similar_frames_are_close():
+    frame = _scene()
+    noisy = np.clip(frame.astype(np.int16) + 3, 0, 255).astype(np.uint8)
+    assert (dhash(frame) ^ dhash(noisy)).bit_count() <= 4
+    assert (dhash(frame) ^ dhash(_scene(seed=1))).bit_count() > 10
+
+
+def test_cache_hit_and_miss_counters():
+    cache = ResultCache(max_distance=2)
+    assert cache.get(0b1010, now=0) is None
+    cache.put(0b1010, _result(), now=0)
+    assert cache.get(0b1011, now=1) is not None
+    assert cache.get(0b0101, now=1) is None
+    assert (cache.hits, cache.misses) == (1, 2)
+
+
+def test_cache_ttl_and_lru():
+    cache = ResultCache(max_entries=2, ttl=10, max_distance=0)
+    cache.put(1, _result(), now=0)
+    cache.put(2, _result(), now=0)
+    cache.get(1, now=1)  # 1 is now more recently used than 2
+    cache.put(3, _result(), now=1)
+    assert len(cache) == 2
+    assert cache.get(2, now=1) is None
+    assert cache.get(1, now=11) is None  # expired
+
+
+def test_low_confidence_not_cached():
+    cache = ResultCache(min_confidence=0.9)
+    cache.put(1, _result(confidence=0.6))
+    cache.put(2, _result(confidence=None))
+    assert len(cache) == 0
+
+
+def test_detect_reuses_cached_result():
+    sdk = StubGroundlight()
+    detector_rt = DetectorRT(DetectorSpec(name="cached", query="Is it?", result_cache={}), sdk)
+    loop = ControlLoop.from_spec(ControlLoopSpec(name="l", inputs=[], type="test-detect-only"), sdk)
+    frame = _scene()
+    for _ in range(5):
+        loop._detect(detector_rt, frame)
+    loop._detect(detector_rt, _scene(seed=2))
+    assert sdk.asked == 2
+    assert detector_rt.result_cache.hits == 4
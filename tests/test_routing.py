@@ -0,0 +1,70 @@
+import numpy as np
+
+from glcontrol.bench import StubGroundlight, SyntheticFrameGrabber
+from glcontrol.cfgtools.specs import GLControlSpec, RoutingPolicy
+from glcontrol.client import ResilientClient, tune_sdk
+from glcontrol.routing import InferenceRouter
+from glcontrol.runner import SpecRunner
+
+IMAGE = np.zeros((8, 8, 3), dtype=np.uint8)
+
+
+def _router(fake_service, policy: RoutingPolicy, escalate_below: float = 0.9):
+    cloud = StubGroundlight(latency=0, confidence=0.99)
+    tune_sdk(fake_service.sdk, 4)
+    router = InferenceRouter(cloud, ResilientClient(fake_service.sdk, retries=0))
+    router.set_route("det_1", policy, escalate_below=escalate_below)
+    return router, cloud
+
+
+def test_escalates_only_unconfident_answers(fake_service):
+    router, cloud = _router(fake_service, RoutingPolicy.local_escalate)
+    assert router.ask_ml("det_1", IMAGE).result.confidence == 0.95
+    assert cloud.requests == 0
+    fake_service.confidence = 0.6
+    assert router.ask_ml("det_1", IMAGE).result.confidence == 0.99
+    assert cloud.requests == 1
+    assert len(fake_service.posts) == 2
+
+
+def test_local_first_falls_back_to_cloud(fake_service):
+    router, cloud = _router(fake_service, RoutingPolicy.local_first)
+    fake_service.confidence = 0.6
+    assert router.ask_ml("det_1", IMAGE).result.confidence == 0.6  # not escalated
+    fake_service.failures = [503]
+    assert router.ask_ml("det_1", IMAGE).result.confidence == 0.99
+    assert cloud.requests == 1
+
+
+def test_cloud_only_without_edge():
+    cloud = StubGroundlight(latency=0)
+    router = InferenceRouter(cloud)
+    router.set_route("det_1", RoutingPolicy.local_escalate)
+    router.ask_ml("det_1", IMAGE)
+    assert cloud.requests == 1
+
+
+def test_runner_routes_to_edge(fake_service):
+    spec = GLControlSpec(
+        cameras=[{"name": "edge-cam", "input_type": "generic_usb", "id": {"serial_number": "0"}}],
+        detectors=[
+            {"name": "edge-det", "query": "Is it?", "routing": {"policy": "local-escalate", "escalate_below": 0.8}}
+        ],
+        processors=[
+            {
+                "name": "edge-proc",
+                "type": "simple-camera-detector",
+                "inputs": [{"camera": "edge-cam"}],
+                "options": {"detector": "edge-det"},
+            }
+        ],
+    )
+    cloud = StubGroundlight(latency=0)
+    runner = SpecRunner(
+        spec, sdk=cloud, edge_sdk=fake_service.sdk, grabber_factory=lambda c: SyntheticFrameGrabber(64, 48)
+    )
+    (loop,) = runner.control_loops
+    loop.run_once()
+    assert cloud.requests == 0
+    assert "detector_id=det_edge-det" in fake_service.posts[0]
+    runner.stop_all(timeout=1)
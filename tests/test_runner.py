@@ -0,0 +1,282 @@
+import threading
+import time
+
+import cv2
+import framegrab
+import numpy as np
+import pytest
+
+from glcontrol.bench import StubGroundlight, SyntheticFrameGrabber
+from glcontrol.cfgtools.specs import CameraSpec, GLControlSpec
+from glcontrol.runner import ImageSourceRT, SpecRunner, parse_time_str
+
+
+class CountingGrabber:
+    """Stands in for a framegrab grabber, and counts how often it's decoded."""
+
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay
+        self.grabs = 0
+        self.released = False
+
+    def grab(self) -> np.ndarray:
+        time.sleep(self.delay)
+        self.grabs += 1
+        return np.zeros((48, 64, 3), dtype=np.uint8)
+
+    def release(self):
+        self.released = True
+
+
+@pytest.fixture
+def fake_grabber(monkeypatch) -> CountingGrabber:
+    grabber = CountingGrabber(delay=0.01)
+    monkeypatch.setattr(framegrab.FrameGrabber, "create_grabber", lambda config: grabber)
+    return grabber
+
+
+def _camera_spec(**frame_cache) -> CameraSpec:
+    return CameraSpec(name="cam", input_type="generic_usb", id={"serial_number": "0"}, frame_cache=frame_cache)
+
+
+def test_parse_time_str():
+    assert parse_time_str("30 sec") == 30
+    assert parse_time_str("2 min") == 120
+    assert parse_time_str("1.5") == 1.5
+    assert parse_time_str(None, default=7) == 7
+    with pytest.raises(ValueError):
+        parse_time_str("soon")
+
+
+def test_uncached_camera_grabs_every_time(fake_grabber):
+    camera = ImageSourceRT(_camera_spec())
+    for _ in range(3):
+        camera.grab()
+    assert fake_grabber.grabs == 3
+
+
+def test_cached_camera_shares_frames(fake_grabber):
+    camera = ImageSourceRT(_camera_spec(max_age="10 sec"))
+    frames = []
+    threads = [threading.Thread(target=lambda: frames.append(camera.grab())) for _ in range(5)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert fake_grabber.grabs == 1
+    assert all(frame is frames[0] for frame in frames)
+    assert not frames[0].flags.writeable
+
+
+def test_background_grabber_keeps_cache_fresh(fake_grabber):
+    camera = ImageSourceRT(_camera_spec(background=True, interval=0.02))
+    time.sleep(0.1)
+    frame = camera.grab()
+    assert frame is not None
+    assert fake_grabber.grabs >= 2
+    camera.close()
+    assert fake_grabber.released
+
+
+def _multi_camera_spec(n_cameras: int, **options) -> GLControlSpec:
+    return GLControlSpec(
+        cameras=[
+            {"name": f"multi-cam-{n}", "input_type": "generic_usb", "id": {"serial_number": str(n)}}
+            for n in range(n_cameras)
+        ],
+        detectors=[{"name": "multi-det", "query": "Is it?"}],
+        processors=[
+            {
+                "name": "multi-proc",
+                "type": "multi-camera-detector",
+                "inputs": [{"camera": f"multi-cam-{n}"} for n in range(n_cameras)],
+                "options": {"detector": "multi-det", "poll": "every 1 sec", **options},
+            }
+        ],
+    )
+
+
+def test_multi_camera_batches_one_poll():
+    sdk = StubGroundlight(latency=0.1, latency_sigma=0)
+    runner = SpecRunner(
+        _multi_camera_spec(4), sdk=sdk, grabber_factory=lambda c: SyntheticFrameGrabber(seed=int(c.name[-1]))
+    )
+    (loop,) = runner.control_loops
+    start = time.monotonic()
+    results = loop.run_once()
+    assert time.monotonic() - start < 0.35  # the four requests overlap
+    assert sorted(results) == [f"multi-cam-{n}" for n in range(4)]
+    assert sdk.requests == 4
+    runner.stop_all(timeout=1)
+
+
+def test_multi_camera_results_say_which_camera():
+    routed = []
+    runner = SpecRunner(
+        _multi_camera_spec(2),
+        sdk=StubGroundlight(latency=0),
+        grabber_factory=lambda c: SyntheticFrameGrabber(),
+        result_handler=lambda detector, result, processor: routed.append((detector, processor)),
+    )
+    (loop,) = runner.control_loops
+    loop.run_once()
+    assert sorted(routed) == [("multi-det", "multi-proc/multi-cam-0"), ("multi-det", "multi-proc/multi-cam-1")]
+    runner.stop_all(timeout=1)
+
+
+def test_multi_camera_keeps_going_when_one_camera_fails():
+    class BrokenGrabber(SyntheticFrameGrabber):
+        def grab(self):
+            raise RuntimeError("stream lost")
+
+    def grabber_factory(camera):
+        return BrokenGrabber() if camera.name == "multi-cam-0" else SyntheticFrameGrabber()
+
+    runner = SpecRunner(_multi_camera_spec(3), sdk=StubGroundlight(latency=0), grabber_factory=grabber_factory)
+    (loop,) = runner.control_loops
+    with pytest.raises(RuntimeError):
+        loop.run_once()
+    assert sorted(loop.results) == ["multi-cam-1", "multi-cam-2"]
+    runner.stop_all(timeout=1)
+
+
+def test_multi_camera_adaptive_polling_backs_off():
+    adaptive = {"fastest": 1, "slowest": 8, "min_confidence": 0.5}
+    runner = SpecRunner(
+        _multi_camera_spec(2, poll={"adaptive": adaptive}),
+        sdk=StubGroundlight(latency=0, yes_rate=0, confidence=0.99),
+        grabber_factory=lambda c: SyntheticFrameGrabber(),
+    )
+    (loop,) = runner.control_loops
+    delays = []
+    for _ in range(4):
+        loop.run_once()
+        delays.append(loop.adaptive.delay)
+    assert delays == [1, 2, 4, 8]
+    runner.stop_all(timeout=1)
+
+
+class RightHalfChangingGrabber:
+    """The left half of the frame stays still, and the right half changes on every grab."""
+
+    def __init__(self):
+        self.grabs = 0
+
+    def grab(self) -> np.ndarray:
+        self.grabs += 1
+        frame = np.zeros((48, 64, 3), dtype=np.uint8)
+        frame[:, 32:] = (self.grabs * 100) % 256
+        return frame
+
+    def release(self):
+        pass
+
+
+def test_roi_detector_sends_only_changed_regions():
+    class RecordingStub(StubGroundlight):
+        def ask_ml(self, detector, image):
+            self.images.append((detector, cv2.imdecode(np.frombuffer(image, np.uint8), cv2.IMREAD_COLOR).shape))
+            return super().ask_ml(detector, image)
+
+    spec = GLControlSpec(
+        cameras=[{"name": "roi-cam", "input_type": "generic_usb", "id": {"serial_number": "0"}}],
+        detectors=[{"name": "left-det", "query": "Left?"}, {"name": "right-det", "query": "Right?"}],
+        processors=[
+            {
+                "name": "roi-proc",
+                "type": "roi-detector",
+                "inputs": [{"camera": "roi-cam"}],
+                "options": {
+                    "motion-detection": {"enabled": True},
+                    "rois": [
+                        {"name": "left", "detector": "left-det", "roi": {"right": 0.5}},
+                        {"name": "right", "detector": "right-det", "roi": {"left": 0.5}},
+                    ],
+                },
+            }
+        ],
+    )
+    sdk = RecordingStub(latency=0)
+    sdk.images = []
+    grabber = RightHalfChangingGrabber()
+    runner = SpecRunner(spec, sdk=sdk, grabber_factory=lambda c: grabber)
+    (loop,) = runner.control_loops
+    assert sorted(loop.run_once()) == ["left", "right"]
+    assert sorted(loop.run_once()) == ["right"]
+    assert grabber.grabs == 2
+    assert sorted(sdk.images) == [
+        ("det_left-det", (48, 32, 3)),
+        ("det_right-det", (48, 32, 3)),
+        ("det_right-det", (48, 32, 3)),
+    ]
+    assert sorted(loop.results) == ["left", "right"]
+    assert loop.detector_names() == ["left-det", "right-det"]
+    runner.stop_all(timeout=1)
+
+
+def test_composite_detector_skips_undecided_queries():
+    spec = GLControlSpec(
+        cameras=[{"name": "composite-cam", "input_type": "generic_usb", "id": {"serial_number": "0"}}],
+        detectors=[{"name": name, "query": f"{name}?"} for name in ("door-open", "after-hours", "person")],
+        processors=[
+            {
+                "name": "intruder",
+                "type": "composite-detector",
+                "inputs": [{"camera": "composite-cam"}],
+                "options": {
+                    "rule": {
+                        "all": [
+                            {"detector": "door-open"},
+                            {"detector": "after-hours"},
+                            {"not": {"detector": "person"}},
+                        ]
+                    }
+                },
+            }
+        ],
+    )
+    sdk = StubGroundlight(latency=0, yes_rate=0)
+    routed = []
+    runner = SpecRunner(
+        spec,
+        sdk=sdk,
+        grabber_factory=lambda c: SyntheticFrameGrabber(64, 48),
+        result_handler=lambda detector, result, processor: routed.append((detector, result.result.label)),
+    )
+    (loop,) = runner.control_loops
+    for _ in range(3):
+        assert loop.run_once().result.label == "NO"
+    # The door is never open, so nothing else needs asking
+    assert sdk.requests == 3
+    assert routed == [("door-open", "NO"), ("intruder", "NO")] * 3
+    assert loop.detector_names() == ["door-open", "after-hours", "person"]
+    sdk.yes_rate = 1
+    assert loop.run_once().result.label == "NO"  # but somebody's there
+    assert sdk.requests == 6
+    runner.stop_all(timeout=1)
+
+
+def test_adaptive_polling_backs_off_on_stable_answers():
+    spec = GLControlSpec(
+        cameras=[{"name": "adapt-cam", "input_type": "generic_usb", "id": {"serial_number": "0"}}],
+        detectors=[{"name": "adapt-det", "query": "Is it?"}],
+        processors=[
+            {
+                "name": "adapt-proc",
+                "type": "simple-camera-detector",
+                "inputs": [{"camera": "adapt-cam"}],
+                "options": {
+                    "detector": "adapt-det",
+                    "poll": {"adaptive": {"fastest": 0.02, "slowest": 0.16, "min_confidence": 0.5}},
+                },
+            }
+        ],
+    )
+    sdk = StubGroundlight(latency=0, yes_rate=0.0, confidence=0.99)
+    runner = SpecRunner(spec, sdk=sdk, grabber_factory=lambda c: SyntheticFrameGrabber(width=64, height=48))
+    (loop,) = runner.control_loops
+    runner.run_all()
+    time.sleep(0.6)
+    runner.stop_all(timeout=1)
+    assert loop.adaptive.delay == 0.16
+    assert sdk.requests < 10  # polling every 0.02 sec would have been ~30
@@ -0,0 +1,138 @@
+import threading
+import time
+
+from glcontrol.cfgtools.specs import ControlLoopSpec, OverrunPolicy
+from glcontrol.runner import ControlLoop
+from glcontrol.scheduler import AdaptiveInterval, ScheduledJob, Scheduler
+
+
+def test_fixed_rate_does_not_drift():
+    """A job which takes most of its period still runs once per period."""
+    times = []
+    scheduler = Scheduler(workers=2, stagger=False)
+    scheduler.add("slow", lambda: (times.append(time.monotonic()), time.sleep(0.03)), period=0.05)
+    scheduler.start()
+    time.sleep(0.52)
+    scheduler.stop()
+    assert 9 <= len(times) <= 12
+    gaps = [b - a for a, b in zip(times, times[1:])]
+    assert abs(sum(gaps) / len(gaps) - 0.05) < 0.01
+
+
+def test_overrun_skip():
+    scheduler = Scheduler(workers=2, stagger=False)
+    job = scheduler.add("overrun", lambda: time.sleep(0.12), period=0.05)
+    scheduler.start()
+    time.sleep(0.3)
+    scheduler.stop()
+    assert job.skipped >= 2
+    assert job.runs <= 3
+
+
+def test_overrun_catch_up():
+    scheduler = Scheduler(workers=2, stagger=False)
+    job = scheduler.add("overrun", lambda: time.sleep(0.08), period=0.05, overrun=OverrunPolicy.catch_up)
+    scheduler.start()
+    time.sleep(0.45)
+    scheduler.stop()
+    assert job.skipped == 0
+    assert job.runs >= 4
+
+
+def test_stagger_spreads_first_runs():
+    scheduler = Scheduler(stagger=True, clock=lambda: 0.0)
+    jobs = [scheduler.add(f"job{n}", lambda: None, period=10) for n in range(5)]
+    first_runs = sorted(job.next_run for job in jobs)
+    assert len(set(first_runs)) == 5
+    assert all(0 <= t < 10 for t in first_runs)
+
+
+def test_errors_dont_stop_the_job():
+    calls = []
+
+    def flaky():
+        calls.append(1)
+        raise RuntimeError("boom")
+
+    scheduler = Scheduler(stagger=False)
+    job = scheduler.add("flaky", flaky, period=0.02)
+    scheduler.start()
+    time.sleep(0.1)
+    scheduler.stop()
+    assert job.errors >= 3
+    assert len(calls) == job.errors
+
+
+def test_advance_stays_on_grid():
+    job = ScheduledJob("grid", lambda: None, period=10, first_run=100)
+    job.advance(now=100.5)
+    assert job.next_run == 110
+    job.advance(now=135)
+    assert job.next_run == 140
+
+
+def test_poll_options_syntax():
+    class PollOnlyLoop(ControlLoop):
+        registry_name = "test-poll-only"
+
+    def poll_delay(options: dict) -> float:
+        spec = ControlLoopSpec(name="p", inputs=[], type="test-poll-only", options=options)
+        return ControlLoop.from_spec(spec, sdk=None).poll_delay
+
+    assert poll_delay({"poll": {"every": "60 sec"}}) == 60
+    assert poll_delay({"poll": "every 2 min"}) == 120
+    assert poll_delay({"poll_delay": "10 sec"}) == 10
+    assert poll_delay({}) == 60
+
+
+def test_run_loop_stops():
+    class CountingLoop(ControlLoop):
+        registry_name = "test-counting"
+
+        def run_once(self):
+            self.count = getattr(self, "count", 0) + 1
+
+    spec = ControlLoopSpec(name="c", inputs=[], type="test-counting", options={"poll": {"every": 0.01}})
+    loop = ControlLoop.from_spec(spec, sdk=None)
+    thread = threading.Thread(target=loop.run_loop)
+    thread.start()
+    time.sleep(0.1)
+    loop.stop_loop()
+    thread.join(timeout=1)
+    assert not thread.is_alive()
+    assert loop.count >= 5
+
+
+def test_adaptive_interval_backs_off_and_resets():
+    interval = AdaptiveInterval(fastest=1, slowest=8, backoff=2, min_confidence=0.9)
+    delays = [interval.observe("NO", 0.95) for _ in range(6)]
+    assert delays == [1, 2, 4, 8, 8, 8]
+    assert interval.observe("YES", 0.95) == 1
+    assert interval.observe("YES", 0.95) == 2
+    assert interval.observe("YES", 0.5) == 1
+
+
+def test_adaptive_interval_with_several_answers():
+    interval = AdaptiveInterval(fastest=1, slowest=8, backoff=2, min_confidence=0.9)
+    assert interval.observe_many({"a": ("NO", 0.95), "b": ("NO", 0.95)}) == 1
+    assert interval.observe_many({"a": ("NO", 0.95), "b": ("NO", 0.95)}) == 2
+    assert interval.observe_many({"a": ("NO", 0.95)}) == 4  # b didn't move
+    assert interval.observe_many({}) == 8
+    assert interval.observe_many({"a": ("NO", 0.95), "b": ("YES", 0.95)}) == 1
+
+
+def test_job_can_pick_its_next_run():
+    delays = iter([0.15, 0.15, 0.15])
+    times = []
+
+    def job():
+        times.append(time.monotonic())
+        return next(delays, 10)
+
+    scheduler = Scheduler(workers=1, stagger=False)
+    scheduler.add("adaptive", job, period=0.01)
+    scheduler.start()
+    time.sleep(0.4)
+    scheduler.stop(timeout=1)
+    assert len(times) == 3
+    assert all(b - a >= 0.14 for a, b in zip(times, times[1:]))
@@ -0,0 +1,192 @@
+import threading
+import time
+
+from glcontrol.bench import StubGroundlight, SyntheticFrameGrabber
+from glcontrol.cfgtools.specs import GLControlSpec
+from glcontrol.runner import ImageSourceRT, SpecRunner
+from glcontrol.startup import DetectorCache, run_parallel
+
+
+class CountingStub(StubGroundlight):
+    """Counts the detector lookups, so we can tell when the cache saved one."""
+
+    def __init__(self, lookup_latency: float = 0.0):
+        super().__init__(latency=0)
+        self.lookup_latency = lookup_latency
+        self.lookups = 0
+        self._lookup_lock = threading.Lock()
+
+    def get_or_create_detector(self, name, query, confidence_threshold=None):
+        with self._lookup_lock:
+            self.lookups += 1
+        time.sleep(self.lookup_latency)
+        return super().get_or_create_detector(name, query, confidence_threshold=confidence_threshold)
+
+
+def _spec(n_cameras: int = 2, detector_cache: str | None = None) -> GLControlSpec:
+    return GLControlSpec(
+        cameras=[
+            {"name": f"start-cam-{n}", "input_type": "generic_usb", "id": {"serial_number": str(n)}}
+            for n in range(n_cameras)
+        ],
+        detectors=[{"name": f"start-det-{n}", "query": "Is it?"} for n in range(n_cameras)],
+        processors=[
+            {
+                "name": f"start-proc-{n}",
+                "type": "simple-camera-detector",
+                "inputs": [{"camera": f"start-cam-{n}"}],
+                "options": {"detector": f"start-det-{n}", "poll": {"every": 0.05}},
+            }
+            for n in range(n_cameras)
+        ],
+        runtime={"startup": {"detector_cache": detector_cache}},
+    )
+
+
+def test_run_parallel_keeps_order():
+    outcomes = run_parallel(lambda n: n * 2, [3, 1, 2], max_parallel=2)
+    assert outcomes == [(6, None), (2, None), (4, None)]
+
+
+def test_run_parallel_overlaps_calls():
+    start = time.monotonic()
+    outcomes = run_parallel(lambda _: time.sleep(0.2), range(4), max_parallel=4)
+    assert time.monotonic() - start < 0.6
+    assert all(error is None for _, error in outcomes)
+
+
+def test_run_parallel_times_out_slow_items():
+    release = threading.Event()
+    outcomes = run_parallel(lambda n: release.wait() if n == 0 else n, [0, 1], timeout=0.1)
+    release.set()
+    assert isinstance(outcomes[0][1], TimeoutError)
+    assert outcomes[1] == (1, None)
+
+
+def test_run_parallel_discards_late_results():
+    release = threading.Event()
+    discarded = []
+    outcomes = run_parallel(lambda n: release.wait() and n, [7], timeout=0.05, discard=discarded.append)
+    assert isinstance(outcomes[0][1], TimeoutError)
+    release.set()
+    deadline = time.monotonic() + 1
+    while not discarded:
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+    assert discarded == [7]
+
+
+def test_detector_cache_persists(tmp_path):
+    path = str(tmp_path / "detectors.json")
+    key = DetectorCache.key("dog", "Is there a dog?", 0.9)
+    DetectorCache(path).put(key, "det_abc")
+    assert DetectorCache(path).get(key) == "det_abc"
+    assert DetectorCache(path).get(DetectorCache.key("dog", "Is there a dog?", 0.8)) is None
+
+
+def test_detector_cache_is_shared_between_writers(tmp_path):
+    path = str(tmp_path / "detectors.json")
+    first, second = DetectorCache(path), DetectorCache(path)
+    first.put("a", "det_a")
+    second.put("b", "det_b")
+    reloaded = DetectorCache(path)
+    assert (reloaded.get("a"), reloaded.get("b")) == ("det_a", "det_b")
+    (tmp_path / "file").write_text("")
+    DetectorCache(str(tmp_path / "file" / "detectors.json")).put("a", "det_a")  # logged, not raised
+
+
+class NotFoundError(RuntimeError):
+    status = 404
+
+
+def test_stale_cached_detector_is_looked_up_again(tmp_path):
+    path = str(tmp_path / "detectors.json")
+    key = DetectorCache.key("start-det-0", "Is it?", None)
+    DetectorCache(path).put(key, "det_deleted")
+    sdk = CountingStub()
+    asked = []
+
+    def ask_ml(detector, image):
+        asked.append(detector)
+        if detector == "det_deleted":
+            raise NotFoundError("No such detector")
+        return StubGroundlight.ask_ml(sdk, detector, image)
+
+    sdk.ask_ml = ask_ml
+    runner = SpecRunner(
+        _spec(n_cameras=1, detector_cache=path), sdk=sdk, grabber_factory=lambda c: SyntheticFrameGrabber()
+    )
+    runner.run_all()
+    time.sleep(0.3)
+    runner.stop_all(timeout=1)
+    assert asked.count("det_deleted") == 1
+    assert "det_start-det-0" in asked
+    assert sdk.lookups == 1
+    assert DetectorCache(path).get(key) == "det_start-det-0"
+
+
+def test_warm_start_skips_lookups(tmp_path):
+    path = str(tmp_path / "detectors.json")
+    cold = CountingStub()
+    runner = SpecRunner(_spec(detector_cache=path), sdk=cold, grabber_factory=lambda c: SyntheticFrameGrabber())
+    runner.stop_all(timeout=1)
+    assert cold.lookups == 2
+
+    warm = CountingStub()
+    runner = SpecRunner(_spec(detector_cache=path), sdk=warm, grabber_factory=lambda c: SyntheticFrameGrabber())
+    runner.stop_all(timeout=1)
+    assert warm.lookups == 0
+    assert [d.detector_id for d in runner.detectors] == ["det_start-det-0", "det_start-det-1"]
+
+
+def test_detectors_resolve_in_parallel():
+    sdk = CountingStub(lookup_latency=0.2)
+    start = time.monotonic()
+    runner = SpecRunner(_spec(n_cameras=4), sdk=sdk, grabber_factory=lambda c: SyntheticFrameGrabber())
+    assert time.monotonic() - start < 0.6
+    runner.stop_all(timeout=1)
+
+
+def test_broken_camera_only_stops_its_processor():
+    def grabber_factory(camera):
+        if camera.name == "start-cam-0":
+            raise RuntimeError("no such device")
+        return SyntheticFrameGrabber()
+
+    runner = SpecRunner(_spec(), sdk=StubGroundlight(latency=0), grabber_factory=grabber_factory)
+    assert [loop.spec.name for loop in runner.control_loops] == ["start-proc-1"]
+    runner.run_all()
+    time.sleep(0.2)
+    health = runner.health()
+    runner.stop_all(timeout=1)
+    assert health["start-cam-0"]["state"] == "failed"
+    assert not health["start-proc-0"]["healthy"]
+    assert health["start-proc-1"]["runs"] > 0
+
+
+def test_camera_which_opens_too_late_is_closed():
+    release = threading.Event()
+
+    class LateGrabber(SyntheticFrameGrabber):
+        released = False
+
+        def release(self):
+            LateGrabber.released = True
+
+    def grabber_factory(camera):
+        if camera.name == "start-cam-0":
+            release.wait()
+            return LateGrabber()
+        return SyntheticFrameGrabber()
+
+    spec = _spec()
+    spec.runtime.startup.camera_timeout = 0.1
+    runner = SpecRunner(spec, sdk=StubGroundlight(latency=0), grabber_factory=grabber_factory)
+    release.set()
+    deadline = time.monotonic() + 1
+    while not LateGrabber.released:
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+    assert "start-cam-0" not in ImageSourceRT.registry
+    assert runner.health()["start-cam-0"]["state"] == "failed"
+    runner.stop_all(timeout=1)
@@ -17,8 +17,6 @@ def test_substitute_variables_with_existing_env_var(monkeypatch):
     assert result == "Value is 12345"
 
 
-# TODO: This test should work but isn't
-@pytest.mark.skip(reason="This test should work but isn't")
 def test_substitute_variables_with_non_existing_env_var():
     # Setup: Use a variable name that is not set in the environment
     input_str = "Value is {{NON_EXISTENT_VAR}}"
@@ -53,3 +51,23 @@ def test_substitute_variables_multiple_vars(monkeypatch):
 
     # Verify: Check if the function correctly substitutes all environment variables
     assert result == "alpha and beta"
+
+
+def test_substitute_variables_defaults(monkeypatch):
+    monkeypatch.setenv("SET_VAR", "set")
+    monkeypatch.delenv("UNSET_VAR", raising=False)
+    result = substitute_variables("{{SET_VAR:-x}} {{UNSET_VAR:-fallback}} {{UNSET_VAR:-}}.")
+    assert result == "set fallback ."
+
+
+def test_substitute_variables_reports_all_missing(monkeypatch):
+    monkeypatch.delenv("MISSING_A", raising=False)
+    monkeypatch.delenv("MISSING_B", raising=False)
+    with pytest.raises(ValueError) as exc_info:
+        substitute_variables("{{MISSING_A}} {{MISSING_B}} {{MISSING_A}}")
+    assert "MISSING_A, MISSING_B," in str(exc_info.value)
+
+
+def test_substitute_variables_does_not_rescan_values(monkeypatch):
+    monkeypatch.setenv("OUTER", "{{INNER}}")
+    assert substitute_variables("{{OUTER}}") == "{{INNER}}"
@@ -0,0 +1,125 @@
+import time
+
+import numpy as np
+import pytest
+
+from glcontrol.bench import StubGroundlight
+from glcontrol.cfgtools.specs import GLControlSpec
+from glcontrol.runner import SpecRunner
+from glcontrol.watchdog import CameraError, FrameCheck, GrabberWatchdog
+
+
+class ScriptedGrabber:
+    """Returns `frame` from every grab, after sleeping for `delay` seconds."""
+
+    def __init__(self, frame=None, delay: float = 0.0):
+        self.frame = frame
+        self.delay = delay
+        self.released = False
+
+    def grab(self):
+        time.sleep(self.delay)
+        return self.frame
+
+    def release(self):
+        self.released = True
+
+
+def _live_frame(seed: int = 0) -> np.ndarray:
+    return np.random.default_rng(seed).integers(0, 255, size=(48, 64, 3), dtype=np.uint8)
+
+
+def _wait_for(condition, timeout: float = 2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def test_frame_check():
+    check = FrameCheck(blank_std=2, stale_after=10)
+    assert check.problem(None) == "missing"
+    assert check.problem(np.full((48, 64, 3), 128, dtype=np.uint8)) == "blank"
+    frame = _live_frame()
+    assert check.problem(frame, now=0) is None
+    assert check.problem(frame.copy(), now=5) is None
+    assert check.problem(frame.copy(), now=11) == "stale"
+    assert check.problem(_live_frame(1), now=12) is None
+
+
+def test_reconnects_after_bad_frames():
+    dead, live = ScriptedGrabber(frame=None), ScriptedGrabber(frame=_live_frame())
+    watchdog = GrabberWatchdog("cam", factory=lambda: live, grabber=dead, max_failures=2)
+    for _ in range(2):
+        with pytest.raises(CameraError, match="missing"):
+            watchdog.grab()
+    _wait_for(lambda: watchdog.connected)
+    assert watchdog.grab() is live.frame
+    assert watchdog.reconnects == 1
+    _wait_for(lambda: dead.released)
+    watchdog.release()
+    assert live.released
+
+
+def test_hung_grab_times_out():
+    hung = ScriptedGrabber(frame=_live_frame(), delay=5)
+    watchdog = GrabberWatchdog(
+        "cam", factory=lambda: ScriptedGrabber(frame=_live_frame()), grabber=hung, grab_timeout=0.05
+    )
+    start = time.monotonic()
+    with pytest.raises(CameraError) as exc_info:
+        watchdog.grab()
+    assert exc_info.value.reason == "timeout"
+    assert time.monotonic() - start < 1
+    _wait_for(lambda: watchdog.connected)
+    assert watchdog.grab() is not None
+
+
+def test_reconnect_backs_off():
+    attempts = []
+
+    def factory():
+        attempts.append(time.monotonic())
+        raise OSError("camera unplugged")
+
+    watchdog = GrabberWatchdog("cam", factory=factory, grabber=ScriptedGrabber(), max_failures=1, backoff=0.05)
+    deadline = time.monotonic() + 0.5
+    while time.monotonic() < deadline:
+        with pytest.raises(CameraError):
+            watchdog.grab()
+        time.sleep(0.005)
+    # Attempts at about 0, 0.05, 0.15 and 0.35 seconds, rather than one per grab
+    assert 3 <= len(attempts) <= 5
+    gaps = np.diff(attempts)
+    assert all(later > earlier for earlier, later in zip(gaps, gaps[1:]))
+    watchdog.release()
+
+
+def test_blank_frames_are_not_sent():
+    spec = GLControlSpec(
+        cameras=[
+            {
+                "name": "blank-cam",
+                "input_type": "generic_usb",
+                "id": {"serial_number": "0"},
+                "watchdog": {"blank_std": 1},
+            }
+        ],
+        detectors=[{"name": "blank-det", "query": "Is it?"}],
+        processors=[
+            {
+                "name": "blank-proc",
+                "type": "simple-camera-detector",
+                "inputs": [{"camera": "blank-cam"}],
+                "options": {"detector": "blank-det"},
+            }
+        ],
+    )
+    sdk = StubGroundlight(latency=0)
+    blank = np.zeros((48, 64, 3), dtype=np.uint8)
+    runner = SpecRunner(spec, sdk=sdk, grabber_factory=lambda c: ScriptedGrabber(frame=blank))
+    (loop,) = runner.control_loops
+    with pytest.raises(CameraError, match="blank"):
+        loop.run_once()
+    assert sdk.requests == 0
+    runner.stop_all(timeout=1)